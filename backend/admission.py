@@ -0,0 +1,107 @@
+"""
+Call admission control.
+
+Every new call is checked against the current load of this worker before it
+gets the full pipeline (VAD, ASR, LLM, TTS per turn):
+
+    - full-service calls already active (ADMISSION_MAX_CALLS)
+    - DSP jobs queued or running (ADMISSION_MAX_DSP_QUEUE)
+    - event-loop lag, smoothed (ADMISSION_MAX_LOOP_LAG_MS)
+    - recent turn latency, utterance -> first bot audio (ADMISSION_MAX_TURN_MS)
+
+Over any limit the call is still answered, but in voicemail mode: a cached
+greeting, recording only, and transcription deferred until load drops. Calls
+already admitted keep their latency; nobody gets a busy signal.
+"""
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+ADMISSION_MAX_CALLS = int(os.getenv("ADMISSION_MAX_CALLS", "6"))                    # full-service calls per worker
+ADMISSION_MAX_DSP_QUEUE = int(os.getenv("ADMISSION_MAX_DSP_QUEUE", "8"))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "40"))
+ADMISSION_MAX_TURN_MS = float(os.getenv("ADMISSION_MAX_TURN_MS", "8000"))
+ADMISSION_TURN_WINDOW = 10   # recent turns averaged for the latency check
+ADMISSION_TURN_MAX_AGE_S = 60  # older turns are ignored, so a slow spell can't keep new calls degraded forever
+
+FULL = "full"
+VOICEMAIL = "voicemail"
+CALL_MODES = (FULL, VOICEMAIL)
+
+
+@dataclass
+class AdmissionDecision:
+    mode: str                                   # FULL or VOICEMAIL
+    reason: str                                 # why (the limit that tripped, or "ok")
+    load: dict = field(default_factory=dict)    # the inputs the decision was made on
+
+
+class AdmissionController:
+    """Decides FULL vs VOICEMAIL for new calls from this worker's load."""
+
+    def __init__(self, max_calls: int = ADMISSION_MAX_CALLS, max_dsp_queue: int = ADMISSION_MAX_DSP_QUEUE,
+                 max_loop_lag_ms: float = ADMISSION_MAX_LOOP_LAG_MS, max_turn_ms: float = ADMISSION_MAX_TURN_MS):
+        self.max_calls = max_calls
+        self.max_dsp_queue = max_dsp_queue
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.max_turn_ms = max_turn_ms
+        self._turns = deque(maxlen=ADMISSION_TURN_WINDOW)
+        self.admitted = 0
+        self.degraded = 0
+        self.last_reason = None
+
+    def observe_turn(self, turn_ms: float):
+        """Record a finished turn's latency (utterance -> first bot audio)."""
+        self._turns.append((time.monotonic(), turn_ms))
+
+    def recent_turn_ms(self) -> float:
+        cutoff = time.monotonic() - ADMISSION_TURN_MAX_AGE_S
+        recent = [turn_ms for at, turn_ms in self._turns if at >= cutoff]
+        return sum(recent) / len(recent) if recent else 0.0
+
+    def check(self, full_calls: int, dsp_queue: int, loop_lag_ms: float) -> AdmissionDecision:
+        """Evaluate the limits without counting a decision (e.g. to see if deferred work may run)."""
+        load = {
+            "full_calls": full_calls,
+            "dsp_queue": dsp_queue,
+            "loop_lag_ms": round(loop_lag_ms, 2),
+            "turn_ms": round(self.recent_turn_ms()),
+        }
+        if full_calls >= self.max_calls:
+            reason = f"{full_calls} full-service calls (max {self.max_calls})"
+        elif dsp_queue >= self.max_dsp_queue:
+            reason = f"{dsp_queue} DSP jobs queued (max {self.max_dsp_queue})"
+        elif loop_lag_ms >= self.max_loop_lag_ms:
+            reason = f"event loop lag {loop_lag_ms:.0f}ms (max {self.max_loop_lag_ms:.0f}ms)"
+        elif load["turn_ms"] >= self.max_turn_ms:
+            reason = f"recent turns take {load['turn_ms']}ms (max {self.max_turn_ms:.0f}ms)"
+        else:
+            return AdmissionDecision(FULL, "ok", load)
+        return AdmissionDecision(VOICEMAIL, reason, load)
+
+    def decide(self, full_calls: int, dsp_queue: int, loop_lag_ms: float) -> AdmissionDecision:
+        """Admission decision for a new call."""
+        return self.record(self.check(full_calls, dsp_queue, loop_lag_ms))
+
+    def record(self, decision: AdmissionDecision) -> AdmissionDecision:
+        """Count a decision in the stats (decide() does this; use it for decisions made elsewhere)."""
+        if decision.mode == FULL:
+            self.admitted += 1
+        else:
+            self.degraded += 1
+            self.last_reason = decision.reason
+        return decision
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "degraded": self.degraded,
+            "last_degraded_reason": self.last_reason,
+            "recent_turn_ms": round(self.recent_turn_ms()),
+            "limits": {"calls": self.max_calls, "dsp_queue": self.max_dsp_queue,
+                       "loop_lag_ms": self.max_loop_lag_ms, "turn_ms": self.max_turn_ms},
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,108 @@
+"""
+ASR payload builder.
+
+Caller utterances are collected as PCM16 8 kHz with one VAD decision per 20 ms
+frame. Before upload, leading and trailing non-speech frames are trimmed (with
+a little padding kept so word edges aren't clipped) and the audio is wrapped at
+its native telephony rate instead of being upsampled to 16 kHz first.
+"""
+import audioop
+import base64
+import io
+import os
+import wave
+from dataclasses import dataclass
+
+import numpy as np
+
+from database.wav_bytes import MulawWavWriter, read_recording
+from vad import WebrtcDetector
+
+ASR_SAMPLE_RATE = int(os.getenv("ASR_SAMPLE_RATE", "8000"))   # 8000 = native PSTN audio; 16000 = legacy upsample
+ASR_AUDIO_ENCODING = os.getenv("ASR_AUDIO_ENCODING", "pcm")   # "pcm" (16-bit WAV) or "mulaw" (G.711 WAV)
+ASR_TRIM_PAD_MS = 200       # non-speech audio kept on each side of the speech
+INPUT_SAMPLE_RATE = 8000
+FRAME_MS = 20
+
+
+@dataclass
+class AsrPayload:
+    data_b64: str           # base64 WAV, ready for an input_audio message part
+    format: str             # input_audio format ("wav")
+    audio_ms: int           # duration actually uploaded
+    trimmed_ms: int         # non-speech audio removed before upload
+    payload_bytes: int      # base64 bytes sent
+    legacy_bytes: int       # base64 bytes the untrimmed 16 kHz PCM upload would have been
+
+
+def trim_to_speech(pcm16_8k: bytes, frame_flags: list, pad_ms: int = ASR_TRIM_PAD_MS) -> bytes:
+    """
+    Drop leading/trailing non-speech frames, keeping pad_ms on each side.
+    frame_flags[i] is the VAD decision for the i-th 20 ms frame of pcm16_8k.
+    """
+    frame_bytes = INPUT_SAMPLE_RATE * 2 * FRAME_MS // 1000
+    speech_frames = [i for i, is_speech in enumerate(frame_flags) if is_speech]
+    if not speech_frames:
+        return pcm16_8k
+    pad_frames = pad_ms // FRAME_MS
+    first = max(speech_frames[0] - pad_frames, 0)
+    last = min(speech_frames[-1] + pad_frames + 1, len(frame_flags))
+    return pcm16_8k[first * frame_bytes:last * frame_bytes]
+
+
+def _base64_len(nbytes: int) -> int:
+    return (nbytes + 2) // 3 * 4
+
+
+def build_asr_payload(pcm16_8k: bytes, frame_flags: list, sample_rate: int = None, encoding: str = None) -> AsrPayload:
+    """Trim an utterance to its speech and encode it as a WAV input_audio payload."""
+    sample_rate = sample_rate or ASR_SAMPLE_RATE
+    encoding = encoding or ASR_AUDIO_ENCODING
+
+    trimmed = trim_to_speech(pcm16_8k, frame_flags)
+    audio = trimmed
+    if sample_rate != INPUT_SAMPLE_RATE:
+        audio, _ = audioop.ratecv(trimmed, 2, 1, INPUT_SAMPLE_RATE, sample_rate, None)
+
+    wav_buffer = io.BytesIO()
+    if encoding == "mulaw":
+        writer = MulawWavWriter(wav_buffer, 1, sample_rate)
+        writer.writeframes(audio)
+        writer.close()
+    else:
+        with wave.open(wav_buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(audio)
+    data_b64 = base64.b64encode(wav_buffer.getvalue()).decode("utf-8")
+
+    bytes_per_ms = INPUT_SAMPLE_RATE * 2 // 1000
+    return AsrPayload(
+        data_b64=data_b64,
+        format="wav",
+        audio_ms=len(trimmed) // bytes_per_ms,
+        trimmed_ms=(len(pcm16_8k) - len(trimmed)) // bytes_per_ms,
+        payload_bytes=len(data_b64),
+        legacy_bytes=_base64_len(44 + len(pcm16_8k) * 2),  # 16 kHz PCM16 WAV of the whole buffer
+    )
+
+
+def recording_asr_payload(file_path: str, max_seconds: float) -> AsrPayload:
+    """
+    ASR payload for the caller side of a stored call recording (deferred voicemail
+    transcription): Left channel, first max_seconds, trimmed to speech with webrtcvad.
+    Returns None if the recording holds no audio.
+    """
+    pcm16, nchannels, framerate = read_recording(file_path)
+    if nchannels == 2:
+        pcm16 = audioop.tomono(pcm16, 2, 1, 0)  # Left = caller
+    if framerate != INPUT_SAMPLE_RATE:
+        pcm16, _ = audioop.ratecv(pcm16, 2, 1, framerate, INPUT_SAMPLE_RATE, None)
+    frame_bytes = INPUT_SAMPLE_RATE * 2 * FRAME_MS // 1000
+    nframes = min(len(pcm16) // frame_bytes, int(max_seconds * 1000) // FRAME_MS)
+    if not nframes:
+        return None
+    pcm16 = pcm16[:nframes * frame_bytes]
+    frames = np.frombuffer(pcm16, dtype="<i2").reshape(nframes, frame_bytes // 2)
+    return build_asr_payload(pcm16, WebrtcDetector(sample_rate=INPUT_SAMPLE_RATE).classify(frames))
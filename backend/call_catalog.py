@@ -0,0 +1,441 @@
+"""
+Call catalog: one SQLite row per call, so looking a call up never scans a directory.
+
+    calls  call_sid -> from_number, start/end time, duration, final action,
+           summary, transcript path, recording path
+
+A row is written when the media stream starts (transcript path = the live
+JSONL journal) and updated when the call ends (the final JSON) and when a
+deferred voicemail is transcribed. The summary is stored with the hash of the
+transcript it was made from; it is stale when that no longer matches
+transcript_hash. Lookups by call_sid use the primary key;
+listing by time or caller uses the start_time / from_number indexes. The file
+is shared by all workers (WAL mode). A call whose worker died mid-call is
+marked ended at the next startup (recover_interrupted) from its journal.
+Voicemails queued for deferred transcription keep transcription_pending set
+until the transcription lands, so a restart re-queues them
+(claim_transcriptions).
+
+call_search is an FTS5 index over finished calls (caller and bot text, caller
+name, number, emotions, summary) sharing the calls rowid. A call is indexed
+when its transcript is finalized and its summary column is updated when the
+summary lands. search() returns highlighted snippets, newest call first by
+default: the FTS rowid is the calls rowid (call start order - rows are
+inserted when a call starts, and rebuild renumbers them), so a page costs
+the same however many calls match. Relevance order (bm25) has to score every
+match, so it is opt-in for narrow queries.
+
+The catalog can always be rebuilt from transcripts/ and recordings/ (run on
+startup when it is empty, e.g. the first run after upgrading):
+
+    python call_catalog.py rebuild [--transcripts transcripts] [--recordings recordings]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from storage import find_call_files, parse_call_file
+from transcript_journal import TRANSCRIPTS_DIR, awaiting_transcription, load_transcript, transcript_caller_name, transcript_hash
+
+CALL_CATALOG_PATH = os.getenv("CALL_CATALOG_PATH", "run/calls.sqlite")
+RECORDINGS_DIR = "recordings"
+RECORDING_EXTENSIONS = (".wav", ".flac")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    call_sid TEXT PRIMARY KEY,
+    from_number TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration_seconds REAL,
+    final_action TEXT,
+    summary TEXT,
+    summary_hash TEXT,
+    transcript_hash TEXT,
+    transcript_path TEXT,
+    recording_path TEXT,
+    in_progress INTEGER NOT NULL DEFAULT 0,
+    transcription_pending INTEGER NOT NULL DEFAULT 0,   -- pid that queued the voicemail's transcription, 0 when done
+    compacted_at REAL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_start_time ON calls (start_time);
+CREATE INDEX IF NOT EXISTS calls_from_number ON calls (from_number, start_time);
+CREATE INDEX IF NOT EXISTS calls_final_action ON calls (final_action, start_time);
+CREATE VIRTUAL TABLE IF NOT EXISTS call_search USING fts5 (
+    caller_name, from_number, caller_text, bot_text, emotions, summary,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+SEARCH_SNIPPET_TOKENS = 12
+SEARCH_ORDERS = {"recent": "call_search.rowid DESC", "relevance": "call_search.rank"}
+
+# Index a call's search document; rowid and summary come from its calls row
+INDEX_SQL = ("INSERT INTO call_search (rowid, caller_name, from_number, caller_text, bot_text, emotions, summary) "
+             "SELECT rowid, ?, ?, ?, ?, ?, summary FROM calls WHERE call_sid = ?")
+
+COLUMNS = ("call_sid", "from_number", "start_time", "end_time", "duration_seconds", "final_action",
+           "summary", "summary_hash", "transcript_hash", "transcript_path", "recording_path", "in_progress",
+           "transcription_pending", "compacted_at")
+
+
+def search_document(transcript: dict) -> tuple:
+    """(caller_name, from_number, caller_text, bot_text, emotions) to index for a transcript."""
+    conversation = transcript.get("conversation", [])
+    number = transcript.get("from_number") or ""
+    digits = re.sub(r"\D", "", number)
+    caller = [entry for entry in conversation if entry.get("speaker") == "Caller"]
+    bot = [entry for entry in conversation if entry.get("speaker") != "Caller"]
+    emotions = [entry.get("detected_emotion") for entry in caller] + [entry.get("emotion_used") for entry in bot]
+    return (
+        transcript_caller_name(conversation),
+        f"{number} {digits} {digits[-10:]}",   # national number too, so prefix search works without the country code
+        "\n".join(entry.get("text") or "" for entry in caller),
+        "\n".join(entry.get("text") or "" for entry in bot),
+        " ".join(emotion for emotion in emotions if emotion),
+    )
+
+
+def match_query(text: str) -> str:
+    """FTS5 query for free text: every word must match, as a prefix (no FTS syntax from user input)."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+class CallCatalog:
+    """Handle on the catalog database. Methods block - call them off the event loop."""
+
+    def __init__(self, path: str = CALL_CATALOG_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # rebuildable from disk
+        self._conn.executescript(SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(calls)")}
+        for column, column_type in (("summary_hash", "TEXT"), ("transcript_hash", "TEXT"), ("compacted_at", "REAL"),
+                                    ("transcription_pending", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in existing:  # catalogs created before the column was added
+                self._conn.execute(f"ALTER TABLE calls ADD COLUMN {column} {column_type}")
+
+    def _upsert(self, call_sid: str, **fields):
+        """Insert the row or update only the given fields."""
+        fields["indexed_at"] = time.time()
+        names = list(fields)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO calls (call_sid, {', '.join(names)}) VALUES (?, {', '.join('?' * len(names))}) "
+                f"ON CONFLICT (call_sid) DO UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in names)}",
+                [call_sid, *fields.values()],
+            )
+
+    def call_started(self, call_sid: str, from_number: str, call_start_time: datetime,
+                     transcript_path: str, recording_path: str = None):
+        self._upsert(call_sid, from_number=from_number, start_time=call_start_time.isoformat(),
+                     transcript_path=transcript_path, recording_path=recording_path, in_progress=1)
+
+    def call_ended(self, call_sid: str, transcript: dict, transcript_path: str, transcription_pending: bool = False):
+        """
+        Record the finalized transcript (end time, outcome, hash) and (re)index it for search.
+        transcription_pending marks a voicemail queued for deferred transcription by this process.
+        """
+        self._upsert(call_sid, end_time=transcript["end_time"], duration_seconds=transcript["duration_seconds"],
+                     final_action=transcript["final_action"], transcript_path=transcript_path,
+                     transcript_hash=transcript_hash(transcript["conversation"]), in_progress=0,
+                     transcription_pending=os.getpid() if transcription_pending else 0)
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM call_search WHERE rowid = (SELECT rowid FROM calls WHERE call_sid = ?)", (call_sid,))
+                conn.execute(INDEX_SQL, (*search_document(transcript), call_sid))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def set_summary(self, call_sid: str, summary: str, transcript_hash: str):
+        """Store the summary of the transcript version with this hash."""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("UPDATE calls SET summary = ?, summary_hash = ?, transcript_hash = COALESCE(transcript_hash, ?) "
+                             "WHERE call_sid = ?", (summary, transcript_hash, transcript_hash, call_sid))
+                conn.execute("UPDATE call_search SET summary = ? WHERE rowid = (SELECT rowid FROM calls WHERE call_sid = ?)",
+                             (summary, call_sid))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def search(self, text: str, limit: int = 20, offset: int = 0, order: str = "recent") -> list:
+        """Finished calls matching every word of text (prefixes) in SEARCH_ORDERS order, with a highlighted snippet."""
+        query = match_query(text)
+        if not query:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT calls.call_sid, calls.from_number, calls.start_time, calls.duration_seconds, calls.final_action, "
+                f"call_search.caller_name, snippet(call_search, -1, '[', ']', '…', {SEARCH_SNIPPET_TOKENS}) AS snippet "
+                "FROM call_search JOIN calls ON calls.rowid = call_search.rowid "
+                f"WHERE call_search MATCH ? ORDER BY {SEARCH_ORDERS[order]} LIMIT ? OFFSET ?", (query, limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stale_summaries(self, limit: int = None) -> list:
+        """(call_sid, transcript_path) of ended calls without a summary of their current transcript, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT call_sid, transcript_path FROM calls WHERE in_progress = 0 AND transcript_path IS NOT NULL "
+                "AND (summary IS NULL OR summary_hash IS NULL OR summary_hash IS NOT transcript_hash) "
+                "ORDER BY start_time DESC LIMIT ?", (-1 if limit is None else limit,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def claim_transcriptions(self, live_pids: set) -> list:
+        """
+        Take over the voicemails waiting for transcription whose queuing process
+        is gone (not in live_pids, e.g. after a restart).
+
+        Returns:
+            list: (call_sid, transcript_path, recording_path), oldest first
+        """
+        others = sorted(pid for pid in live_pids if pid != os.getpid())
+        marks = ", ".join("?" * len(others))
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    f"SELECT call_sid, transcript_path, recording_path FROM calls WHERE transcription_pending != 0 "
+                    f"AND transcription_pending NOT IN ({marks}) ORDER BY start_time", others).fetchall()
+                conn.executemany("UPDATE calls SET transcription_pending = ? WHERE call_sid = ?",
+                                 [(os.getpid(), row[0]) for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [tuple(row) for row in rows]
+
+    def transcription_done(self, call_sid: str):
+        """The voicemail needs no (more) transcription attempts, e.g. its recording has no audio."""
+        self._upsert(call_sid, transcription_pending=0)
+
+    def set_recording_path(self, old_path: str, new_path: str):
+        """Follow a recording that was moved or transcoded."""
+        call_sid = parse_call_file(old_path, "call_")[0]
+        with self._lock:
+            self._conn.execute("UPDATE calls SET recording_path = ? WHERE call_sid = ? AND recording_path = ?",
+                               (new_path, call_sid, old_path))
+
+    def get(self, call_sid: str) -> dict:
+        """The call's row as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+        return dict(row) if row else None
+
+    def recent(self, limit: int = 50, before: str = None, from_number: str = None) -> list:
+        """Calls newest first (start_time < before, optionally one caller), via the start_time indexes."""
+        where, params = [], []
+        if before:
+            where.append("start_time < ?")
+            params.append(before)
+        if from_number:
+            where.append("from_number = ?")
+            params.append(from_number)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM calls"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY start_time DESC LIMIT ?", (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def expired(self, spam_before: str, other_before: str, spam_actions: tuple, limit: int) -> list:
+        """Oldest finished calls past their retention: spam (final_action in spam_actions) and everything else have separate cutoffs."""
+        marks = ", ".join("?" * len(spam_actions))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT call_sid, transcript_path, recording_path FROM calls WHERE in_progress = 0 AND "
+                f"((final_action IN ({marks}) AND start_time < ?) OR (COALESCE(final_action, '') NOT IN ({marks}) AND start_time < ?)) "
+                f"ORDER BY start_time LIMIT ?", (*spam_actions, spam_before, *spam_actions, other_before, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, call_sids: list):
+        """Remove calls (and their search entries) from the catalog."""
+        marks = ", ".join("?" * len(call_sids))
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(f"DELETE FROM call_search WHERE rowid IN (SELECT rowid FROM calls WHERE call_sid IN ({marks}))", call_sids)
+                conn.execute(f"DELETE FROM calls WHERE call_sid IN ({marks})", call_sids)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def uncompacted(self, before: str, limit: int) -> list:
+        """Oldest finished calls started before `before` that haven't been compacted yet."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT call_sid, transcript_path, recording_path FROM calls WHERE in_progress = 0 AND compacted_at IS NULL "
+                "AND start_time < ? ORDER BY start_time LIMIT ?", (before, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_compacted(self, call_sid: str, recording_path: str):
+        with self._lock:
+            self._conn.execute("UPDATE calls SET compacted_at = ?, recording_path = ? WHERE call_sid = ?",
+                               (time.time(), recording_path, call_sid))
+
+    def vacuum(self, min_free_ratio: float = 0.1) -> dict:
+        """Merge the search index, checkpoint the WAL, and VACUUM if enough of the file is free pages."""
+        with self._lock:
+            conn = self._conn
+            conn.execute("INSERT INTO call_search (call_search) VALUES ('optimize')")
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            vacuumed = bool(pages) and free / pages >= min_free_ratio
+            if vacuumed:
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"pages": pages, "free_pages": free, "vacuumed": vacuumed}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM calls").fetchone()[0]
+
+    def needs_rebuild(self) -> bool:
+        """True for a new catalog, or one created before the search index (it has calls but nothing indexed)."""
+        with self._lock:
+            calls = self._conn.execute("SELECT COUNT(*) FROM calls WHERE transcript_path IS NOT NULL").fetchone()[0]
+            indexed = self._conn.execute("SELECT COUNT(*) FROM call_search").fetchone()[0]
+        return not calls or not indexed
+
+    def rebuild(self, transcripts_dir: str = TRANSCRIPTS_DIR, recordings_dir: str = RECORDINGS_DIR, log=print,
+                live_calls: set = frozenset()) -> int:
+        """
+        Re-index every call (and the search index) from the files on disk.
+        Summaries already in the catalog are kept (and stay valid if the
+        transcript hash still matches). Rows whose files are gone are removed.
+        A call counts as in progress only if its journal has no end record
+        and it is in live_calls (claimed by a running worker); the rest were
+        cut off by a crash and are indexed as ended.
+
+        Returns:
+            int: calls indexed
+        """
+        started = time.time()
+        calls = {}
+        documents = {}   # call_sid -> search document
+        # Newest file per call; a final .json wins over its .jsonl journal (read after it)
+        for path in sorted(find_call_files(transcripts_dir, "transcript_*.jsonl")) + sorted(find_call_files(transcripts_dir, "transcript_*.json")):
+            try:
+                transcript = load_transcript(path)
+            except Exception as e:
+                log(f"⚠️ Catalog: skipping {path}: {e}")
+                continue
+            call_sid = transcript.get("call_sid") or parse_call_file(path, "transcript_")[0]
+            live = bool(transcript.get("call_in_progress")) and call_sid in live_calls
+            if not live:
+                documents[call_sid] = search_document(transcript)
+            calls[call_sid] = {
+                "from_number": transcript.get("from_number"),
+                "start_time": transcript.get("start_time"),
+                "end_time": None if live else transcript.get("end_time"),
+                "duration_seconds": None if live else transcript.get("duration_seconds"),
+                "final_action": transcript.get("final_action"),
+                "transcript_hash": transcript_hash(transcript.get("conversation", [])),
+                "transcript_path": path,
+                "recording_path": None,
+                "in_progress": int(live),
+                "transcription_pending": -1 if awaiting_transcription(transcript) else 0,   # -1: no process owns it
+            }
+        for path in sorted(path for ext in RECORDING_EXTENSIONS for path in find_call_files(recordings_dir, f"call_*{ext}")):
+            parsed = parse_call_file(path, "call_")
+            if not parsed:
+                continue
+            calls.setdefault(parsed[0], {"in_progress": 0, "transcription_pending": 0})["recording_path"] = path
+
+        names = ["from_number", "start_time", "end_time", "duration_seconds", "final_action",
+                 "transcript_hash", "transcript_path", "recording_path", "in_progress", "transcription_pending"]
+        rows = [[call_sid, *(fields.get(name) for name in names), started] for call_sid, fields in calls.items()]
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    f"INSERT INTO calls (call_sid, {', '.join(names)}, indexed_at) VALUES ({', '.join('?' * (len(names) + 2))}) "
+                    f"ON CONFLICT (call_sid) DO UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in names)}, "
+                    f"indexed_at = excluded.indexed_at",
+                    rows,
+                )
+                # Rows with no files left, except live calls whose journal hasn't been written yet
+                keep = sorted(live_calls)
+                conn.execute(f"DELETE FROM calls WHERE indexed_at < ? AND call_sid NOT IN ({', '.join('?' * len(keep))})",
+                             (started, *keep))
+                # Renumber rowids in start_time order: search's "recent" order is rowid order, and rows
+                # inserted here arrive in path order. New calls then append after them.
+                conn.execute("UPDATE calls SET rowid = -rowid")
+                conn.execute("UPDATE calls SET rowid = ordered.n FROM (SELECT call_sid, "
+                             "ROW_NUMBER() OVER (ORDER BY start_time, call_sid) AS n FROM calls) AS ordered "
+                             "WHERE ordered.call_sid = calls.call_sid")
+                conn.execute("DELETE FROM call_search")
+                conn.executemany(INDEX_SQL, [(*document, call_sid) for call_sid, document in documents.items()])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        log(f"🗂️ Call catalog rebuilt: {len(rows)} call(s) in {time.time() - started:.1f}s")
+        return len(rows)
+
+    def recover_interrupted(self, live_calls: set = frozenset(), log=print) -> list:
+        """
+        End the calls still marked in progress that no running worker owns
+        (their worker died mid-call): index them from their journal so they
+        become searchable, summarizable and subject to retention.
+
+        Returns:
+            list: (call_sid, transcript) of the recovered calls
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT call_sid, transcript_path FROM calls WHERE in_progress = 1").fetchall()
+        recovered = []
+        for call_sid, path in rows:
+            if call_sid in live_calls:
+                continue
+            try:
+                transcript = load_transcript(path)
+            except Exception as e:
+                log(f"⚠️ Catalog: no transcript for interrupted call {call_sid} ({e})")
+                self._upsert(call_sid, in_progress=0)
+                continue
+            self.call_ended(call_sid, transcript, path)
+            recovered.append((call_sid, transcript))
+        if recovered:
+            log(f"🗂️ Call catalog: {len(recovered)} interrupted call(s) marked ended")
+        return recovered
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the call catalog")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default=CALL_CATALOG_PATH)
+    parser.add_argument("--transcripts", default=TRANSCRIPTS_DIR)
+    parser.add_argument("--recordings", default=RECORDINGS_DIR)
+    args = parser.parse_args()
+
+    from workers import WORKER_DB_PATH, WorkerRegistry
+
+    # Calls live on a running server keep their in-progress flag
+    live_calls = WorkerRegistry().live_calls() if os.path.exists(WORKER_DB_PATH) else set()
+    catalog = CallCatalog(args.db)
+    catalog.rebuild(args.transcripts, args.recordings, live_calls=live_calls)
+    catalog.close()
@@ -0,0 +1,259 @@
+"""
+Per-call session state and the process-wide registry of active calls.
+
+CallSession holds what media_stream used to keep in closure variables: call
+metadata, the inbound audio pipeline (jitter buffer, recorder, echo canceller,
+line calibration, endpointer), the conversation and an explicit turn-taking
+state machine:
+
+    listening -> thinking -> speaking -> listening -> ...
+    speaking -> thinking        (barge-in, only with AEC_MODE=on)
+    any state -> ending
+
+The audio path (ingest_media) is synchronous and needs no WebSocket, so
+sessions can be driven directly from tests and benchmarks. Active sessions
+register in `registry`, which backs the /admin/calls endpoint.
+"""
+import time
+from datetime import datetime, timedelta
+
+LISTENING = "listening"      # caller audio goes to the endpointer
+THINKING = "thinking"        # utterance (or greeting) being turned into a reply
+SPEAKING = "speaking"        # bot audio playing; input blocked unless echo cancellation is on
+ENDING = "ending"            # stream stopped, call being finalized
+CALL_STATES = (LISTENING, THINKING, SPEAKING, ENDING)
+
+TRANSITIONS = {
+    LISTENING: (THINKING, ENDING),
+    THINKING: (SPEAKING, LISTENING, ENDING),
+    SPEAKING: (LISTENING, THINKING, ENDING),
+    ENDING: (),
+}
+
+
+class CallSession:
+    """State of one media stream. Components are passed in so tests can swap them."""
+
+    __slots__ = (
+        "call_sid", "stream_sid", "from_number", "call_start_time", "call_status", "websocket", "log",
+        "state", "state_since", "state_ms", "transitions", "speaking_until",
+        "mode", "jitter", "endpointer", "calibrator", "echo_canceller", "recorder", "aec_mode",
+        "conversation_log", "conversation_history", "transcripts",
+        "exchange_count", "final_action", "greeting_sent", "has_seen_media",
+        "messages", "media_frames", "utterances", "last_turn_ms", "max_turn_ms", "_turn_started",
+    )
+
+    def __init__(self, jitter, endpointer, calibrator=None, echo_canceller=None, aec_mode: str = "off", log=print):
+        self.call_sid = None
+        self.stream_sid = None
+        self.from_number = "unknown"
+        self.call_start_time = datetime.now()
+        self.call_status = None        # latest CallStatus from Twilio's status callback
+        self.websocket = None          # set by media_stream; lets a drain close the stream
+        self.log = log
+
+        self.state = LISTENING
+        self.state_since = time.monotonic()
+        self.state_ms = {state: 0.0 for state in CALL_STATES}
+        self.transitions = 0
+        self.speaking_until = None     # datetime when bot playback (+ post-audio delay) ends
+
+        self.mode = "full"             # admission mode: "full" or "voicemail" (see admission.py)
+        self.jitter = jitter
+        self.endpointer = endpointer
+        self.calibrator = calibrator
+        self.echo_canceller = echo_canceller
+        self.recorder = None
+        self.aec_mode = aec_mode
+
+        self.conversation_log = []     # Detailed conversation with caller and bot
+        self.conversation_history = [] # Track full conversation
+        self.transcripts = []
+        self.exchange_count = 0        # caller-bot exchanges (greeting doesn't count)
+        self.final_action = None
+        self.greeting_sent = False
+        self.has_seen_media = False
+
+        self.messages = 0
+        self.media_frames = 0
+        self.utterances = 0
+        self.last_turn_ms = None       # thinking time of the latest turn (utterance -> first bot audio)
+        self.max_turn_ms = 0.0
+        self._turn_started = None
+
+    def start(self, call_sid: str, stream_sid: str, from_number: str, recorder=None, call_start_time: datetime = None):
+        """Attach the call metadata and recorder from Twilio's start event."""
+        self.call_sid = call_sid
+        self.stream_sid = stream_sid
+        self.from_number = from_number
+        self.call_start_time = call_start_time or datetime.now()
+        self.recorder = recorder
+
+    def set_mode(self, mode: str):
+        """Apply the admission decision. Voicemail calls only record, so echo cancellation and calibration are dropped."""
+        self.mode = mode
+        if mode == "voicemail":
+            self.echo_canceller = None
+            self.calibrator = None
+
+    # --- state machine ---
+
+    def transition(self, new_state: str) -> bool:
+        """Move to new_state if the state machine allows it. Returns False (and logs) otherwise."""
+        if new_state == self.state:
+            return True
+        if new_state not in TRANSITIONS[self.state]:
+            if self.state != ENDING:
+                self.log(f"⚠️ Ignoring call state change {self.state} -> {new_state}")
+            return False
+        now = time.monotonic()
+        self.state_ms[self.state] += (now - self.state_since) * 1000
+        if new_state == THINKING:
+            self._turn_started = now
+        elif new_state == SPEAKING and self._turn_started is not None:
+            self.last_turn_ms = (now - self._turn_started) * 1000
+            self.max_turn_ms = max(self.max_turn_ms, self.last_turn_ms)
+            self._turn_started = None
+        self.state = new_state
+        self.state_since = now
+        self.transitions += 1
+        return True
+
+    def speak_for(self, seconds: float) -> datetime:
+        """Bot audio was sent: stay in speaking until it has played (plus the post-audio delay)."""
+        self.transition(SPEAKING)
+        self.speaking_until = datetime.now() + timedelta(seconds=seconds)
+        return self.speaking_until
+
+    def accepting_input(self) -> bool:
+        """Whether caller audio should reach the endpointer now. Ends the speaking state once playback is over."""
+        if self.state == SPEAKING and (self.speaking_until is None or datetime.now() >= self.speaking_until):
+            self.log(f"✅ Blocking period over - resuming VAD at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
+            self.speaking_until = None
+            self.transition(LISTENING)
+        if self.state == LISTENING:
+            return True
+        # With echo cancellation on, the caller can barge in while the bot is talking
+        return self.state == SPEAKING and self.aec_mode == "on"
+
+    # --- audio path ---
+
+    def on_bot_audio(self, bot_pcm: bytes):
+        """Record outgoing bot audio and hand it to the echo canceller as the far-end reference."""
+        self.transition(SPEAKING)
+        if not self.recorder:
+            return
+        start = self.recorder.add_bot(bot_pcm)
+        if self.echo_canceller and start is not None:
+            self.echo_canceller.add_far(bot_pcm, start)
+
+    def ingest_media(self, media: dict, caller_pcm: bytes) -> bytes:
+        """
+        Run one inbound frame (PCM16, decoded from media['payload']) through the
+        jitter buffer, recorder, echo canceller and line calibration. Returns the
+        PCM16 the endpointer should see (empty while the jitter buffer holds audio).
+        """
+        self.media_frames += 1
+        released = self.jitter.push(media.get('chunk'), caller_pcm, media.get('timestamp'))
+        vad_pcm = bytearray()
+        for frame_pcm, timestamp in released:
+            # Caller audio (Left channel) is placed by Twilio's media timestamp (ms since stream start);
+            # bot audio (Right channel) is placed by its send time via on_bot_audio
+            if self.recorder:
+                self.recorder.add_caller(frame_pcm, timestamp)
+
+            # Echo cancellation runs on every frame (also while input is blocked) so the filter keeps adapting
+            if self.echo_canceller and self.recorder and timestamp is not None:
+                clean_pcm = self.echo_canceller.process(frame_pcm, self.recorder.mixer.ms_to_samples(timestamp))
+                if self.aec_mode == "on":
+                    frame_pcm = clean_pcm
+            vad_pcm.extend(frame_pcm)
+
+        # Calibrate on what VAD will see, including audio that arrives while the greeting blocks input
+        if vad_pcm and self.calibrator and self.calibrator.result is None:
+            calibration = self.calibrator.add(bytes(vad_pcm))
+            if calibration:
+                self.endpointer.apply_calibration(calibration)
+                self.log(f"🎚️ Line calibrated: noise floor {calibration.noise_floor_rms} RMS -> VAD mode {calibration.mode}, "
+                         f"energy threshold {calibration.energy_threshold} (false speech by mode {calibration.false_speech})")
+        return bytes(vad_pcm)
+
+    def finish_recording(self):
+        """Flush held frames into the recording and finalize the file. Blocking - call it off the event loop."""
+        if not self.recorder:
+            return
+        for frame_pcm, timestamp in self.jitter.flush():
+            self.recorder.add_caller(frame_pcm, timestamp)
+        self.recorder.close()
+
+    # --- reporting ---
+
+    def snapshot(self) -> dict:
+        """Current state, queue depths and timings (admin endpoint)."""
+        now = time.monotonic()
+        state_ms = dict(self.state_ms)
+        state_ms[self.state] += (now - self.state_since) * 1000
+        return {
+            "call_sid": self.call_sid,
+            "stream_sid": self.stream_sid,
+            "from": self.from_number,
+            "call_status": self.call_status,
+            "mode": self.mode,
+            "state": self.state,
+            "state_age_s": round(now - self.state_since, 2),
+            "duration_s": round((datetime.now() - self.call_start_time).total_seconds(), 1),
+            "state_ms": {state: round(ms) for state, ms in state_ms.items()},
+            "exchanges": self.exchange_count,
+            "messages": self.messages,
+            "media_frames": self.media_frames,
+            "utterances": self.utterances,
+            "last_turn_ms": round(self.last_turn_ms) if self.last_turn_ms is not None else None,
+            "max_turn_ms": round(self.max_turn_ms),
+            "queues": {
+                "jitter_held_frames": self.jitter.pending(),
+                "endpointer_buffered_ms": self.endpointer.buffered_ms(),
+                "recorder_queue_blocks": self.recorder.stats()["queue_depth"] if self.recorder else 0,
+            },
+        }
+
+    def component_stats(self) -> dict:
+        """Per-component counters for the end-of-call log."""
+        return {
+            "vad": self.endpointer.stats(),
+            "jitter": self.jitter.stats(),
+            "calibration": self.calibrator.result if self.calibrator else None,
+            "echo": self.echo_canceller.stats() if self.echo_canceller else None,
+        }
+
+
+class CallRegistry:
+    """Active sessions in this process, keyed by call_sid."""
+
+    def __init__(self):
+        self._sessions = {}
+
+    def register(self, session: CallSession):
+        self._sessions[session.call_sid] = session
+
+    def unregister(self, session: CallSession):
+        if self._sessions.get(session.call_sid) is session:
+            del self._sessions[session.call_sid]
+
+    def get(self, call_sid: str):
+        return self._sessions.get(call_sid)
+
+    def sessions(self) -> list:
+        return list(self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def snapshot(self) -> dict:
+        calls = [session.snapshot() for session in self._sessions.values()]
+        by_state = {state: 0 for state in CALL_STATES}
+        for call in calls:
+            by_state[call["state"]] += 1
+        return {"active_calls": len(calls), "by_state": by_state, "calls": calls}
+
+
+registry = CallRegistry()
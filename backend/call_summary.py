@@ -0,0 +1,83 @@
+"""
+Call summaries.
+
+CallSummarizer asks the text model for a 1-2 sentence summary of a call
+transcript and stores it in the call catalog with the hash of the transcript
+it was made from, so an unchanged transcript is never summarized twice. The
+server uses it in the background when a call ends; summarize_calls.py uses it
+to backfill past calls without loading the server.
+"""
+import asyncio
+import re
+
+from call_catalog import CallCatalog
+from transcript_journal import transcript_hash
+
+BOSONAI_BASE_URL = "https://hackathon.boson.ai/v1"
+SUMMARY_MODEL = "Qwen3-32B-non-thinking-Hackathon"
+SUMMARY_TEMPERATURE = 0.3        # low for consistent summaries
+SUMMARY_TIMEOUT_SECONDS = 30.0
+NO_CONVERSATION_SUMMARY = "No conversation data available"
+
+
+class CallSummarizer:
+    """
+    Summaries with an OpenAI-compatible client (blocking; calls run on a
+    thread). prompts holds "call_summary" (system) and
+    "call_summary_user_template" (with {conversation_text}), as in prompts.json.
+    """
+
+    def __init__(self, client, prompts: dict, log=print, timeout: float = SUMMARY_TIMEOUT_SECONDS):
+        self.client = client
+        self.prompts = prompts
+        self.log = log
+        self.timeout = timeout
+
+    async def generate(self, conversation: list) -> str:
+        """
+        Summary of a transcript's conversation entries.
+
+        Returns:
+            str: the summary, or None if it couldn't be generated (no client, API error, timeout)
+        """
+        if not conversation:
+            return NO_CONVERSATION_SUMMARY
+        if not self.client:
+            return None  # no LLM configured - leave the summary pending rather than storing a placeholder
+
+        conversation_text = "".join(f"{entry.get('speaker', 'Unknown')}: {entry.get('text', '[No text]')}\n"
+                                    for entry in conversation)
+        messages = [
+            {"role": "system", "content": self.prompts["call_summary"]},
+            {"role": "user", "content": self.prompts["call_summary_user_template"].format(conversation_text=conversation_text)},
+        ]
+        try:
+            response = await asyncio.wait_for(
+                asyncio.to_thread(self.client.chat.completions.create, model=SUMMARY_MODEL, messages=messages,
+                                  temperature=SUMMARY_TEMPERATURE),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            self.log(f"⏱️ Summary request timed out after {self.timeout}s")
+            return None
+        except Exception as e:
+            self.log(f"Error generating summary: {e}")
+            return None
+
+        if not response or not response.choices[0].message.content:
+            self.log("Unable to generate summary")
+            return None
+        # Remove any thinking tags
+        return re.sub(r'<think>.*?</think>\s*', '', response.choices[0].message.content.strip(), flags=re.DOTALL).strip()
+
+    async def summarize(self, catalog: CallCatalog, call_sid: str, conversation: list) -> str:
+        """Summarize this version of the call's transcript and store it in the catalog (no LLM call if it's already current)."""
+        digest = transcript_hash(conversation)
+        call = await asyncio.to_thread(catalog.get, call_sid)
+        if call and call['summary'] and call['summary_hash'] == digest:
+            return call['summary']
+        summary = await self.generate(conversation)
+        if summary:
+            await asyncio.to_thread(catalog.set_summary, call_sid, summary, digest)
+            self.log(f"🧾 Summary stored for {call_sid}")
+        return summary
@@ -1,4 +1,9 @@
+import os
+import queue
 import sqlitecloud
+import threading
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import List
@@ -22,6 +27,11 @@ class Voicemail:
     recording: str | None
 
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))     # wait for a free connection
+DB_POOL_PING_SECONDS = float(os.getenv("DB_POOL_PING_SECONDS", "30"))           # check connections idle longer than this
+
+
 def get_conn(sqlite_url) -> sqlitecloud.Connection:
     """
     Opens a connection to the voicemails.sqlite database.
@@ -29,12 +39,169 @@ def get_conn(sqlite_url) -> sqlitecloud.Connection:
     return sqlitecloud.connect(sqlite_url)
 
 
+class ConnectionPool:
+    """
+    Up to size open connections to one database, reused across requests so
+    they skip the connect/auth handshake. Connections are opened on demand,
+    checked with SELECT 1 when they have been idle for ping_seconds, and
+    dropped (a new one is opened next time) when a statement on them fails.
+    """
+
+    def __init__(self, sqlite_url, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT_SECONDS,
+                 ping_seconds: float = DB_POOL_PING_SECONDS):
+        self.sqlite_url = sqlite_url
+        self.size = size
+        self.timeout = timeout
+        self.ping_seconds = ping_seconds
+        self._idle = queue.LifoQueue()      # (connection, returned at); most recently used first
+        self._lock = threading.Lock()
+        self._open = 0
+        self._closed = False
+        self.acquired = 0
+        self.waited = 0                     # acquisitions that found no idle connection
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.reconnects = 0                 # idle connections that failed their check and were replaced
+        self.dropped = 0                    # connections closed because a statement on them failed
+
+    def _connect(self):
+        conn = get_conn(self.sqlite_url)
+        self.connects += 1
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _release_slot(self):
+        with self._lock:
+            self._open -= 1
+
+    def _acquire(self):
+        started = time.monotonic()
+        try:
+            conn, idle_since = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                reserved = self._open < self.size
+                if reserved:
+                    self._open += 1
+            if reserved:
+                try:
+                    conn, idle_since = self._connect(), time.monotonic()
+                except BaseException:
+                    self._release_slot()
+                    raise
+            else:
+                self.waited += 1
+                try:
+                    conn, idle_since = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    self.timeouts += 1
+                    raise TimeoutError(f"No database connection free after {self.timeout}s (pool size {self.size})")
+        wait_ms = (time.monotonic() - started) * 1000
+        self.acquired += 1
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+        if time.monotonic() - idle_since > self.ping_seconds:
+            try:
+                conn.execute("SELECT 1;").fetchone()
+            except Exception:
+                # Dropped by the server or the network while idle - reconnect in the same slot
+                self._close(conn)
+                try:
+                    conn = self._connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+                self.reconnects += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """A pooled connection for the with block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            # The connection may be broken or mid-transaction - don't hand it out again
+            self._close(conn)
+            self._release_slot()
+            self.dropped += 1
+            raise
+        if self._closed:
+            self._close(conn)
+            self._release_slot()
+        else:
+            self._idle.put((conn, time.monotonic()))
+
+    def close(self):
+        """Close the idle connections; ones in use are closed when returned."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+            self._release_slot()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "open": self._open,
+            "idle": self._idle.qsize(),
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "wait_ms_avg": round(self.wait_ms_total / self.acquired, 2) if self.acquired else 0.0,
+            "wait_ms_max": round(self.wait_ms_max, 2),
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "dropped": self.dropped,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(sqlite_url) -> ConnectionPool:
+    """
+    The process-wide pool for sqlite_url, created on first use.
+    """
+    with _pools_lock:
+        pool = _pools.get(sqlite_url)
+        if pool is None or pool._closed:
+            pool = _pools[sqlite_url] = ConnectionPool(sqlite_url)
+        return pool
+
+
+def connection(sqlite_url):
+    """
+    A pooled connection to sqlite_url for a with block.
+    """
+    return get_pool(sqlite_url).connection()
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
 def init_db(sqlite_url) -> None:
     """
     Creates the voicemails table if it does not exist.
     """
-    conn = get_conn(sqlite_url)
-    try:
+    with connection(sqlite_url) as conn:
         conn.execute(
             """
         CREATE TABLE IF NOT EXISTS voicemails (
@@ -50,18 +217,13 @@ def init_db(sqlite_url) -> None:
         """
         )
         conn.commit()
-    finally:
-        conn.close()
 
 
 def add_row(sqlite_url, voicemail: Voicemail) -> None:
     """
     Adds a sample row to the voicemails table.
     """
-    conn = get_conn(sqlite_url)
-    
     # Build the full path to the recording file
-    import os
     # Get the backend directory (parent of database directory)
     backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     recording_path = os.path.join(backend_dir, "recordings", voicemail.recording)
@@ -83,51 +245,49 @@ def add_row(sqlite_url, voicemail: Voicemail) -> None:
         print(f"[DB] ERROR reading recording file: {e}")
         raise
     
-    try:
-        id = conn.execute("SELECT COUNT(*) FROM voicemails;").fetchone()[0] + 1
-        print(f"[DB] Inserting voicemail with ID {id}")
-        
-        conn.execute(
-            """
-        INSERT INTO voicemails (id, number, name, description, spam, date, unread, recording)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?);
-        """,
-            (
-                id,
-                voicemail.number,
-                voicemail.name,
-                voicemail.description,
-                voicemail.spam == True and 1 or 0,
-                datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                1,
-                recording,
-            ),
-        )
-        conn.commit()
-        print(f"[DB] ✅ Successfully saved voicemail ID {id} to database")
-    except Exception as e:
-        print(f"[DB] ❌ ERROR saving to database: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
-    finally:
-        conn.close()
+    with connection(sqlite_url) as conn:
+        try:
+            # MAX, not COUNT: retention deletes old rows, so the row count is below the highest id
+            id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM voicemails;").fetchone()[0] + 1
+            print(f"[DB] Inserting voicemail with ID {id}")
         
+            conn.execute(
+                """
+            INSERT INTO voicemails (id, number, name, description, spam, date, unread, recording)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+                (
+                    id,
+                    voicemail.number,
+                    voicemail.name,
+                    voicemail.description,
+                    voicemail.spam == True and 1 or 0,
+                    datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    1,
+                    recording,
+                ),
+            )
+            conn.commit()
+            print(f"[DB] ✅ Successfully saved voicemail ID {id} to database")
+        except Exception as e:
+            print(f"[DB] ❌ ERROR saving to database: {e}")
+            import traceback
+            traceback.print_exc()
+            raise
+
+
 def edit_row_unread(sqlite_url, voicemail: Voicemail) -> None:
     """
     Sets unread = 0 for the row whose id matches voicemail.id.
     Returns True if a row was updated, False if no matching id.
     """
-    conn = get_conn(sqlite_url)
-    try:
+    with connection(sqlite_url) as conn:
         cur = conn.execute(
             "UPDATE voicemails SET unread = 0 WHERE id = ?;",
             (voicemail.id,),
         )
         conn.commit()
         return cur.rowcount > 0  # True if an update happened
-    finally:
-        conn.close()
 
 
 def add_object_row(sqlite_url, voicemail: List[Voicemail]):
@@ -140,33 +300,29 @@ def read_table(sqlite_url) -> List[Voicemail]:
     """
     Reads and returns all rows from the voicemails table.
     """
-    conn = get_conn(sqlite_url)
     voicemails: List[Voicemail] = []
-    try:
+    with connection(sqlite_url) as conn:
         cursor = conn.execute("SELECT * FROM voicemails;")
         rows = cursor.fetchall()
-        for row in rows:
-            vm = Voicemail(
-                id=row[0],
-                number=row[1],
-                name=row[2],
-                description=row[3],
-                spam=bool(row[4]),
-                date=datetime.fromisoformat(row[5].replace("Z", "+00:00")),
-                unread=bool(row[6]),
-                recording= f'{row[0]}.wav',
-            )
+    for row in rows:
+        vm = Voicemail(
+            id=row[0],
+            number=row[1],
+            name=row[2],
+            description=row[3],
+            spam=bool(row[4]),
+            date=datetime.fromisoformat(row[5].replace("Z", "+00:00")),
+            unread=bool(row[6]),
+            recording= f'{row[0]}.wav',
+        )
 
-            voicemails.append(vm)
+        voicemails.append(vm)
 
-    finally:
-        conn.close()
     return voicemails
 
 
 def get_recording(sqlite_url, voicemail_id: int) -> bytes | None:
-    conn = get_conn(sqlite_url)
-    try:
+    with connection(sqlite_url) as conn:
         cursor = conn.execute(
             "SELECT recording FROM voicemails WHERE id = ?;", (voicemail_id,)
         )
@@ -175,29 +331,50 @@ def get_recording(sqlite_url, voicemail_id: int) -> bytes | None:
             
             return row[0]
             #bytes_to_wav(row[0], f'../output_recordings/{voicemail_id}.wav', 1, 2, 8000) 
-    finally:
-        conn.close()
 
 
 def delete_rows(sqlite_url) -> None:
     """
     Deletes all rows from the voicemails table.
     """
-    conn = get_conn(sqlite_url)
-    try:
+    with connection(sqlite_url) as conn:
         conn.execute("DELETE FROM voicemails;")
         conn.commit()
-    finally:
-        conn.close()
 
 
 def delete_table(sqlite_url) -> None:
     """
     Deletes all rows from the voicemails table.
     """
-    conn = get_conn(sqlite_url)
-    try:
+    with connection(sqlite_url) as conn:
         conn.execute("DROP TABLE IF EXISTS voicemails;")
         conn.commit()
-    finally:
-        conn.close()
+
+
+def delete_expired_rows(sqlite_url, spam_before: str, other_before: str, batch: int = 100) -> int:
+    """
+    Deletes at most batch voicemails older than their retention cutoff
+    (spam rows before spam_before, the rest before other_before; dates as
+    stored, "YYYY-MM-DDTHH:MM:SSZ"). Returns the number of rows deleted.
+    """
+    with connection(sqlite_url) as conn:
+        cur = conn.execute(
+            """
+        DELETE FROM voicemails WHERE id IN (
+            SELECT id FROM voicemails
+            WHERE (spam = 1 AND date < ?) OR (spam = 0 AND date < ?)
+            ORDER BY date LIMIT ?
+        );
+        """,
+            (spam_before, other_before, batch),
+        )
+        conn.commit()
+        return cur.rowcount
+
+
+def vacuum_db(sqlite_url) -> None:
+    """
+    Reclaims the space left by deleted rows (recordings are stored inline).
+    """
+    with connection(sqlite_url) as conn:
+        conn.execute("VACUUM;")
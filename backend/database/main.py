@@ -6,10 +6,15 @@ from pydantic import BaseModel
 from datetime import datetime
 from typing import List, Optional
 from dataclasses import asdict
-from db_actions import Voicemail, read_table, get_recording, edit_row_unread
 from dotenv import load_dotenv
 import os
 
+load_dotenv()  # once, before db_actions reads its DB_POOL_* settings
+SQLITE_URL = os.getenv("SQLITECLOUD_URL")
+
+from db_actions import Voicemail, read_table, get_recording, edit_row_unread, get_pool, close_pools
+from wav_bytes import recording_to_pcm_wav
+
 # class Voicemail(BaseModel):
 #     id: int
 #     number: str
@@ -40,11 +45,26 @@ app.add_middleware(
 memory_db = {"voicemails": []}
 
 
+@app.on_event("startup")
+def open_db_pool():
+    """Create the connection pool once; requests then reuse its open connections."""
+    get_pool(SQLITE_URL)
+
+
+@app.on_event("shutdown")
+def close_db_pool():
+    close_pools()
+
+
+@app.get("/metrics")
+def metrics():
+    """Connection pool use: open/idle connections, waits for a free one, reconnects"""
+    return {"db_pool": get_pool(SQLITE_URL).stats()}
+
+
 @app.get("/voicemails", response_model=VoicemailList)
 def get_voicemails():
-    load_dotenv()
-    sqlite_url = os.getenv("SQLITECLOUD_URL")
-    voicemails = read_table(sqlite_url)
+    voicemails = read_table(SQLITE_URL)
     existing_ids = {vm.id for vm in memory_db["voicemails"]}
 
     for vm in voicemails:
@@ -55,16 +75,15 @@ def get_voicemails():
 
 @app.put("/voicemails")
 def put_recording(voicemail: Voicemail):
-    load_dotenv()
-    sqlite_url = os.getenv("SQLITECLOUD_URL")
     for i, vm in enumerate(memory_db["voicemails"]):
         if vm.id == voicemail.id:
             # update the object in memory
-            edit_row_unread(sqlite_url, voicemail)
+            edit_row_unread(SQLITE_URL, voicemail)
             memory_db["voicemails"][i].unread = voicemail.unread
             
-            blob = get_recording(sqlite_url, voicemail.id)
-            return Response(content=blob, media_type="audio/wav")
+            # Recordings may be stored compressed (μ-law WAV / FLAC) - serve plain PCM WAV
+            blob = get_recording(SQLITE_URL, voicemail.id)
+            return Response(content=recording_to_pcm_wav(blob) if blob else blob, media_type="audio/wav")
 
 if __name__ == "__main__":
     get_voicemails()
@@ -1,6 +1,17 @@
 
+import audioop
+import io
+import os
+import struct
 import wave
 
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None   # FLAC recordings are optional
+
 def wav_to_bytes(file_path):
     """
     Reads a WAV file and returns its content as a bytes object.
@@ -37,4 +48,271 @@ def bytes_to_wav(audio_bytes, filename, nchannels, sampwidth, framerate):
         wav_file.setnchannels(nchannels)
         wav_file.setsampwidth(sampwidth)
         wav_file.setframerate(framerate)
-        wav_file.writeframes(audio_bytes)
\ No newline at end of file
+        wav_file.writeframes(audio_bytes)
+
+# === Compressed recording formats ===
+# Call audio arrives as G.711 μ-law, so storing μ-law WAV halves the size of a
+# 16-bit PCM WAV with no quality loss. FLAC is a lossless alternative that
+# needs the optional `soundfile` package.
+RECORDING_FORMATS = ("pcm", "mulaw", "flac")
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+
+def recording_extension(fmt):
+    """File extension used for a recording format."""
+    return ".flac" if fmt == "flac" else ".wav"
+
+
+def flac_available():
+    return soundfile is not None
+
+
+class PcmWavWriter:
+    """16-bit PCM WAV writer taking PCM16 frames."""
+
+    def __init__(self, filename, nchannels, framerate):
+        self._wav = wave.open(filename, 'wb')
+        self._wav.setnchannels(nchannels)
+        self._wav.setsampwidth(2)
+        self._wav.setframerate(framerate)
+
+    def writeframes(self, pcm16):
+        self._wav.writeframes(pcm16)
+
+    def close(self):
+        self._wav.close()
+
+
+class MulawWavWriter:
+    """
+    G.711 μ-law WAV writer (WAVE_FORMAT_MULAW, 8 bits/sample) taking PCM16 frames.
+    Chunk sizes are patched on close, like the wave module does for PCM.
+    """
+
+    def __init__(self, filename, nchannels, framerate):
+        # Like wave.open, accept a path or an already-open binary file (left open on close)
+        self._owns_file = isinstance(filename, str)
+        self._file = open(filename, 'wb') if self._owns_file else filename
+        self._nchannels = nchannels
+        self._framerate = framerate
+        self._data_bytes = 0
+        self._write_header()
+
+    def _write_header(self):
+        nframes = self._data_bytes // self._nchannels
+        self._file.write(b'RIFF')
+        self._file.write(struct.pack('<I', 4 + 26 + 12 + 8 + self._data_bytes + (self._data_bytes & 1)))
+        self._file.write(b'WAVE')
+        # fmt chunk (18 bytes: non-PCM formats carry cbSize)
+        self._file.write(b'fmt ' + struct.pack('<IHHIIHHH', 18, WAVE_FORMAT_MULAW, self._nchannels,
+                                               self._framerate, self._framerate * self._nchannels,
+                                               self._nchannels, 8, 0))
+        # fact chunk (required for non-PCM formats)
+        self._file.write(b'fact' + struct.pack('<II', 4, nframes))
+        self._file.write(b'data' + struct.pack('<I', self._data_bytes))
+
+    def writeframes(self, pcm16):
+        mulaw = audioop.lin2ulaw(pcm16, 2)
+        self._file.write(mulaw)
+        self._data_bytes += len(mulaw)
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._data_bytes & 1:
+            self._file.write(b'\x00')  # RIFF chunks are word-aligned
+        self._file.seek(0)
+        self._write_header()
+        if self._owns_file:
+            self._file.close()
+        self._file = None
+
+
+class FlacWriter:
+    """Lossless FLAC writer taking PCM16 frames (requires soundfile)."""
+
+    def __init__(self, filename, nchannels, framerate):
+        if soundfile is None:
+            raise RuntimeError("FLAC recordings require the 'soundfile' package")
+        self._nchannels = nchannels
+        self._file = soundfile.SoundFile(filename, 'w', samplerate=framerate, channels=nchannels,
+                                         subtype='PCM_16', format='FLAC')
+
+    def writeframes(self, pcm16):
+        samples = np.frombuffer(pcm16, dtype='<i2').reshape(-1, self._nchannels)
+        self._file.write(samples)
+
+    def close(self):
+        self._file.close()
+
+
+def open_recording_writer(filename, fmt, nchannels, framerate):
+    """Open a recording writer for fmt ("pcm", "mulaw" or "flac"). All writers take PCM16 frames."""
+    writers = {"pcm": PcmWavWriter, "mulaw": MulawWavWriter, "flac": FlacWriter}
+    if fmt not in writers:
+        raise ValueError(f"Unknown recording format: {fmt} (expected one of {RECORDING_FORMATS})")
+    return writers[fmt](filename, nchannels, framerate)
+
+
+def _parse_wav(audio_bytes):
+    """Parse a RIFF/WAVE blob. Returns (format_tag, nchannels, framerate, bits_per_sample, data)."""
+    if audio_bytes[:4] != b'RIFF' or audio_bytes[8:12] != b'WAVE':
+        raise ValueError("Not a WAV file")
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(audio_bytes):
+        chunk_id = audio_bytes[pos:pos + 4]
+        chunk_size = struct.unpack('<I', audio_bytes[pos + 4:pos + 8])[0]
+        body = audio_bytes[pos + 8:pos + 8 + chunk_size]
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack('<HHIIHH', body[:16])
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            format_tag, nchannels, framerate, _, _, bits = fmt
+            return format_tag, nchannels, framerate, bits, body
+        pos += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+
+def decode_recording(audio_bytes):
+    """
+    Decode a stored recording (PCM WAV, μ-law WAV or FLAC) to PCM16.
+
+    Returns:
+        tuple: (pcm16 bytes, nchannels, framerate)
+    """
+    if audio_bytes[:4] == b'fLaC':
+        if soundfile is None:
+            raise RuntimeError("Decoding FLAC recordings requires the 'soundfile' package")
+        samples, framerate = soundfile.read(io.BytesIO(audio_bytes), dtype='int16', always_2d=True)
+        return samples.astype('<i2').tobytes(), samples.shape[1], framerate
+    format_tag, nchannels, framerate, bits, data = _parse_wav(audio_bytes)
+    if format_tag == WAVE_FORMAT_MULAW:
+        return audioop.ulaw2lin(data, 2), nchannels, framerate
+    if format_tag == WAVE_FORMAT_PCM and bits == 16:
+        return data, nchannels, framerate
+    raise ValueError(f"Unsupported WAV encoding (format tag {format_tag}, {bits} bits)")
+
+
+def read_recording(file_path):
+    """Read a recording file in any stored format. Returns (pcm16 bytes, nchannels, framerate)."""
+    with open(file_path, "rb") as f:
+        return decode_recording(f.read())
+
+
+def recording_to_pcm_wav(audio_bytes):
+    """Convert a stored recording blob to a plain 16-bit PCM WAV blob (for players and ASR)."""
+    if audio_bytes[:4] == b'RIFF':
+        format_tag, _, _, bits, _ = _parse_wav(audio_bytes)
+        if format_tag == WAVE_FORMAT_PCM and bits == 16:
+            return audio_bytes
+    pcm16, nchannels, framerate = decode_recording(audio_bytes)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(nchannels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(framerate)
+        wav_file.writeframes(pcm16)
+    return buffer.getvalue()
+
+
+def salvage_recording(partial_path, final_path):
+    """
+    Turn a recording its writer never closed (the process died mid-call) into a
+    playable file at final_path. WAV chunk sizes are patched to the audio actually
+    on disk; FLAC is re-encoded from whatever decodes.
+
+    Returns:
+        bool: False if there was no audio to recover
+    """
+    with open(partial_path, "rb") as f:
+        head = f.read(4096)
+    if not head:
+        return False
+    if head[:4] == b'fLaC':
+        with open(partial_path, "rb") as f:
+            pcm16, nchannels, framerate = decode_recording(f.read())
+        if not pcm16:
+            return False
+        tmp_path = final_path + ".tmp"
+        writer = open_recording_writer(tmp_path, "flac", nchannels, framerate)
+        try:
+            writer.writeframes(pcm16)
+        finally:
+            writer.close()
+    else:
+        if head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+            raise ValueError("Not a WAV file")
+        # Walk the header chunks to the data chunk; its size field (and RIFF's) were never patched
+        block_align, fact_pos, pos = None, None, 12
+        while pos + 8 <= len(head):
+            chunk_id = head[pos:pos + 4]
+            chunk_size = struct.unpack('<I', head[pos + 4:pos + 8])[0]
+            if chunk_id == b'data':
+                break
+            if chunk_id == b'fmt ':
+                block_align = struct.unpack('<H', head[pos + 20:pos + 22])[0]
+            elif chunk_id == b'fact':
+                fact_pos = pos + 8
+            pos += 8 + chunk_size + (chunk_size & 1)
+        else:
+            raise ValueError("WAV file has no data chunk")
+        if not block_align:
+            raise ValueError("WAV data chunk before fmt chunk")
+        data_start = pos + 8
+        data_bytes = (os.path.getsize(partial_path) - data_start) // block_align * block_align
+        if data_bytes <= 0:
+            return False
+        tmp_path = partial_path
+        with open(partial_path, "r+b") as f:
+            f.truncate(data_start + data_bytes)
+            f.seek(0, 2)
+            if data_bytes & 1:
+                f.write(b'\x00')  # RIFF chunks are word-aligned
+            f.seek(4)
+            f.write(struct.pack('<I', data_start - 8 + data_bytes + (data_bytes & 1)))
+            f.seek(pos + 4)
+            f.write(struct.pack('<I', data_bytes))
+            if fact_pos is not None:
+                f.seek(fact_pos)
+                f.write(struct.pack('<I', data_bytes // block_align))
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, final_path)
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    return True
+
+
+def transcode_recording(file_path, fmt, remove_source=True):
+    """
+    Re-encode a recording file to fmt. Writes to a temp file and renames it into place.
+
+    Returns:
+        str | None: Path of the transcoded file, or None if it was already in fmt.
+    """
+    with open(file_path, "rb") as f:
+        audio_bytes = f.read()
+    if audio_bytes[:4] == b'fLaC':
+        current = "flac"
+    else:
+        current = "mulaw" if _parse_wav(audio_bytes)[0] == WAVE_FORMAT_MULAW else "pcm"
+    if current == fmt:
+        return None
+
+    pcm16, nchannels, framerate = decode_recording(audio_bytes)
+    target_path = os.path.splitext(file_path)[0] + recording_extension(fmt)
+    tmp_path = target_path + ".tmp"
+    writer = open_recording_writer(tmp_path, fmt, nchannels, framerate)
+    try:
+        writer.writeframes(pcm16)
+    finally:
+        writer.close()
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target_path)
+    if remove_source and target_path != file_path:
+        os.remove(file_path)
+    return target_path
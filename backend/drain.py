@@ -0,0 +1,128 @@
+"""
+Graceful drain for restarts.
+
+A drain stops new calls from being admitted (/twiml answers 503 so Twilio
+uses the number's fallback URL, and the health check reports "draining"),
+lets active calls run to completion for up to DRAIN_TIMEOUT_SECONDS, and then
+closes whatever is left at the end of its current turn, never mid-reply.
+Each media_stream's own finally block flushes the recording and writes the
+final transcript; the drain waits for that before reporting done.
+
+Start a drain with SIGTERM/SIGINT (DrainingServer, a second Ctrl+C forces
+exit) or POST /admin/drain; GET /admin/drain reports progress. Under
+DrainingServer the process exits once the drain is done.
+"""
+import asyncio
+import os
+import signal
+import time
+
+import uvicorn
+
+from call_session import ENDING, LISTENING, registry
+
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "300"))   # calls get this long to end on their own
+DRAIN_TURN_GRACE_SECONDS = 30    # then each call gets this long to finish its current turn
+DRAIN_LOG_EVERY_SECONDS = 5
+
+
+class DrainController:
+    """Drain state and the coroutine that walks active calls to zero."""
+
+    def __init__(self, log=print):
+        self.log = log
+        self.draining = False
+        self.finished = False
+        self.reason = None
+        self.started_at = None
+        self.deadline = None
+        self.calls_at_start = 0
+        self.calls_closed = 0        # closed by the drain after the timeout
+        self._task = None
+
+    def begin(self, reason: str, timeout: float = DRAIN_TIMEOUT_SECONDS) -> bool:
+        """Start draining (no-op if already draining). Returns True if this call started it."""
+        if self.draining:
+            return False
+        self.draining = True
+        self.reason = reason
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout
+        self.calls_at_start = len(registry)
+        self.log(f"🚰 Draining ({reason}): {self.calls_at_start} active call(s), timeout {timeout:.0f}s - not admitting new calls")
+        self.ensure_task()
+        return True
+
+    def ensure_task(self):
+        """Start the drain coroutine if a loop is running (signal handlers may fire outside it)."""
+        if self.draining and self._task is None:
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                pass
+
+    async def _run(self):
+        last_log = time.monotonic()
+        while len(registry) and time.monotonic() < self.deadline:
+            await asyncio.sleep(0.25)
+            if time.monotonic() - last_log >= DRAIN_LOG_EVERY_SECONDS:
+                last_log = time.monotonic()
+                self.log(f"🚰 Drain: {len(registry)} call(s) still active, {self.deadline - last_log:.0f}s left")
+
+        if len(registry):
+            self.log(f"🚰 Drain timeout - closing {len(registry)} call(s) at the end of their current turn")
+            await asyncio.gather(*(self._close_after_turn(session) for session in registry.sessions()))
+            # Let each media_stream finally block flush its recording and transcript
+            grace_end = time.monotonic() + DRAIN_TURN_GRACE_SECONDS
+            while len(registry) and time.monotonic() < grace_end:
+                await asyncio.sleep(0.1)
+
+        self.finished = True
+        self.log(f"🚰 Drain finished: {self.stats()}")
+
+    async def _close_after_turn(self, session):
+        grace_end = time.monotonic() + DRAIN_TURN_GRACE_SECONDS
+        while session.state != LISTENING and session.state != ENDING and time.monotonic() < grace_end:
+            await asyncio.sleep(0.1)
+        if session.state == ENDING:
+            return
+        session.transition(ENDING)
+        self.calls_closed += 1
+        if session.websocket is not None:
+            try:
+                await session.websocket.close(code=1001)  # going away
+            except Exception as e:
+                self.log(f"⚠️ Drain: closing {session.call_sid} failed: {e}")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "draining": self.draining,
+            "finished": self.finished,
+            "reason": self.reason,
+            "elapsed_s": round(now - self.started_at, 1) if self.started_at else 0.0,
+            "remaining_s": round(max(self.deadline - now, 0.0), 1) if self.deadline else None,
+            "calls_at_start": self.calls_at_start,
+            "active_calls": len(registry),
+            "calls_closed": self.calls_closed,
+        }
+
+
+drain = DrainController()
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server whose first SIGTERM/SIGINT drains calls before shutting down."""
+
+    def handle_exit(self, sig: int, frame) -> None:
+        if drain.draining:
+            if sig == signal.SIGINT:
+                super().handle_exit(sig, frame)   # second Ctrl+C: uvicorn's normal (then forced) exit
+            return
+        drain.begin(f"signal {signal.Signals(sig).name}")
+
+    async def on_tick(self, counter: int) -> bool:
+        drain.ensure_task()
+        if drain.finished:
+            self.should_exit = True
+        return await super().on_tick(counter)
@@ -0,0 +1,120 @@
+"""
+Bulk audio conversions off the event loop.
+
+audioop holds the GIL for the whole call (resampling a 12 s TTS reply takes
+~5 ms of solid GIL time), so moving it to a thread doesn't help the loop. The
+kernels here are NumPy (FIR resampling, table-lookup μ-law) which release the
+GIL while they crunch, and DspPool runs them on a small thread pool while
+timing each job:
+
+    pcm16_8k, suffixes = await dsp_pool.run("tts_to_twilio", encode_for_twilio, pcm16_24k)
+
+Per-job run times and queue waits are kept as histograms (see metrics.py).
+"""
+import asyncio
+import audioop
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+from metrics import Histogram
+from prompt_cache import encode_chunks
+
+DSP_WORKERS = int(os.getenv("DSP_WORKERS", "2"))
+RESAMPLE_TAPS_PER_PHASE = 24     # FIR length per up/down factor (longer = sharper anti-aliasing)
+TTS_SAMPLE_RATE = 24000
+TWILIO_SAMPLE_RATE = 8000
+
+# μ-law byte for every int16 value, taken from audioop so table lookups match it exactly
+_ULAW_TABLE = np.frombuffer(audioop.lin2ulaw(np.arange(-32768, 32768, dtype="<i2").tobytes(), 2), dtype=np.uint8)
+
+
+@lru_cache(maxsize=8)
+def _lowpass(up: int, down: int) -> np.ndarray:
+    """Windowed-sinc anti-aliasing/interpolation filter for resampling by up/down."""
+    factor = max(up, down)
+    ntaps = RESAMPLE_TAPS_PER_PHASE * factor + 1
+    cutoff = 0.9 / factor                                  # fraction of the upsampled Nyquist
+    n = np.arange(ntaps) - (ntaps - 1) / 2
+    taps = cutoff * np.sinc(cutoff * n) * np.hamming(ntaps)
+    return (taps * up / taps.sum()).astype(np.float32)
+
+
+def resample_pcm16(pcm16: bytes, from_rate: int, to_rate: int) -> bytes:
+    """Resample mono PCM16. Integer ratios (24k->8k, 8k->16k) use a NumPy FIR; others fall back to audioop."""
+    if from_rate == to_rate or not pcm16:
+        return pcm16
+    g = gcd(from_rate, to_rate)
+    up, down = to_rate // g, from_rate // g
+    if up != 1 and down != 1:
+        return audioop.ratecv(pcm16, 2, 1, from_rate, to_rate, None)[0]
+    x = np.frombuffer(pcm16, dtype="<i2").astype(np.float32)
+    if up > 1:
+        stuffed = np.zeros(len(x) * up, dtype=np.float32)
+        stuffed[::up] = x
+        x = stuffed
+    y = np.convolve(x, _lowpass(up, down), mode="same")[::down]
+    return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
+
+
+def ulaw_encode(pcm16: bytes) -> bytes:
+    """PCM16 -> μ-law, identical to audioop.lin2ulaw."""
+    return _ULAW_TABLE[np.frombuffer(pcm16, dtype="<i2").astype(np.int32) + 32768].tobytes()
+
+
+def encode_for_twilio(pcm16_24k: bytes) -> tuple[bytes, list]:
+    """TTS PCM16 24 kHz -> (PCM16 8 kHz for recording/echo reference, media message suffixes for Twilio)."""
+    pcm16_8k = resample_pcm16(pcm16_24k, TTS_SAMPLE_RATE, TWILIO_SAMPLE_RATE)
+    return pcm16_8k, encode_chunks(pcm16_8k, ulaw=ulaw_encode(pcm16_8k))
+
+
+class DspPool:
+    """Thread pool for CPU-bound audio jobs, with per-job latency histograms."""
+
+    def __init__(self, workers: int = DSP_WORKERS):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dsp")
+        self.run_ms = {}             # job name -> Histogram of run time
+        self.wait_ms = Histogram()   # time queued before a thread picked the job up
+        self.in_flight = 0
+        self.failed = 0
+
+    async def run(self, job: str, fn, *args):
+        """Run fn(*args) on the pool and return its result."""
+        times = [0.0, 0.0]
+
+        def timed():
+            times[0] = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                times[1] = time.perf_counter()
+
+        submitted = time.perf_counter()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            if times[1]:
+                self.wait_ms.observe((times[0] - submitted) * 1000)
+                self.run_ms.setdefault(job, Histogram()).observe((times[1] - times[0]) * 1000)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "failed": self.failed,
+            "wait": self.wait_ms.stats(),
+            "jobs": {job: histogram.stats() for job, histogram in self.run_ms.items()},
+        }
+
+
+dsp_pool = DspPool()
@@ -0,0 +1,168 @@
+"""
+Acoustic echo cancellation for the caller line.
+
+The bot's own voice comes back on the caller channel (handset speaker ->
+microphone, line hybrids). We know exactly what the bot sent and when, so an
+NLMS adaptive filter driven by that far-end signal can estimate the echo and
+subtract it from each caller frame before VAD.
+
+All positions are samples on the media stream timeline shared with the
+recorder (see recorder.TimelineMixer): caller frames by Twilio media
+timestamp, bot audio by the sample where its playback starts.
+"""
+import math
+
+import numpy as np
+
+SAMPLE_RATE = 8000
+AEC_FILTER_MS = 64           # echo tail covered by the adaptive filter
+AEC_MAX_DELAY_MS = 800       # bulk delay search range (network + handset round trip)
+AEC_STEP = 0.5               # NLMS step size (0 < mu < 2)
+AEC_BLOCK = 16               # samples per NLMS update (10 vectorized updates per 20 ms frame)
+AEC_DOUBLE_TALK = 0.6        # Geigel threshold: freeze adaptation when near > this * far peak
+AEC_NLP_GAIN = 0.1           # residual echo attenuation while only the bot is talking
+AEC_DELAY_WINDOW_MS = 2000   # audio used for each bulk delay estimate
+FAR_ACTIVE_RMS = 100.0       # far-end level that counts as "bot is talking"
+
+
+class EchoCanceller:
+    """Block NLMS echo canceller with bulk delay estimation and ERLE metrics."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, filter_ms: int = AEC_FILTER_MS,
+                 max_delay_ms: int = AEC_MAX_DELAY_MS, step: float = AEC_STEP):
+        self.sample_rate = sample_rate
+        self.taps = sample_rate * filter_ms // 1000
+        self.max_delay = sample_rate * max_delay_ms // 1000
+        self.step = step
+        self.weights = np.zeros(self.taps, dtype=np.float64)   # oldest tap first
+        self.delay = None            # bulk delay in samples, estimated from the first far-end audio
+
+        # Far-end (bot) audio on the stream timeline; _far[0] is timeline sample _far_base
+        self._far = np.zeros(0, dtype=np.float64)
+        self._far_base = 0
+
+        # Caller frames (start_sample, samples) kept for bulk delay estimation
+        self._near_hist = []
+
+        # ERLE accounting over frames where the bot was talking and the caller wasn't
+        self.echo_frames = 0
+        self.double_talk_frames = 0
+        self._near_energy = 0.0
+        self._residual_energy = 0.0
+
+    def add_far(self, pcm16: bytes, start_sample: int):
+        """Register bot audio that starts playing at start_sample on the stream timeline."""
+        samples = np.frombuffer(pcm16, dtype="<i2").astype(np.float64)
+        end = start_sample + len(samples)
+        needed = end - self._far_base
+        if needed > len(self._far):
+            self._far = np.concatenate([self._far, np.zeros(needed - len(self._far))])
+        offset = start_sample - self._far_base
+        if offset < 0:
+            samples = samples[-offset:]
+            offset = 0
+        self._far[offset:offset + len(samples)] = samples
+
+    def _far_window(self, start: int, count: int) -> np.ndarray:
+        """Far-end samples for timeline positions [start, start + count), zeros where unknown."""
+        out = np.zeros(count, dtype=np.float64)
+        lo = max(start, self._far_base)
+        hi = min(start + count, self._far_base + len(self._far))
+        if hi > lo:
+            out[lo - start:hi - start] = self._far[lo - self._far_base:hi - self._far_base]
+        return out
+
+    def _trim_far(self, position: int):
+        """Forget far-end audio that can no longer reach the filter."""
+        keep_from = position - self.max_delay - self.taps - self.sample_rate * AEC_DELAY_WINDOW_MS // 1000
+        drop = keep_from - self._far_base
+        if drop > 0:
+            self._far = self._far[drop:]
+            self._far_base = keep_from
+
+    def _estimate_delay(self):
+        """Bulk delay = lag of the cross-correlation peak between far-end and caller audio."""
+        span_start = self._near_hist[0][0]
+        span_end = self._near_hist[-1][0] + len(self._near_hist[-1][1])
+        near = np.zeros(self.max_delay + span_end - span_start)
+        for start, samples in self._near_hist:
+            offset = self.max_delay + start - span_start
+            near[offset:offset + len(samples)] = samples
+        # Far-end on the same origin: index k of both arrays is timeline sample span_start - max_delay + k
+        far = self._far_window(span_start - self.max_delay, len(near))
+        self._near_hist = []
+
+        n = len(near)
+        size = 1 << (2 * n - 1).bit_length()
+        spectrum = np.fft.rfft(near, size) * np.conj(np.fft.rfft(far, size))
+        corr = np.fft.irfft(spectrum, size)[:self.max_delay]
+        norm = math.sqrt(float(np.dot(near, near)) * float(np.dot(far, far))) or 1.0
+        lag = int(np.argmax(np.abs(corr)))
+        if abs(corr[lag]) / norm > 0.1:
+            # Start the filter a little before the peak so the whole echo tail fits
+            self.delay = max(lag - self.taps // 4, 0)
+
+    def process(self, near_pcm16: bytes, start_sample: int) -> bytes:
+        """Remove the bot echo from one caller frame placed at start_sample. Returns PCM16."""
+        near = np.frombuffer(near_pcm16, dtype="<i2").astype(np.float64)
+        count = len(near)
+        self._trim_far(start_sample)
+
+        # Reference covering every tap for every sample of this frame
+        if self.delay is None:
+            # Collect caller audio while the bot is talking until there's enough to find the echo delay
+            far_recent = self._far_window(start_sample - self.max_delay, self.max_delay + count)
+            if not np.any(far_recent):
+                return near_pcm16
+            self._near_hist.append((start_sample, near))
+            collected = sum(len(samples) for _, samples in self._near_hist)
+            if collected >= self.sample_rate * AEC_DELAY_WINDOW_MS // 1000:
+                self._estimate_delay()
+            if self.delay is None:
+                return near_pcm16
+
+        ref_start = start_sample - self.delay - self.taps + 1
+        ref = self._far_window(ref_start, count + self.taps - 1)
+        far_peak = float(np.max(np.abs(ref))) if len(ref) else 0.0
+        if far_peak < FAR_ACTIVE_RMS:
+            return near_pcm16  # Bot silent in the echo window - nothing to cancel
+
+        # X[i] = reference taps for near sample i (oldest first, matching self.weights)
+        X = np.lib.stride_tricks.sliding_window_view(ref, self.taps)
+        double_talk = float(np.max(np.abs(near))) > AEC_DOUBLE_TALK * far_peak
+        if double_talk:
+            # Caller is talking over the bot - filter but don't adapt
+            residual = near - X @ self.weights
+            self.double_talk_frames += 1
+        else:
+            # Block NLMS: one vectorized update per AEC_BLOCK samples, normalized by tap-vector power
+            residual = np.empty(count)
+            energy = np.concatenate(([0.0], np.cumsum(ref * ref)))  # running energy for tap-vector power
+            for lo in range(0, count, AEC_BLOCK):
+                hi = min(lo + AEC_BLOCK, count)
+                Xb = X[lo:hi]
+                err = near[lo:hi] - Xb @ self.weights
+                residual[lo:hi] = err
+                tap_power = (energy[hi + self.taps - 1] - energy[lo]) * self.taps / (hi - lo + self.taps - 1) + 1e-6
+                self.weights += (self.step / ((hi - lo) * tap_power)) * (Xb.T @ err)
+            self.echo_frames += 1
+            self._near_energy += float(np.dot(near, near))
+            self._residual_energy += float(np.dot(residual, residual))
+            # Residual echo suppression while only the bot is talking
+            residual = residual * AEC_NLP_GAIN
+
+        return np.clip(residual, -32768, 32767).astype("<i2").tobytes()
+
+    def erle_db(self) -> float:
+        """Echo return loss enhancement over single-talk frames (higher is better)."""
+        if not self._residual_energy:
+            return 0.0
+        return 10 * math.log10(self._near_energy / self._residual_energy)
+
+    def stats(self) -> dict:
+        return {
+            "delay_ms": round(self.delay * 1000 / self.sample_rate, 1) if self.delay is not None else None,
+            "echo_frames": self.echo_frames,
+            "double_talk_frames": self.double_talk_frames,
+            "erle_db": round(self.erle_db(), 1),
+        }
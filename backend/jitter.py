@@ -0,0 +1,135 @@
+"""
+Inbound jitter buffer for Twilio media frames.
+
+Twilio numbers inbound media with media.chunk (1, 2, 3, ... per media
+message; the top-level sequenceNumber also counts non-media events, so it has
+gaps by design). Frames are released strictly in chunk order. In-order frames
+pass straight through; when a chunk is missing, later frames are held for up
+to `depth` frames waiting for it, after which the gap is declared lost and
+concealed with silence or a repeat of the previous frame. Frames arriving
+after their slot was released are counted late and dropped.
+"""
+import audioop
+import os
+
+JITTER_DEPTH = int(os.getenv("JITTER_DEPTH", "3"))            # frames held waiting for a missing chunk (20 ms each)
+JITTER_CONCEAL = os.getenv("JITTER_CONCEAL", "repeat")        # "silence" or "repeat" (previous frame, fading)
+CONCEAL_MODES = ("silence", "repeat")
+FRAME_MS = 20
+FRAME_BYTES = 320            # 20 ms of PCM16 at 8 kHz
+REPEAT_FADE = 0.5            # gain applied to each successive repeated frame
+
+
+class JitterBuffer:
+    """Reorders PCM16 frames by chunk number and conceals lost ones."""
+
+    def __init__(self, depth: int = JITTER_DEPTH, conceal: str = JITTER_CONCEAL):
+        self.depth = max(depth, 0)
+        self.conceal = conceal if conceal in CONCEAL_MODES else "repeat"
+        self._next = None            # next chunk number to release
+        self._held = {}              # chunk -> (pcm16, timestamp_ms)
+        self._concealed = set()      # chunks declared lost (so a late arrival isn't mistaken for a duplicate)
+        self._last_pcm = bytes(FRAME_BYTES)
+        self._last_ts = None
+        self._repeat_gain = 1.0
+
+        self.received = 0
+        self.released = 0
+        self.reordered = 0           # arrived out of order but in time
+        self.late = 0                # arrived after their slot was concealed
+        self.duplicates = 0
+        self.lost = 0                # concealed gaps
+        self.max_held = 0
+
+    def _emit(self, pcm16: bytes, timestamp_ms, out: list):
+        if timestamp_ms is None and self._last_ts is not None:
+            timestamp_ms = self._last_ts + FRAME_MS
+        self._last_ts = timestamp_ms
+        self.released += 1
+        out.append((pcm16, timestamp_ms))
+
+    def _conceal_one(self, out: list):
+        if self.conceal == "repeat":
+            self._repeat_gain *= REPEAT_FADE
+            pcm16 = audioop.mul(self._last_pcm, 2, self._repeat_gain)
+        else:
+            pcm16 = bytes(len(self._last_pcm))
+        self.lost += 1
+        self._emit(pcm16, None, out)
+
+    def _release(self, out: list):
+        while True:
+            if self._next in self._held:
+                pcm16, timestamp_ms = self._held.pop(self._next)
+                self._last_pcm = pcm16
+                self._repeat_gain = 1.0
+                self._emit(pcm16, timestamp_ms, out)
+                self._next += 1
+            elif len(self._held) > self.depth:
+                # Waited long enough - the missing chunk is lost
+                self._conceal_one(out)
+                self._concealed.add(self._next)
+                self._next += 1
+            else:
+                return
+
+    def push(self, chunk, pcm16: bytes, timestamp_ms=None) -> list:
+        """
+        Add one frame. Returns the frames that can now be played, in order, as
+        [(pcm16, timestamp_ms)]. Concealed frames get the timestamp following
+        the previous frame. Frames without a chunk number pass straight through.
+        """
+        out = []
+        self.received += 1
+        timestamp_ms = float(timestamp_ms) if timestamp_ms is not None else None
+        if chunk is None:
+            self._emit(pcm16, timestamp_ms, out)
+            return out
+        chunk = int(chunk)
+        if self._next is None:
+            self._next = chunk
+        if chunk < self._next:
+            if chunk in self._concealed:
+                self._concealed.discard(chunk)
+                self.late += 1
+            else:
+                self.duplicates += 1
+            return out
+        if chunk in self._held:
+            self.duplicates += 1
+            return out
+        if chunk == self._next and self._held:
+            self.reordered += 1     # fills a hole that later frames are waiting behind
+        self._held[chunk] = (pcm16, timestamp_ms)
+        self.max_held = max(self.max_held, len(self._held))
+        self._release(out)
+        return out
+
+    def flush(self) -> list:
+        """Release everything still held (end of stream), concealing any remaining gaps."""
+        out = []
+        while self._held:
+            if self._next in self._held:
+                self._release(out)
+            else:
+                self._conceal_one(out)
+                self._concealed.add(self._next)
+                self._next += 1
+        return out
+
+    def pending(self) -> int:
+        """Frames currently held waiting for a gap to fill."""
+        return len(self._held)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "conceal": self.conceal,
+            "received": self.received,
+            "released": self.released,
+            "reordered": self.reordered,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "lost": self.lost,
+            "max_held": self.max_held,
+        }
@@ -3,15 +3,39 @@ from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 import json
 import base64
+import hashlib
 import uvicorn
 from datetime import datetime, timezone
 import os
 import re
+import time
 import audioop
 import wave
-import webrtcvad
 import openai
 from dotenv import load_dotenv
+from recorder import CallRecorder
+from database.wav_bytes import RECORDING_FORMATS, recording_extension, flac_available
+from asr_payload import AsrPayload, build_asr_payload, recording_asr_payload
+from vad import DETECTORS, Endpointer, LineCalibrator, make_detector
+from echo import EchoCanceller
+from jitter import JitterBuffer
+from tts_segments import TTS_PARALLEL, split_sentences, synthesize_segmented
+from voice_clone import (REFERENCE_BUILD_PARAMS, CloneRequestTemplate, close_http_client, optimize_reference_wav,
+                         post_chat_completion)
+from prompt_cache import MESSAGE_PREFIX, CachedPrompt, prompt_cache, prompt_key
+from dsp import dsp_pool, encode_for_twilio
+from metrics import loop_lag, slow_callbacks
+from admission import FULL, VOICEMAIL, AdmissionDecision, admission
+from drain import DRAIN_TIMEOUT_SECONDS, DrainingServer, drain
+from call_session import LISTENING, THINKING, ENDING, CallSession, registry as call_registry
+from workers import EVENT_POLL_SECONDS, WORKER_DB_PATH, WORKERS, WorkerRegistry, load_shared_asset
+from storage import call_file
+from transcript_journal import TRANSCRIPTION_UNAVAILABLE, TRANSCRIPTS_DIR, journal, load_transcript, render_txt, transcript_caller_name, transcript_path
+from call_catalog import SEARCH_ORDERS, CallCatalog
+from call_summary import BOSONAI_BASE_URL, CallSummarizer
+from maintenance import (MAINTENANCE_IDLE_POLL_SECONDS, MAINTENANCE_INTERVAL_HOURS, MAINTENANCE_LOCK_RETRY_SECONDS,
+                         MaintenanceJob, acquire_lock as acquire_maintenance_lock, record_run as record_maintenance_run,
+                         release_lock as release_maintenance_lock, seconds_until_due as maintenance_due_in)
 # from gcal import get_current_event, book_next_available
 
 # Import database functions
@@ -35,15 +59,22 @@ VOICE_CLONE_TRANSCRIPT = (
 
 try:
     if os.path.exists(VOICE_CLONE_WAV_PATH):
-        with open(VOICE_CLONE_WAV_PATH, "rb") as f:
-            VOICE_CLONE_AUDIO_B64 = base64.b64encode(f.read()).decode("utf-8")
-        print(f"Media WS: ✅ Loaded voice clone reference from {VOICE_CLONE_WAV_PATH}")
+        # Mono, trimmed, downsampled and length-capped once here instead of shipping the raw file every turn;
+        # built by the first process and read by the other workers
+        reference_wav = load_shared_asset("voice_ref.wav", VOICE_CLONE_WAV_PATH, lambda wav: optimize_reference_wav(wav)[0],
+                                          REFERENCE_BUILD_PARAMS)
+        VOICE_CLONE_AUDIO_B64 = base64.b64encode(reference_wav).decode("utf-8")
+        print(f"Media WS: ✅ Loaded voice clone reference from {VOICE_CLONE_WAV_PATH} ({len(reference_wav)} bytes optimized)")
     else:
         print(f"Media WS: ⚠️ VOICE_CLONE_WAV_PATH not found at {VOICE_CLONE_WAV_PATH} - falling back to non-cloned TTS")
 except Exception as e:
     print(f"Media WS: ⚠️ Failed to load voice clone reference: {e}")
     VOICE_CLONE_AUDIO_B64 = None
 
+# Voice part of the prompt cache keys: a hash of the reference as sent (it already reflects
+# REFERENCE_BUILD_PARAMS), so replacing the WAV at the same path re-renders the cached prompts
+PROMPT_VOICE = hashlib.sha1(VOICE_CLONE_AUDIO_B64.encode()).hexdigest()[:16] if VOICE_CLONE_AUDIO_B64 else "generic"
+
 # Initialize database
 # SQLITE_URL = os.getenv("SQLITECLOUD_URL")
 # if SQLITE_URL:
@@ -59,7 +90,9 @@ SQLITE_URL = None  # Temporarily disabled
 
 HTTP_SERVER_PORT = 8080
 RECORDINGS_DIR = "recordings"
-TRANSCRIPTS_DIR = "transcripts"
+# Recording storage format: "mulaw" (G.711 WAV, half the size of PCM, lossless for μ-law call audio),
+# "flac" (lossless, needs soundfile) or "pcm" (16-bit WAV)
+RECORDING_FORMAT = os.getenv("RECORDING_FORMAT", "mulaw")
 BOSONAI_PHONE_NUMBER = os.getenv("BOSONAI_PHONE_NUMBER") or os.getenv("PERSONAL_PHONE")  # Set in .env file
 
 # VAD configuration
@@ -68,11 +101,33 @@ FRAME_MS = 20          # must be 10/20/30 ms
 END_SIL_MS = 1000      # silence threshold to end utterance (1.5 seconds - wait for caller to finish)
 MAX_UTT_MS = 20000     # max utterance length
 MIN_SPEECH_MS = 500    # minimum speech duration to count as valid utterance (ignore breath/noise)
+# Frame classifier: "webrtc", "energy" or "combined" (energy pre-gate in front of webrtcvad)
+VAD_DETECTOR = os.getenv("VAD_DETECTOR", "combined" if os.getenv("VAD_ENERGY_GATE", "0") == "1" else "webrtc")
+if VAD_DETECTOR not in DETECTORS:
+    print(f"Unknown VAD_DETECTOR '{VAD_DETECTOR}', falling back to 'webrtc'")
+    VAD_DETECTOR = "webrtc"
+VAD_GATE_VERIFY = os.getenv("VAD_GATE_VERIFY", "0") == "1"  # also run webrtcvad on gated frames and count disagreements
+VAD_CALIBRATE = os.getenv("VAD_CALIBRATE", "1") == "1"  # measure line noise while the greeting plays and retune VAD per call
 MIN_EXCHANGES_BEFORE_ACTION = 0
 
+# Echo cancellation: "off" (default), "measure" (run the canceller on every frame just to log ERLE; VAD
+# still sees raw audio and caller input stays blocked while the bot talks) or "on" (VAD sees
+# echo-cancelled audio, no blocking)
+AEC_MODE = os.getenv("AEC_MODE", "off")
+if AEC_MODE not in ("off", "measure", "on"):
+    print(f"Unknown AEC_MODE '{AEC_MODE}', falling back to 'off'")
+    AEC_MODE = "off"
+
 # Echo/Delay configuration (tune these to adjust timing)
 POST_AUDIO_DELAY_SECONDS = 0.5   # Fixed delay after bot audio finishes playing before accepting user input
 
+if RECORDING_FORMAT not in RECORDING_FORMATS:
+    print(f"Media WS: ⚠️ Unknown RECORDING_FORMAT '{RECORDING_FORMAT}' - using mulaw")
+    RECORDING_FORMAT = "mulaw"
+elif RECORDING_FORMAT == "flac" and not flac_available():
+    print("Media WS: ⚠️ RECORDING_FORMAT=flac needs the soundfile package - using mulaw")
+    RECORDING_FORMAT = "mulaw"
+
 # Create recordings directory if it doesn't exist
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
 os.makedirs(TRANSCRIPTS_DIR, exist_ok=True)
@@ -82,6 +137,9 @@ app = FastAPI()
 def log(msg, *args):
     print(f"Media WS: {msg}", *args)
 
+drain.log = log
+slow_callbacks.log = log
+
 
 # Initialize BosonAI clients - dedicated keys for different purposes
 # API_KEY1: ASR/TTS (audio understanding and generation)
@@ -93,7 +151,7 @@ api_key1 = os.getenv("BOSONAI_API_KEY1")
 if api_key1:
     asr_tts_client = openai.Client(
         api_key=api_key1,
-        base_url="https://hackathon.boson.ai/v1"
+        base_url=BOSONAI_BASE_URL
     )
     log("✅ Loaded BosonAI API_KEY1 (ASR/TTS)")
 else:
@@ -103,7 +161,7 @@ api_key2 = os.getenv("BOSONAI_API_KEY2")
 if api_key2:
     qwen_client = openai.Client(
         api_key=api_key2,
-        base_url="https://hackathon.boson.ai/v1"
+        base_url=BOSONAI_BASE_URL
     )
     log("✅ Loaded BosonAI API_KEY2 (Qwen)")
 else:
@@ -120,6 +178,9 @@ app.add_middleware(
 
 API_REQUEST_TIMEOUT = 30.0  # seconds - timeout for BosonAI requests
 
+# Call summaries with the Qwen client (see call_summary.py)
+summarizer = CallSummarizer(qwen_client, PROMPTS, log, API_REQUEST_TIMEOUT)
+
 # Lock to ensure sequential API calls within same conversation turn
 import asyncio
 api_call_lock = asyncio.Lock()
@@ -312,99 +373,6 @@ def clean_text_for_transcript(text: str) -> str:
     return cleaned
 
 
-def save_transcript(call_sid: str, from_number: str, conversation_log: list, call_start_time: datetime, call_end_time: datetime, final_action: str = None, call_in_progress: bool = False):
-    """Save call transcript to JSON file. Can be called multiple times to update the same file."""
-    try:
-        timestamp = call_start_time.strftime("%Y%m%d_%H%M%S")
-        filename = f"{TRANSCRIPTS_DIR}/transcript_{call_sid}_{timestamp}.json"
-        
-        # Calculate call duration
-        duration_seconds = (call_end_time - call_start_time).total_seconds()
-        
-        # Build transcript data
-        transcript_data = {
-            "call_sid": call_sid,
-            "from_number": from_number,
-            "start_time": call_start_time.isoformat(),
-            "end_time": call_end_time.isoformat(),
-            "duration_seconds": round(duration_seconds, 2),
-            "call_in_progress": call_in_progress,  # True if call is still active
-            "final_action": final_action,  # "FORWARD", "END", or None
-            "conversation": []
-        }
-        
-        # Process conversation log
-        for entry in conversation_log:
-            if entry['speaker'] == 'Caller':
-                caller_text = entry.get('text', None)
-                transcript_data['conversation'].append({
-                    "speaker": "Caller",
-                    "duration_ms": entry.get('duration_ms', 0),
-                    "audio_size_bytes": entry.get('audio_size', 0),
-                    "text": caller_text if caller_text else "[Transcription not available]",
-                    "emojis": entry.get('emojis', []),
-                    "detected_emotion": entry.get('detected_emotion', '')
-                })
-            else:  # Bot
-                transcript_data['conversation'].append({
-                    "speaker": "AI Receptionist",
-                    "text": entry.get('text', ''),
-                    "timestamp": entry.get('timestamp', ''),
-                    "emotion_used": entry.get('emotion_used', '')
-                })
-        
-        # Save to JSON file
-        import json as json_module
-        with open(filename, 'w', encoding='utf-8') as f:
-            json_module.dump(transcript_data, f, indent=2, ensure_ascii=False)
-        
-        log(f"💾 Transcript saved: {filename}")
-        
-        # Also save a human-readable text version
-        txt_filename = f"{TRANSCRIPTS_DIR}/transcript_{call_sid}_{timestamp}.txt"
-        with open(txt_filename, 'w', encoding='utf-8') as f:
-            f.write(f"CALL TRANSCRIPT\n")
-            f.write(f"{'='*60}\n")
-            f.write(f"Call ID: {call_sid}\n")
-            f.write(f"From: {from_number}\n")
-            f.write(f"Start: {call_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"End: {call_end_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Duration: {duration_seconds:.1f} seconds\n")
-            if call_in_progress:
-                f.write(f"Status: CALL IN PROGRESS (transcript updating in real-time)\n")
-            if final_action:
-                action_text = "Forwarded to BosonAI" if final_action == "FORWARD" else "Ended (Spam Detected)"
-                f.write(f"Result: {action_text}\n")
-            f.write(f"{'='*60}\n\n")
-            
-            for i, entry in enumerate(conversation_log, 1):
-                if entry['speaker'] == 'Caller':
-                    caller_text = entry.get('text', None)
-                    duration = entry.get('duration_ms', 0)
-                    emojis = entry.get('emojis', [])
-                    detected_emotion = entry.get('detected_emotion', '')
-                    if caller_text:
-                        emoji_str = f" {' '.join(emojis)}" if emojis else ""
-                        emotion_str = f" [Emotion: {detected_emotion}]" if detected_emotion else ""
-                        f.write(f"[{i}] CALLER{emoji_str}: {caller_text}{emotion_str}\n\n")
-                    else:
-                        f.write(f"[{i}] CALLER: [Spoke for {duration}ms - transcription unavailable]\n\n")
-                else:
-                    text = entry.get('text', '')
-                    emotion_used = entry.get('emotion_used', '')
-                    emotion_str = f" [Responded with: {emotion_used}]" if emotion_used else ""
-                    f.write(f"[{i}] AI RECEPTIONIST{emotion_str}: {text}\n\n")
-        
-        log(f"📄 Human-readable transcript saved: {txt_filename}")
-        
-    except Exception as e:
-        log(f"Error saving transcript: {e}")
-        import traceback
-        traceback.print_exc()
-
-
-
-
 def mulaw8k_to_pcm16_16k(mulaw_bytes: bytes) -> bytes:
     """Decode μ-law 8 kHz → PCM16 8 kHz, then upsample → PCM16 16 kHz."""
     pcm16_8k = audioop.ulaw2lin(mulaw_bytes, 2)                      # 2 bytes/sample
@@ -418,6 +386,47 @@ def pcm16_16k_to_mulaw8k(pcm16_16k: bytes) -> bytes:
     return audioop.lin2ulaw(pcm16_8k, 2)
 
 
+# Voice-clone TTS request: everything but the emotion and text is serialized once at startup
+VOICE_CLONE_TEMPLATE = CloneRequestTemplate(
+    model="higgs-audio-generation-Hackathon",
+    system_head=(
+        "You are an AI assistant designed to convert text into speech.\n"
+        "Use a "
+    ),
+    system_tail=(
+        " tone in your delivery.\n"
+        "If the user's message includes a [SPEAKER*] tag, do not read out the tag and "
+        "generate speech for the following text, using the specified voice.\n"
+        "If no speaker tag is present, select a suitable voice on your own.\n\n"
+        "<|scene_desc_start|>\n"
+        "Audio is recorded from a quiet room.\n"
+        "<|scene_desc_end|>"
+    ),
+    transcript=VOICE_CLONE_TRANSCRIPT,
+    audio_b64=VOICE_CLONE_AUDIO_B64 or "",
+    speaker_tag=VOICE_CLONE_SPEAKER_TAG,
+    params={
+        "temperature": 1,
+        "top_p": 0.95,
+        "stream": False,
+        "stop": ["<|eot_id|>", "<|end_of_text|>", "<|audio_eos|>"],
+        "top_k": 50,
+    },
+) if VOICE_CLONE_AUDIO_B64 else None
+
+TTS_COMPARE = os.getenv("TTS_COMPARE", "0") == "1"  # also time the single-request path for segmented replies (extra TTS call)
+
+
+async def compare_single_request_tts(text: str, emotion: str, parallel_wall_s: float):
+    """Shadow-synthesize a segmented reply in one request and log both wall-clock times (audio is discarded)."""
+    import time
+    start = time.time()
+    response = await generate_speech_with_emotion(text=text, emotion=emotion)
+    single_s = time.time() - start
+    status = "ok" if response else "failed"
+    log(f"📏 TTS wall clock: parallel {parallel_wall_s:.3f}s vs single request {single_s:.3f}s ({status}, {len(text)} chars)")
+
+
 async def generate_speech_with_emotion(text: str, emotion: str = "neutral and professional"):
     """
     Generate speech with specified emotion using Boson voice cloning if available.
@@ -468,51 +477,25 @@ async def generate_speech_with_emotion(text: str, emotion: str = "neutral and pr
                 log("No audio data in response")
                 return None
 
-        # Voice-cloned path using the Boson example structure
-        system = (
-            "You are an AI assistant designed to convert text into speech.\n"
-            f"Use a {emotion} tone in your delivery.\n"
-            "If the user's message includes a [SPEAKER*] tag, do not read out the tag and "
-            "generate speech for the following text, using the specified voice.\n"
-            "If no speaker tag is present, select a suitable voice on your own.\n\n"
-            "<|scene_desc_start|>\n"
-            "Audio is recorded from a quiet room.\n"
-            "<|scene_desc_end|>"
-        )
-
-        messages = [
-            {"role": "system", "content": system},
-            # Reference transcript for the cloned voice
-            {"role": "user", "content": VOICE_CLONE_TRANSCRIPT},
-            # Reference audio as assistant content
-            {
-                "role": "assistant",
-                "content": [{
-                    "type": "input_audio",
-                    "input_audio": {"data": VOICE_CLONE_AUDIO_B64, "format": "wav"},
-                }],
-            },
-            # Actual text we want spoken, in the same speaker's voice
-            {"role": "user", "content": f"{VOICE_CLONE_SPEAKER_TAG} {text}"},
-        ]
-
-        response = await call_bosonai(
-            "chat.completions.create",
-            model="higgs-audio-generation-Hackathon",
-            messages=messages,
-            temperature=1,
-            top_p=0.95,
-            stream=False,
-            stop=["<|eot_id|>", "<|end_of_text|>", "<|audio_eos|>"],
-            extra_body={"top_k": 50},
-        )
+        # Voice-cloned path: pre-serialized request with only emotion and text spliced in
+        try:
+            response = await asyncio.wait_for(
+                post_chat_completion(VOICE_CLONE_TEMPLATE.body(text, emotion), api_key1, BOSONAI_BASE_URL, API_REQUEST_TIMEOUT),
+                timeout=API_REQUEST_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            log(f"⏱️ API_KEY1 (ASR/TTS) timed out after {API_REQUEST_TIMEOUT}s")
+            response = None
+        except Exception as e:
+            log(f"❌ API_KEY1 (ASR/TTS) failed: {e}")
+            response = None
 
         if not response:
             log("No response from BosonAI for voice-cloned TTS")
             return None
 
         # Extract audio data from response (WAV container, like in the example)
-        audio_obj = getattr(response.choices[0].message, "audio", None)
+        audio_obj = response["choices"][0]["message"].get("audio")
         if not audio_obj:
             log("No audio field in Boson response (voice-clone path)")
             return None
@@ -546,70 +529,46 @@ async def get_call_info(call_sid: str) -> dict:
         id: str - Call SID
         number: str - Caller phone number
         name: str - Extracted caller name
-        description: str - AI-generated summary of the call
+        description: str - AI-generated summary of the call (made in the background when the call ends)
         spam: bool - Whether call was marked as spam
         date: datetime - Call start time
         unread: bool - Whether call has been reviewed (always False for now)
         recording: str - Path to WAV recording file
-        transcript: str - Path to transcript JSON file
+        transcript: str - Path to transcript JSON file (the JSONL journal while the call is live)
     """
-    import glob
-    import json as json_module
-    from pathlib import Path
-    
     try:
-        # Find transcript file for this call_sid
-        transcript_pattern = f"{TRANSCRIPTS_DIR}/transcript_{call_sid}_*.json"
-        transcript_files = glob.glob(transcript_pattern)
+        # Catalog lookup (primary key) instead of scanning transcripts/ and recordings/
+        call = await asyncio.to_thread(call_catalog.get, call_sid)
         
-        if not transcript_files:
+        if not call or not call['transcript_path']:
             log(f"No transcript found for call {call_sid}")
             return None
         
-        # Use the most recent transcript if multiple exist
-        transcript_path = sorted(transcript_files)[-1]
-        
         # Load transcript data
-        with open(transcript_path, 'r', encoding='utf-8') as f:
-            transcript_data = json_module.load(f)
+        transcript_path = call['transcript_path']
+        transcript_data = await asyncio.to_thread(load_transcript, transcript_path)
         
         # Extract basic info
-        call_id = transcript_data.get('call_sid', call_sid)
-        from_number = transcript_data.get('from_number', 'Unknown')
-        start_time_str = transcript_data.get('start_time')
-        start_time = datetime.fromisoformat(start_time_str) if start_time_str else datetime.now()
-        final_action = transcript_data.get('final_action')
+        call_id = call['call_sid']
+        from_number = call['from_number'] or 'Unknown'
+        start_time = datetime.fromisoformat(call['start_time']) if call['start_time'] else datetime.now()
+        final_action = call['final_action']
         is_spam = final_action == "END"
         
         # Extract caller name from conversation
-        caller_name = "Unknown Caller"
         conversation = transcript_data.get('conversation', [])
-        for entry in conversation:
-            if entry.get('speaker') == 'Caller' and entry.get('text'):
-                # Try to extract name from first caller message
-                import re
-                text = entry.get('text', '')
-                patterns = [
-                    r"(?:this is|it's|i'm|my name is)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)",
-                    r"([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+(?:calling|here)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, text, re.IGNORECASE)
-                    if match:
-                        name = match.group(1).strip()
-                        if len(name) > 2:
-                            caller_name = name
-                            break
-                if caller_name != "Unknown Caller":
-                    break
+        caller_name = transcript_caller_name(conversation)
         
-        # Find corresponding recording file
-        recording_pattern = f"{RECORDINGS_DIR}/call_{call_sid}_*.wav"
-        recording_files = glob.glob(recording_pattern)
-        recording_path = sorted(recording_files)[-1] if recording_files else None
+        recording_path = call['recording_path']
         
-        # Generate AI summary of the conversation
-        description = await generate_call_summary(conversation)
+        # Summary stored by the background summarizer; never an LLM call per lookup
+        if call['in_progress']:
+            description = "Call in progress"
+        elif call['summary'] and call['summary_hash'] == call['transcript_hash']:
+            description = call['summary']
+        else:
+            description = "Summary pending"
+            schedule_summary(call_sid, conversation)
         
         # Build result dictionary
         result = {
@@ -633,62 +592,11 @@ async def get_call_info(call_sid: str) -> dict:
         return None
 
 
-async def generate_call_summary(conversation: list) -> str:
+async def process_utterance_and_respond(asr_payload: AsrPayload, websocket: WebSocket, stream_sid: str, conversation_history: list, call_sid: str, exchange_count: int = 0, on_bot_audio=None):
     """
-    Generate a concise summary of the call conversation using AI.
-    
-    Args:
-        conversation: List of conversation entries from transcript
-        
-    Returns:
-        A brief summary string describing the call
+    Send trimmed caller audio (see asr_payload.build_asr_payload) to BosonAI and stream response back to Twilio.
+    on_bot_audio(pcm16_8k) is called right before the reply starts streaming (used for recording).
     """
-    if not qwen_client or not conversation:
-        return "No conversation data available"
-    
-    try:
-        # Build a readable conversation text
-        conversation_text = ""
-        for entry in conversation:
-            speaker = entry.get('speaker', 'Unknown')
-            text = entry.get('text', '[No text]')
-            conversation_text += f"{speaker}: {text}\n"
-        
-        # Prompt the AI to summarize
-        summary_prompt = PROMPTS["call_summary_user_template"].format(conversation_text=conversation_text)
-        
-        response = await call_bosonai(
-            "chat.completions.create",
-            model="Qwen3-32B-non-thinking-Hackathon",
-            messages=[
-                {
-                    "role": "system",
-                    "content": PROMPTS["call_summary"]
-                },
-                {
-                    "role": "user",
-                    "content": summary_prompt
-                }
-            ],
-            temperature=0.3,  # Lower temperature for consistent summaries
-        )
-        
-        if response and response.choices[0].message.content:
-            summary = response.choices[0].message.content.strip()
-            # Remove any thinking tags
-            import re
-            summary = re.sub(r'<think>.*?</think>\s*', '', summary, flags=re.DOTALL).strip()
-            return summary
-        else:
-            return "Unable to generate summary"
-            
-    except Exception as e:
-        log(f"Error generating summary: {e}")
-        return "Error generating summary"
-
-
-async def process_utterance_and_respond(pcm16_16k: bytes, websocket: WebSocket, stream_sid: str, conversation_history: list, call_sid: str, exchange_count: int = 0):
-    """Send PCM16 16kHz audio to BosonAI and stream response back to Twilio."""
     if not asr_tts_client or not qwen_client:
         log("[BosonAI not configured - set BOSONAI_API_KEY1 and BOSONAI_API_KEY2 env vars]")
         return None, None, None, None, 0.0
@@ -702,21 +610,7 @@ async def process_utterance_and_respond(pcm16_16k: bytes, websocket: WebSocket,
     total_start = time.time()
     
     try:
-        # Save audio chunk to temporary WAV file (following example1.py pattern)
-        import io
-        
-        # Create WAV file in memory
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wav:
-            wav.setnchannels(1)
-            wav.setsampwidth(2)
-            wav.setframerate(16000)
-            wav.writeframes(pcm16_16k)
-        
-        wav_data = wav_buffer.getvalue()
-        audio_base64 = base64.b64encode(wav_data).decode("utf-8")
-        
-        log("Step 1: Transcribing caller audio...")
+        log(f"Step 1: Transcribing caller audio ({asr_payload.audio_ms}ms, {asr_payload.trimmed_ms}ms silence trimmed)...")
         
         # STEP 1: Transcribe the audio first
         transcription_messages = [
@@ -730,8 +624,8 @@ async def process_utterance_and_respond(pcm16_16k: bytes, websocket: WebSocket,
                     {
                         "type": "input_audio",
                         "input_audio": {
-                            "data": audio_base64,
-                            "format": "wav",
+                            "data": asr_payload.data_b64,
+                            "format": asr_payload.format,
                         },
                     },
                 ],
@@ -747,7 +641,8 @@ async def process_utterance_and_respond(pcm16_16k: bytes, websocket: WebSocket,
             temperature=0.3,  # Lower temperature for accurate transcription
         )
         asr_duration = time.time() - asr_start
-        log(f"⏱️ ASR transcription took {asr_duration:.3f}s")
+        log(f"⏱️ ASR transcription took {asr_duration:.3f}s ({asr_payload.payload_bytes} bytes sent, "
+            f"{asr_payload.legacy_bytes / max(asr_payload.payload_bytes, 1):.1f}x smaller than untrimmed 16kHz)")
         
         if not transcription_response:
             log("Failed to get transcription from BosonAI (all API keys failed or timed out)")
@@ -947,10 +842,23 @@ async def process_utterance_and_respond(pcm16_16k: bytes, websocket: WebSocket,
         log(a)
         if len(a) == 2:
             emotion = a[1]
-        speech_response = await generate_speech_with_emotion(
-            text=a[0],
-            emotion=emotion
-        )
+        if TTS_PARALLEL and len(split_sentences(a[0])) > 1:
+            # Multi-sentence reply: synthesize sentences concurrently and crossfade them back together
+            speech_response = await synthesize_segmented(a[0], emotion, generate_speech_with_emotion)
+            if speech_response:
+                log(f"🧩 Parallel TTS: {speech_response.segments} segments, "
+                    f"wall {speech_response.wall_s:.3f}s vs {sum(speech_response.segment_s):.3f}s summed segment time")
+                if TTS_COMPARE:
+                    asyncio.create_task(compare_single_request_tts(a[0], emotion, speech_response.wall_s))
+            else:
+                # Never play a reply with a sentence missing - synthesize it whole instead
+                log("⚠️ Parallel TTS: a segment failed, retrying the reply as one request")
+                speech_response = await generate_speech_with_emotion(text=a[0], emotion=emotion)
+        else:
+            speech_response = await generate_speech_with_emotion(
+                text=a[0],
+                emotion=emotion
+            )
         tts_duration = time.time() - tts_start
         log(f"Using emotion {emotion}")
         log(f"⏱️ TTS audio generation took {tts_duration:.3f}s")
@@ -968,32 +876,22 @@ async def process_utterance_and_respond(pcm16_16k: bytes, websocket: WebSocket,
         
         log(f"Received {len(pcm_data)} bytes of PCM audio from BosonAI")
         
-        # Convert PCM16 24kHz -> PCM16 8kHz for recording and Twilio
-        pcm16_8k_full, _ = audioop.ratecv(pcm_data, 2, 1, 24000, 8000, None)
+        # Convert PCM16 24kHz -> PCM16 8kHz for recording and Twilio, μ-law + base64 + JSON for every 100ms chunk;
+        # done on the DSP pool so a long reply doesn't stall the event loop for other calls
+        pcm16_8k_full, suffixes = await dsp_pool.run("tts_to_twilio", encode_for_twilio, pcm_data)
         
         # Calculate audio duration for proper delay (PCM16 8kHz, mono, 2 bytes/sample)
         audio_duration_seconds = len(pcm16_8k_full) / (8000 * 2)
         log(f"Bot audio duration: {audio_duration_seconds:.2f} seconds")
         
-        # Convert to μ-law and send to Twilio in chunks
-        # Process in chunks to avoid memory issues
-        chunk_size = 1600  # 100ms at 8kHz (1 channel, 2 bytes/sample)
-        for i in range(0, len(pcm16_8k_full), chunk_size):
-            chunk = pcm16_8k_full[i:i + chunk_size]
-            if len(chunk) < 4:  # Need at least 2 samples
-                continue
-            
-            # Convert to μ-law
-            mulaw_8k = audioop.lin2ulaw(chunk, 2)
-            
-            # Send to Twilio
-            await websocket.send_text(json.dumps({
-                "event": "media",
-                "streamSid": stream_sid,
-                "media": {
-                    "payload": base64.b64encode(mulaw_8k).decode("utf-8")
-                }
-            }))
+        # Record bot audio at the moment it starts streaming
+        if on_bot_audio:
+            on_bot_audio(pcm16_8k_full)
+        
+        # Send to Twilio in 100ms chunks (messages pre-encoded above, only the streamSid is spliced in)
+        message_head = MESSAGE_PREFIX + stream_sid
+        for suffix in suffixes:
+            await websocket.send_text(message_head + suffix)
         
         log("Finished streaming response to caller - will ignore audio during playback...")
         
@@ -1282,128 +1180,267 @@ async def end_call(call_sid: str):
 #         traceback.print_exc()
 
 
-class VadProcessor:
-    """Handles VAD-based speech segmentation for endpointing."""
-    
-    def __init__(self, on_utterance_callback):
-        self.vad = webrtcvad.Vad(VAD_MODE)
-        self.on_utterance = on_utterance_callback
-        self.buf_pcm16_8k = bytearray()
-        self.sil_ms = 0
-        self.speech_ms = 0
-        self.utt_ms = 0
-        self.in_speech = False
-    
-    def feed_mulaw_frame(self, mulaw_frame: bytes):
-        """
-        Feed a 20ms μ-law frame (160 bytes) and check for utterance endpoint.
-        mulaw_frame must be 20 ms at 8 kHz -> 160 samples -> 160 bytes of μ-law.
-        """
-        if len(mulaw_frame) != 160:
-            return  # Skip invalid frames
-        
-        # μ-law → PCM16 8 kHz
-        pcm16_8k = audioop.ulaw2lin(mulaw_frame, 2)
-        
-        # VAD expects linear PCM at the same sample rate
-        is_speech = self.vad.is_speech(pcm16_8k, sample_rate=8000)
-        self.utt_ms += FRAME_MS
-        
-        if is_speech:
-            self.in_speech = True
-            self.speech_ms += FRAME_MS
-            self.sil_ms = 0
-            self.buf_pcm16_8k.extend(pcm16_8k)
-        else:
-            if self.in_speech:
-                self.sil_ms += FRAME_MS
-                self.buf_pcm16_8k.extend(pcm16_8k)  # Include trailing silence
-        
-        # Endpoint conditions
-        if self.in_speech and (self.sil_ms >= END_SIL_MS or self.utt_ms >= MAX_UTT_MS):
-            # Finalize utterance - upsample to 16 kHz for ASR
-            pcm16_16k, _ = audioop.ratecv(bytes(self.buf_pcm16_8k), 2, 1, 8000, 16000, None)
-            log(f"Utterance detected: {self.speech_ms}ms speech, {self.sil_ms}ms silence")
-            self.on_utterance(pcm16_16k)
-            # Reset
-            self.buf_pcm16_8k.clear()
-            self.sil_ms = self.speech_ms = self.utt_ms = 0
-            self.in_speech = False
+def admission_check(record: bool = False) -> AdmissionDecision:
+    """Admission decision from this worker's current load (recorded in the admission stats when record=True)."""
+    full_calls = sum(1 for session in call_registry.sessions() if session.mode == FULL and session.state != ENDING)
+    check = admission.decide if record else admission.check
+    return check(full_calls, dsp_pool.in_flight, loop_lag.smoothed_ms)
 
 
-@app.post('/twiml')
-async def return_twiml(request: Request):
-    """Return TwiML to connect the call to our WebSocket for bidirectional streaming"""
-    print("POST TwiML")
+def stream_twiml(request: Request) -> Response:
+    """TwiML connecting the call to our WebSocket, with mode=voicemail when this worker is over its admission limits."""
+    if drain.draining:
+        # 503 makes Twilio use the number's fallback URL (another instance) instead of a draining one
+        log("🚰 Draining - refusing new call at /twiml")
+        return Response(content="Draining for restart", status_code=503)
     
     # Get the host from the request to build the WebSocket URL
     host = request.headers.get('host', f'localhost:{HTTP_SERVER_PORT}')
     protocol = 'wss' if request.url.scheme == 'https' else 'ws'
     
+    # Early look at the load; the worker that gets the stream makes the final decision
+    decision = admission_check()
+    parameters = ""
+    if decision.mode == VOICEMAIL:
+        log(f"🚦 Over capacity at /twiml ({decision.reason}) - call goes to voicemail")
+        parameters = f"""
+            <Parameter name="mode" value="{VOICEMAIL}" />"""
+    
     # Use <Connect> with BIDIRECTIONAL streaming (both_tracks) to allow bot to speak
     twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
     <Connect>
-        <Stream url="{protocol}://{host}/media-stream" />
+        <Stream url="{protocol}://{host}/media-stream">{parameters}
+        </Stream>
     </Connect>
 </Response>"""
     
     return Response(content=twiml, media_type="application/xml")
 
 
-async def send_greeting(websocket: WebSocket, stream_sid: str):
+@app.post('/twiml')
+async def return_twiml(request: Request):
+    """Return TwiML to connect the call to our WebSocket for bidirectional streaming"""
+    print("POST TwiML")
+    return stream_twiml(request)
+
+
+GREETING_TEXT = "Hi, you've reached the office of BosonAI. How can I help you today?"
+GREETING_EMOTION = "friendly and professional"
+# Voicemail mode (admission control): only ever served from the prompt cache, never synthesized during a call
+VOICEMAIL_GREETING_TEXT = ("Hi, you've reached the office of BosonAI. We're helping other callers right now - "
+                           "please leave your name, number and a short message, and we'll get back to you soon.")
+VOICEMAIL_TRANSCRIBE_MAX_SECONDS = 120   # caller audio transcribed from a voicemail recording
+VOICEMAIL_RETRY_SECONDS = 5              # deferred transcriptions wait this long between load checks
+PROMPT_CACHE_WARM = os.getenv("PROMPT_CACHE_WARM", "1") == "1"  # render the greeting into the prompt cache at startup
+
+# Fire-and-forget tasks (cache warm-up and writes); the loop only keeps weak references to tasks
+background_tasks = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def get_fixed_prompt(text: str, emotion: str):
+    """
+    Return a fixed prompt as a CachedPrompt: from the shared prompt cache when it's
+    there, otherwise via TTS (stored in the cache in the background for every worker).
+    """
+    key = prompt_key(text, emotion, PROMPT_VOICE)
+    cached = prompt_cache.get(key)
+    if cached:
+        log(f"⚡ Prompt cache hit for '{text[:40]}' ({cached.duration_ms}ms, {len(cached.suffixes)} messages)")
+        return cached
+    
+    # Remove content in brackets and emojis before TTS
+    import re
+    tts_text = re.sub(r'\[.*?\]|\(.*?\)|\{.*?\}', '', text).strip()
+    tts_text = remove_emojis(tts_text)
+    
+    import time
+    tts_start = time.time()
+    speech_response = await generate_speech_with_emotion(text=tts_text, emotion=emotion)
+    log(f"⏱️ Prompt TTS generation took {time.time() - tts_start:.3f}s")
+    if not speech_response:
+        return None
+    
+    # Convert PCM16 24kHz -> PCM16 8kHz for recording and Twilio, and pre-encode the media messages (DSP pool)
+    pcm16_8k_full, suffixes = await dsp_pool.run("tts_to_twilio", encode_for_twilio, speech_response.content)
+    meta = {"text": text, "emotion": emotion, "voice": PROMPT_VOICE}
+    task = run_in_background(asyncio.to_thread(prompt_cache.put, key, pcm16_8k_full, meta, suffixes))
+    task.add_done_callback(lambda t: not t.cancelled() and t.exception() and log(f"⚠️ Failed to store prompt in cache: {t.exception()}"))
+    return CachedPrompt(key, pcm16_8k_full, suffixes, len(pcm16_8k_full) * 1000 // 16000, meta)
+
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    """Probe event-loop lag and stack-sample long blocks for the life of the process (reported by /metrics)."""
+    loop_lag.start()
+    slow_callbacks.start()
+
+
+@app.on_event("startup")
+async def start_transcript_journal():
+    journal.log = log
+    journal.start()
+
+
+# Index of every call (transcript/recording paths, times, outcome, summary); opened at startup
+call_catalog = None
+
+
+@app.on_event("startup")
+async def open_call_catalog():
+    global call_catalog
+    call_catalog = CallCatalog()
+
+
+@app.on_event("shutdown")
+async def close_call_catalog():
+    if call_catalog:
+        call_catalog.close()
+
+
+@app.on_event("shutdown")
+async def close_clone_client():
+    await close_http_client()
+
+
+@app.on_event("shutdown")
+async def stop_transcript_journal():
+    """Flush queued journal records and final transcripts before exiting."""
+    await asyncio.to_thread(journal.close)
+
+
+@app.on_event("startup")
+async def warm_prompt_cache():
+    """Render the greeting into the prompt cache so the first call doesn't wait for TTS."""
+    if PROMPT_CACHE_WARM and asr_tts_client:
+        run_in_background(get_fixed_prompt(GREETING_TEXT, GREETING_EMOTION))
+        run_in_background(get_fixed_prompt(VOICEMAIL_GREETING_TEXT, GREETING_EMOTION))
+
+
+async def warm_prompt_cache_before_fork():
+    """
+    Render both greetings in one event loop before the workers start, wait for the
+    cache writes, and close the clone client (it is bound to this loop).
+    """
+    try:
+        await asyncio.gather(get_fixed_prompt(GREETING_TEXT, GREETING_EMOTION),
+                             get_fixed_prompt(VOICEMAIL_GREETING_TEXT, GREETING_EMOTION))
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+    finally:
+        await close_http_client()
+
+
+# Cross-process call registry for multi-worker mode (WEB_CONCURRENCY > 1); None with a single worker
+worker_registry = None
+
+
+def handle_call_event(session: CallSession, kind: str, payload: dict):
+    """Apply a Twilio webhook (status callback or call event) to the call's session."""
+    status = payload.get("CallStatus")
+    if status:
+        session.call_status = status
+    log(f"📨 {kind} for {session.call_sid}: {status or payload.get('StreamEvent') or 'event'} (call state {session.state})")
+
+
+async def worker_sync_loop():
+    """Heartbeat, publish local call states and take webhook events routed here by other workers."""
+    while True:
+        try:
+            snapshots = [session.snapshot() for session in call_registry.sessions()]
+            for call_sid, kind, payload in await asyncio.to_thread(worker_registry.sync, snapshots):
+                session = call_registry.get(call_sid)
+                if session:
+                    handle_call_event(session, kind, payload)
+        except Exception as e:
+            log(f"⚠️ Worker registry sync failed: {e}")
+        await asyncio.sleep(EVENT_POLL_SECONDS)
+
+
+@app.on_event("startup")
+async def start_worker_registry():
+    """Join the shared registry when running as one of several uvicorn workers."""
+    global worker_registry
+    if WORKERS > 1:
+        worker_registry = WorkerRegistry()
+        await asyncio.to_thread(worker_registry.register_worker)
+        asyncio.create_task(worker_sync_loop())
+        log(f"👷 Worker {os.getpid()} joined the call registry ({WORKERS} workers)")
+
+
+@app.on_event("shutdown")
+async def stop_worker_registry():
+    if worker_registry:
+        await asyncio.to_thread(worker_registry.unregister_worker)
+        worker_registry.close()
+
+
+async def live_call_sids() -> set:
+    """Calls being streamed right now by this worker or (multi-worker mode) any other."""
+    live = {session.call_sid for session in call_registry.sessions()}
+    if worker_registry:
+        live |= await asyncio.to_thread(worker_registry.live_calls)
+    return live
+
+
+@app.on_event("startup")
+async def index_calls():
+    """
+    Index the files on disk the first time (e.g. after upgrading), and end the
+    calls a crashed worker left marked in progress. Runs after the worker
+    registry is joined so other workers' live calls are left alone.
+    """
+    live = await live_call_sids()
+    if await asyncio.to_thread(call_catalog.needs_rebuild):
+        await asyncio.to_thread(call_catalog.rebuild, TRANSCRIPTS_DIR, RECORDINGS_DIR, log, live)
+    for call_sid, transcript in await asyncio.to_thread(call_catalog.recover_interrupted, live, log):
+        schedule_summary(call_sid, transcript["conversation"])
+
+
+async def route_call_event(request: Request, kind: str):
+    """Deliver a Twilio webhook to the session that owns the call - here, or via the registry on another worker."""
+    payload = dict(await request.form()) if request.method == "POST" else dict(request.query_params)
+    call_sid = payload.get("CallSid")
+    session = call_registry.get(call_sid) if call_sid else None
+    if session:
+        handle_call_event(session, kind, payload)
+    elif worker_registry and call_sid:
+        await asyncio.to_thread(worker_registry.post_event, call_sid, kind, payload)
+
+
+async def send_greeting(websocket: WebSocket, stream_sid: str, on_bot_audio=None):
     """Send initial greeting when call starts."""
     if not asr_tts_client:
         return None, 0.0, None
     
     try:
-        greeting_text = "Hi, you've reached the office of BosonAI. How can I help you today?"
+        greeting_text = GREETING_TEXT
         log(f"Sending greeting: {greeting_text}")
         
-        # Remove content in brackets and emojis before TTS
-        import re
-        greeting_tts = re.sub(r'\[.*?\]|\(.*?\)|\{.*?\}', '', greeting_text).strip()
-        greeting_tts = remove_emojis(greeting_tts)
-        
-        # Generate speech from greeting with professional, friendly emotion
-        import time
-        greeting_tts_start = time.time()
-        speech_response = await generate_speech_with_emotion(
-            text=greeting_tts,
-            emotion="friendly and professional"
-        )
-        greeting_tts_duration = time.time() - greeting_tts_start
-        log(f"⏱️ Greeting TTS generation took {greeting_tts_duration:.3f}s")
-        
-        if not speech_response:
+        # Pre-encoded greeting from the prompt cache (TTS only on a cache miss)
+        greeting_prompt = await get_fixed_prompt(greeting_text, GREETING_EMOTION)
+        if not greeting_prompt:
             log("Failed to generate greeting from BosonAI (all API keys failed or timed out)")
             return None, 0.0, None
-        
-        pcm_data = speech_response.content
-        log(f"Received {len(pcm_data)} bytes of PCM audio for greeting")
-        
-        # Convert PCM16 24kHz -> PCM16 8kHz for recording and Twilio
-        pcm16_8k_full, _ = audioop.ratecv(pcm_data, 2, 1, 24000, 8000, None)
+        pcm16_8k_full = greeting_prompt.pcm16_8k
         
         # Calculate greeting audio duration
         greeting_duration_seconds = len(pcm16_8k_full) / (8000 * 2)
         log(f"Greeting audio duration: {greeting_duration_seconds:.2f} seconds")
         
-        # Send to Twilio in chunks
-        chunk_size = 1600  # 100ms at 8kHz
-        for i in range(0, len(pcm16_8k_full), chunk_size):
-            chunk = pcm16_8k_full[i:i + chunk_size]
-            if len(chunk) < 4:
-                continue
-            
-            mulaw_8k = audioop.lin2ulaw(chunk, 2)
-            await websocket.send_text(json.dumps({
-                "event": "media",
-                "streamSid": stream_sid,
-                "media": {
-                    "payload": base64.b64encode(mulaw_8k).decode("utf-8")
-                }
-            }))
+        # Record greeting audio at the moment it starts streaming
+        if on_bot_audio:
+            on_bot_audio(pcm16_8k_full)
+        
+        # Send to Twilio: messages are pre-serialized, only the streamSid is spliced in
+        for message in greeting_prompt.messages(stream_sid):
+            await websocket.send_text(message)
         
         log("Greeting sent - will ignore audio during playback...")
         
@@ -1423,119 +1460,293 @@ async def send_greeting(websocket: WebSocket, stream_sid: str):
         return None, 0.0, None  # Return 0 duration on error
 
 
+async def send_voicemail_greeting(websocket: WebSocket, stream_sid: str, on_bot_audio=None):
+    """
+    Voicemail-mode greeting, from the prompt cache only (falls back to the normal
+    greeting; no greeting if neither is cached - TTS is what we're short on).
+
+    Returns:
+        tuple: (greeting text, delay_seconds) or None
+    """
+    for text in (VOICEMAIL_GREETING_TEXT, GREETING_TEXT):
+        prompt = prompt_cache.get(prompt_key(text, GREETING_EMOTION, PROMPT_VOICE))
+        if prompt:
+            break
+    else:
+        log("⚠️ No cached voicemail greeting - recording without one")
+        return None
+    
+    if on_bot_audio:
+        on_bot_audio(prompt.pcm16_8k)
+    for message in prompt.messages(stream_sid):
+        await websocket.send_text(message)
+    return text, prompt.duration_ms / 1000 + POST_AUDIO_DELAY_SECONDS
+
+
+# Voicemail recordings waiting for transcription (queued in voicemail mode, drained once load allows)
+deferred_voicemails = asyncio.Queue()
+
+
+async def transcribe_voicemail(job: dict):
+    """Transcribe a voicemail recording and rewrite its transcript."""
+    asr_payload = await dsp_pool.run("voicemail_payload", recording_asr_payload, job["recording"], VOICEMAIL_TRANSCRIBE_MAX_SECONDS)
+    if not asr_payload:
+        log(f"Voicemail {job['call_sid']} has no audio - nothing to transcribe")
+        await asyncio.to_thread(call_catalog.transcription_done, job["call_sid"])
+        return
+    
+    response = await call_bosonai(
+        "chat.completions.create",
+        model="higgs-audio-understanding-Hackathon",
+        messages=[
+            {"role": "system", "content": PROMPTS["transcription"]},
+            {"role": "user", "content": [{
+                "type": "input_audio",
+                "input_audio": {"data": asr_payload.data_b64, "format": asr_payload.format},
+            }]},
+        ],
+        temperature=0.3,
+    )
+    caller_text = response.choices[0].message.content if response else None
+    if not caller_text:
+        log(f"Failed to transcribe voicemail {job['call_sid']} - transcript keeps the placeholder")
+        return
+    log(f"📝 Voicemail {job['call_sid']} transcribed ({asr_payload.audio_ms}ms): \"{caller_text}\"")
+    
+    job["entry"].update(text=caller_text, audio_size=asr_payload.payload_bytes)
+    transcript = journal.finalize(job["call_sid"], job["from_number"], job["conversation_log"], job["call_start_time"],
+                                  job["call_end_time"], "VOICEMAIL")
+    await asyncio.to_thread(call_catalog.call_ended, job["call_sid"], transcript,
+                            transcript_path(job["call_sid"], job["call_start_time"]))
+    schedule_summary(job["call_sid"], transcript["conversation"])  # the old summary no longer matches
+
+
+async def voicemail_transcriber():
+    """Work through deferred voicemail transcriptions whenever this worker is under its admission limits."""
+    while True:
+        job = await deferred_voicemails.get()
+        while admission_check().mode != FULL:
+            await asyncio.sleep(VOICEMAIL_RETRY_SECONDS)
+        try:
+            await transcribe_voicemail(job)
+        except Exception as e:
+            log(f"⚠️ Voicemail transcription failed for {job['call_sid']}: {e}")
+
+
+def voicemail_job(call_sid: str, path: str, recording: str):
+    """Rebuild a deferred transcription job from the call's transcript on disk (blocking)."""
+    transcript = load_transcript(path)
+    conversation = transcript["conversation"]
+    entry = next(entry for entry in reversed(conversation)
+                 if entry["speaker"] == "Caller" and entry["text"] == TRANSCRIPTION_UNAVAILABLE)
+    entry["text"] = None
+    return {
+        "call_sid": call_sid,
+        "from_number": transcript["from_number"],
+        "recording": recording,
+        "conversation_log": conversation,
+        "entry": entry,
+        "call_start_time": datetime.fromisoformat(transcript["start_time"]),
+        "call_end_time": datetime.fromisoformat(transcript["end_time"]),
+    }
+
+
+async def resume_voicemail_transcriptions():
+    """Re-queue voicemails whose transcription was still pending when their worker stopped (restart, crash, drain)."""
+    live_pids = await asyncio.to_thread(worker_registry.live_pids) if worker_registry else set()
+    for call_sid, path, recording in await asyncio.to_thread(call_catalog.claim_transcriptions, live_pids):
+        try:
+            if not recording or not os.path.exists(recording):
+                raise FileNotFoundError(f"recording {recording} is gone")
+            deferred_voicemails.put_nowait(await asyncio.to_thread(voicemail_job, call_sid, path, recording))
+        except Exception as e:
+            log(f"⚠️ Can't resume voicemail transcription for {call_sid}: {e}")
+            await asyncio.to_thread(call_catalog.transcription_done, call_sid)
+    if deferred_voicemails.qsize():
+        log(f"📥 {deferred_voicemails.qsize()} voicemail(s) re-queued for transcription")
+
+
+@app.on_event("startup")
+async def start_voicemail_transcriber():
+    await resume_voicemail_transcriptions()
+    asyncio.create_task(voicemail_transcriber())
+
+
+# Calls whose transcript has no current summary yet: (call_sid, transcript conversation)
+pending_summaries = asyncio.Queue()
+pending_summary_sids = set()
+
+
+def schedule_summary(call_sid: str, conversation: list):
+    """Queue a background summary (once per call until it has run)."""
+    if call_sid not in pending_summary_sids:
+        pending_summary_sids.add(call_sid)
+        pending_summaries.put_nowait((call_sid, conversation))
+
+
+async def call_summarizer():
+    """Summarize finished calls in the background whenever this worker is under its admission limits."""
+    while True:
+        call_sid, conversation = await pending_summaries.get()
+        while admission_check().mode != FULL:
+            await asyncio.sleep(VOICEMAIL_RETRY_SECONDS)
+        pending_summary_sids.discard(call_sid)
+        try:
+            await summarizer.summarize(call_catalog, call_sid, conversation)
+        except Exception as e:
+            log(f"⚠️ Summary failed for {call_sid}: {e}")
+
+
+@app.on_event("startup")
+async def start_call_summarizer():
+    asyncio.create_task(call_summarizer())
+
+
+# Retention and compaction of old calls (see maintenance.py); created at startup
+maintenance_job = None
+
+
+async def wait_until_idle():
+    """Return once no call is active on any worker and this worker is under its admission limits."""
+    while True:
+        if len(call_registry) == 0 and admission_check().mode == FULL:
+            if not worker_registry or not (await asyncio.to_thread(worker_registry.snapshot))["calls"]:
+                return
+        await asyncio.sleep(MAINTENANCE_IDLE_POLL_SECONDS)
+
+
+async def maintenance_loop():
+    """
+    Run maintenance on whichever worker takes the lock once the last run (on
+    any worker, before any restart) is MAINTENANCE_INTERVAL_HOURS old.
+    """
+    while True:
+        due_in = await asyncio.to_thread(maintenance_due_in)
+        if due_in > 0:
+            await asyncio.sleep(due_in)
+            continue
+        lock = await asyncio.to_thread(acquire_maintenance_lock)
+        if not lock:
+            await asyncio.sleep(MAINTENANCE_LOCK_RETRY_SECONDS)   # another worker is running it
+            continue
+        try:
+            if await asyncio.to_thread(maintenance_due_in) > 0:
+                continue   # it finished on another worker while we waited for the lock
+            started = time.time()
+            try:
+                await maintenance_job.run(wait_until_idle)
+            except Exception as e:
+                log(f"⚠️ Maintenance failed: {e}")
+            # Recorded even after a failure, so a broken run is retried next interval, not in a loop
+            await asyncio.to_thread(record_maintenance_run, started)
+        finally:
+            await asyncio.to_thread(release_maintenance_lock, lock)
+
+
+@app.on_event("startup")
+async def start_maintenance():
+    global maintenance_job
+    maintenance_job = MaintenanceJob(call_catalog, TRANSCRIPTS_DIR, RECORDINGS_DIR, os.getenv("SQLITECLOUD_URL"), log)
+    if MAINTENANCE_INTERVAL_HOURS > 0:
+        asyncio.create_task(maintenance_loop())
+
+
 @app.websocket("/media-stream")
 async def media_stream(websocket: WebSocket):
     """Handle Twilio media stream WebSocket connection with VAD-based endpointing and BosonAI streaming"""
     await websocket.accept()
     log("Connection accepted")
     
-    count = 0
-    has_seen_media = False
-    wav_file = None
-    call_sid = None
-    stream_sid = None
-    from_number = "unknown"
-    call_start_time = datetime.now()
-    final_action = None
-    mulaw_buffer = bytearray()
-    transcripts = []
-    conversation_log = []  # Detailed conversation with caller and bot
-    conversation_history = []  # Track full conversation
-    greeting_sent = False
-    exchange_count = 0  # Track number of caller-bot exchanges (greeting doesn't count)
-    
-    # Stereo recording buffer for bot audio
-    bot_audio_buffer = bytearray()
+    # All per-call state lives on the session; the state machine replaces the old bot-speaking flags:
+    # listening -> thinking (utterance/greeting being answered) -> speaking (playback + post-audio delay) -> listening
+    session = CallSession(
+        # Inbound jitter buffer: in-order frames pass straight through, gaps wait up to JITTER_DEPTH frames
+        jitter=JitterBuffer(),
+        # Streaming endpointer (shared with the test server and mic tool); utterances are handled here for async callback
+        endpointer=Endpointer(make_detector(VAD_DETECTOR, mode=VAD_MODE, verify=VAD_GATE_VERIFY),
+                              frame_ms=FRAME_MS, end_silence_ms=END_SIL_MS, max_utterance_ms=MAX_UTT_MS),
+        # Line noise calibration over the first seconds of caller audio (VAD_MODE is the least aggressive mode allowed)
+        calibrator=LineCalibrator(min_mode=VAD_MODE) if VAD_CALIBRATE else None,
+        # Echo canceller driven by the bot audio we send (same stream timeline as the recorder)
+        echo_canceller=EchoCanceller() if AEC_MODE != "off" else None,
+        aec_mode=AEC_MODE,
+        log=log,
+    )
+    session.websocket = websocket
     
-    # Track bot speaking state to prevent VAD during bot responses
-    bot_is_speaking = False
-    bot_speaking_until = None  # Timestamp when bot will finish speaking + buffer delay
-    bot_finished_time = None  # Track when bot finished speaking for debounce
+    def start_speaking(delay_seconds: float):
+        """Bot audio is out - stay in the speaking state until it has played."""
+        until = session.speak_for(delay_seconds)
+        if AEC_MODE == "on":
+            log(f"🔊 Bot speaking until {until.strftime('%H:%M:%S.%f')[:-3]} - caller can barge in (echo cancellation on)")
+        else:
+            log(f"🔇 Blocking user input until {until.strftime('%H:%M:%S.%f')[:-3]} ({delay_seconds:.2f}s from now)")
     
     # Callback for when VAD detects a complete utterance
-    async def on_utterance(pcm16_16k: bytes, speech_duration_ms: int):
-        nonlocal bot_is_speaking, buf_pcm16_8k, sil_ms, speech_ms, utt_ms, in_speech, final_action, mulaw_buffer, exchange_count, bot_speaking_until, bot_finished_time, bot_audio_buffer
-        
+    async def on_utterance(asr_payload: AsrPayload, speech_duration_ms: int):
         # Ignore very short utterances (breath, noise, feedback)
         if speech_duration_ms < MIN_SPEECH_MS:
             log(f"Ignoring short utterance ({speech_duration_ms}ms < {MIN_SPEECH_MS}ms minimum)")
             return
         
-        log(f"Processing valid utterance ({len(pcm16_16k)} bytes at 16kHz, {speech_duration_ms}ms speech)...")
+        log(f"Processing valid utterance ({asr_payload.payload_bytes} bytes ASR payload, {speech_duration_ms}ms speech)...")
+        session.utterances += 1
         
-        # Set flag to disable VAD during bot response
-        bot_is_speaking = True
-        bot_finished_time = None  # Clear debounce timer during processing
+        # Thinking: caller input is ignored until the reply has played
+        session.transition(THINKING)
         
         # Clear VAD buffer immediately to prevent echo detection
-        buf_pcm16_8k.clear()
-        sil_ms = speech_ms = utt_ms = 0
-        in_speech = False
+        session.endpointer.reset()
         
         # Process with BosonAI and stream response back
-        if stream_sid:  # Make sure we have a stream_sid
-            from datetime import timedelta
-            # Removed wav_file argument
-            response, bot_audio, action, caller_text, delay_seconds = await process_utterance_and_respond(pcm16_16k, websocket, stream_sid, conversation_history, call_sid, exchange_count=exchange_count)
+        if session.stream_sid:  # Make sure we have a stream_sid
+            response, bot_audio, action, caller_text, delay_seconds = await process_utterance_and_respond(
+                asr_payload, websocket, session.stream_sid, session.conversation_history, session.call_sid,
+                exchange_count=session.exchange_count, on_bot_audio=session.on_bot_audio)
             if response:
-                transcripts.append(response)
+                session.transcripts.append(response)
                 # Increment exchange counter (caller spoke + bot responded = 1 exchange)
-                exchange_count += 1
-                log(f"📊 Exchange count: {exchange_count}")
+                session.exchange_count += 1
+                log(f"📊 Exchange count: {session.exchange_count}")
                 # Track final action
                 if action:
-                    final_action = action
+                    session.final_action = action
                 # Log the exchange with caller transcription and emotion data
-                conversation_log.append({
+                history = session.conversation_history
+                session.conversation_log.append({
                     "speaker": "Caller",
                     "duration_ms": speech_duration_ms,
-                    "audio_size": len(pcm16_16k),
+                    "audio_size": asr_payload.payload_bytes,
                     "text": caller_text if caller_text else None,
                     "timestamp": datetime.now().isoformat(),
-                    "emojis": conversation_history[-2].get('emojis', []) if len(conversation_history) >= 2 else [],
-                    "detected_emotion": conversation_history[-2].get('detected_emotion', '') if len(conversation_history) >= 2 else ''
+                    "emojis": history[-2].get('emojis', []) if len(history) >= 2 else [],
+                    "detected_emotion": history[-2].get('detected_emotion', '') if len(history) >= 2 else ''
                 })
-                conversation_log.append({
+                session.conversation_log.append({
                     "speaker": "Bot",
                     "text": clean_text_for_transcript(response),
                     "timestamp": datetime.now().isoformat(),
-                    "emotion_used": conversation_history[-1].get('emotion_used', '') if conversation_history else ''
+                    "emotion_used": history[-1].get('emotion_used', '') if history else ''
                 })
                 
-                # Add bot audio to buffer for stereo recording
-                if bot_audio:
-                    bot_audio_buffer.extend(bot_audio)
+                # Journal the exchange (append-only; the full transcript is written when the call ends)
+                for entry in session.conversation_log[-2:]:
+                    journal.append(session.call_sid, entry)
                 
-                # Save transcript after each exchange (overwrite same file)
-                save_transcript(call_sid, from_number, conversation_log, call_start_time, datetime.now(), final_action, call_in_progress=True)
-                
-                # Set timestamp when bot will finish speaking (now + delay_seconds)
-                bot_speaking_until = datetime.now() + timedelta(seconds=delay_seconds)
-                log(f"🔇 Blocking user input until {bot_speaking_until.strftime('%H:%M:%S.%f')[:-3]} ({delay_seconds:.2f}s from now)")
+                start_speaking(delay_seconds)
+                if session.last_turn_ms is not None:
+                    admission.observe_turn(session.last_turn_ms)
+            else:
+                session.transition(LISTENING)
         else:
             log("Warning: stream_sid or call_sid not set yet, skipping utterance")
+            session.transition(LISTENING)
         
-        # Re-enable VAD immediately (timestamp check handles blocking)
-        bot_is_speaking = False
-        
-        # CRITICAL: Clear mulaw_buffer to discard any audio that came in during bot speaking
+        # CRITICAL: Clear the endpointer to discard any audio that came in while the reply was generated
         # This prevents echo/noise from being processed as the next utterance
-        mulaw_buffer.clear()
-        
-        # Clear VAD buffers again after bot response to ensure clean slate
-        buf_pcm16_8k.clear()
-        sil_ms = speech_ms = utt_ms = 0
-        in_speech = False
+        session.endpointer.reset()
         
-        log(f"✅ Bot response sent - user input blocked until {bot_speaking_until.strftime('%H:%M:%S.%f')[:-3] if bot_speaking_until else 'now'}")
-    
-    # Simple utterance detector (we'll handle VAD manually for async callback)
-    vad = webrtcvad.Vad(VAD_MODE)
-    buf_pcm16_8k = bytearray()
-    sil_ms = 0
-    speech_ms = 0
-    utt_ms = 0
-    in_speech = False
+        log(f"✅ Bot response sent - call state {session.state} (turn {session.last_turn_ms or 0:.0f}ms to first audio)")
     
     try:
         while True:
@@ -1558,159 +1769,116 @@ async def media_stream(websocket: WebSocket):
                 
                 # Extract caller info if available
                 from_number = data['start'].get('customParameters', {}).get('from', 'unknown')
-                call_start_time = datetime.now()
                 log(f"Call from: {from_number}")
                 
-                # Create WAV file for this call (8 kHz native PSTN rate)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"{RECORDINGS_DIR}/call_{call_sid}_{timestamp}.wav"
-                recording_filename = f"call_{call_sid}_{timestamp}.wav"  # Store just the filename
+                # Create recording file for this call (8 kHz native PSTN rate), sharded by start date like its transcript
+                call_start_time = datetime.now()
+                extension = recording_extension(RECORDING_FORMAT)
+                filename = call_file(RECORDINGS_DIR, "call_", call_sid, call_start_time, extension)
+                
+                # Admission control: over capacity, the call is answered in voicemail mode (decided at /twiml or here)
+                if data['start'].get('customParameters', {}).get('mode') == VOICEMAIL:
+                    decision = admission.record(AdmissionDecision(VOICEMAIL, "over capacity at /twiml"))
+                else:
+                    decision = admission_check(record=True)
+                session.set_mode(decision.mode)
+                if decision.mode == VOICEMAIL:
+                    log(f"🚦 Voicemail mode ({decision.reason}): cached greeting + recording, transcription deferred - load {decision.load}")
                 
-                # Open WAV file with proper settings for mulaw -> PCM conversion
-                wav_file = wave.open(filename, 'wb')
-                wav_file.setnchannels(2)  # Stereo (Left=Caller, Right=Bot)
-                wav_file.setsampwidth(2)  # 2 bytes (16-bit PCM)
-                wav_file.setframerate(8000)  # 8000 Hz (native PSTN)
+                # Stereo recorder (Left=Caller, Right=Bot) - disk writes happen on its own thread
+                session.start(call_sid, stream_sid, from_number, CallRecorder(filename, fmt=RECORDING_FORMAT), call_start_time)
+                journal.open(call_sid, from_number, session.call_start_time)
+                await asyncio.to_thread(call_catalog.call_started, call_sid, from_number, session.call_start_time,
+                                        transcript_path(call_sid, session.call_start_time, ".jsonl"), filename)
+                call_registry.register(session)
+                if worker_registry:
+                    await asyncio.to_thread(worker_registry.claim_call, call_sid, stream_sid, from_number, session.state)
                 
-                log(f"Recording to WAV (8kHz Stereo): {filename}")
+                log(f"Recording to {RECORDING_FORMAT} (8kHz Stereo): {filename}")
                 log(f"VAD enabled: endpointing at {END_SIL_MS}ms silence, min speech {MIN_SPEECH_MS}ms")
-                log(f"BosonAI bot ready")
+                log(f"BosonAI bot ready ({len(call_registry)} active call(s) in this process)")
             
             elif data['event'] == "media":
                 # Process media for recording and VAD
-                payload = data['media']['payload']
-                mulaw_data = base64.b64decode(payload)
+                media = data['media']
+                mulaw_data = base64.b64decode(media['payload'])
                 
-                # Write to stereo WAV file
-                if wav_file:
-                    # Caller audio (Left channel)
-                    caller_pcm = audioop.ulaw2lin(mulaw_data, 2)
-                    
-                    # Bot audio (Right channel)
-                    # Pop corresponding amount of audio from buffer
-                    chunk_len = len(caller_pcm)
-                    if len(bot_audio_buffer) >= chunk_len:
-                        bot_pcm = bot_audio_buffer[:chunk_len]
-                        del bot_audio_buffer[:chunk_len]
-                    else:
-                        # Not enough bot audio, pad with silence
-                        bot_pcm = bot_audio_buffer[:]
-                        del bot_audio_buffer[:]
-                        padding = bytes(chunk_len - len(bot_pcm))
-                        bot_pcm += padding
-                    
-                    # Create stereo frame: Left=Caller, Right=Bot
-                    # audioop.tostereo(fragment, width, lfactor, rfactor)
-                    # lfactor=1, rfactor=0 -> Left channel
-                    # lfactor=0, rfactor=1 -> Right channel
-                    left_stereo = audioop.tostereo(caller_pcm, 2, 1, 0)
-                    right_stereo = audioop.tostereo(bot_pcm, 2, 0, 1)
-                    
-                    # Combine channels
-                    stereo_frame = audioop.add(left_stereo, right_stereo, 2)
-                    wav_file.writeframes(stereo_frame)
+                # Jitter buffer, recording, echo cancellation and line calibration (see CallSession.ingest_media)
+                caller_pcm = session.ingest_media(media, audioop.ulaw2lin(mulaw_data, 2))
+                if not caller_pcm:
+                    continue  # Held in the jitter buffer waiting for a missing frame
                 
-                # Skip VAD processing if bot is speaking (but keep recording above)
-                if bot_is_speaking:
+                if session.mode == VOICEMAIL:
+                    # Recording only: the cached greeting once, then no VAD/ASR/LLM/TTS for this call
+                    if not session.greeting_sent and session.stream_sid:
+                        session.greeting_sent = True
+                        session.transition(THINKING)
+                        greeting_result = await send_voicemail_greeting(websocket, session.stream_sid, on_bot_audio=session.on_bot_audio)
+                        if greeting_result:
+                            greeting, delay_seconds = greeting_result
+                            session.conversation_log.append({
+                                "speaker": "Bot",
+                                "text": clean_text_for_transcript(greeting),
+                                "timestamp": datetime.now().isoformat()
+                            })
+                            journal.append(session.call_sid, session.conversation_log[-1])
+                            start_speaking(delay_seconds)
+                        else:
+                            session.transition(LISTENING)
+                    session.accepting_input()  # ends the speaking state once the greeting has played
                     continue
                 
-                # Check if we're still in the blocking period after bot spoke
-                if bot_speaking_until is not None:
-                    import time
-                    current_time = datetime.now()
-                    if current_time < bot_speaking_until:
-                        # Still in blocking period - skip VAD processing
-                        continue
-                    else:
-                        # Blocking period over - clear the timer and resume normal processing
-                        log(f"✅ Blocking period over - resuming VAD at {current_time.strftime('%H:%M:%S.%f')[:-3]}")
-                        bot_speaking_until = None
+                # Skip VAD processing while the bot is thinking/speaking (but keep recording above)
+                if not session.accepting_input():
+                    continue
                 
-                if not has_seen_media:
+                if not session.has_seen_media:
                     log("Media message received - streaming audio with VAD...")
                     log("Additional media messages are being suppressed from logs...")
-                    has_seen_media = True
+                    session.has_seen_media = True
                     
                     # Send greeting after first media packet (ensures stream is ready)
-                    if not greeting_sent and stream_sid:
-                        from datetime import timedelta
-                        bot_is_speaking = True  # Prevent VAD during greeting
-                        # Removed wav_file argument
-                        greeting_result = await send_greeting(websocket, stream_sid)
+                    if not session.greeting_sent and session.stream_sid:
+                        session.transition(THINKING)  # Prevent VAD during greeting
+                        greeting_result = await send_greeting(websocket, session.stream_sid, on_bot_audio=session.on_bot_audio)
                         
                         if greeting_result:
                             greeting, delay_seconds, bot_audio = greeting_result
                             if greeting:
-                                conversation_history.append({
+                                session.conversation_history.append({
                                     "role": "assistant",
                                     "content": greeting
                                 })
-                                conversation_log.append({
+                                session.conversation_log.append({
                                     "speaker": "Bot",
                                     "text": clean_text_for_transcript(greeting),
                                     "timestamp": datetime.now().isoformat()
                                 })
-                                
-                                # Add greeting audio to buffer
-                                if bot_audio:
-                                    bot_audio_buffer.extend(bot_audio)
-                                
-                                # Save transcript after greeting (overwrite same file)
-                                save_transcript(call_sid, from_number, conversation_log, call_start_time, datetime.now(), final_action, call_in_progress=True)
+                                journal.append(session.call_sid, session.conversation_log[-1])
                             
-                            # Set timestamp when bot will finish speaking (now + delay_seconds)
-                            bot_speaking_until = datetime.now() + timedelta(seconds=delay_seconds)
-                            log(f"🔇 Blocking user input until {bot_speaking_until.strftime('%H:%M:%S.%f')[:-3]} ({delay_seconds:.2f}s from now)")
-                        
-                        # Re-enable VAD after greeting is sent (timestamp check handles blocking)
-                        bot_is_speaking = False
+                            start_speaking(delay_seconds)
+                        else:
+                            session.transition(LISTENING)
                         
                         # Clear any accumulated audio during greeting
-                        mulaw_buffer.clear()
-                        buf_pcm16_8k.clear()
-                        sil_ms = speech_ms = utt_ms = 0
-                        in_speech = False
-                        greeting_sent = True
+                        session.endpointer.reset()
+                        session.greeting_sent = True
                         continue  # Skip processing this packet
                 
-                # Add to buffer and process in 20ms frames (160 bytes μ-law)
-                # (mulaw_data already extracted at top of media event handler)
-                mulaw_buffer.extend(mulaw_data)
-                
-                # Process complete 20ms frames for VAD
-                while len(mulaw_buffer) >= 160:
-                    frame = bytes(mulaw_buffer[:160])
-                    mulaw_buffer = mulaw_buffer[160:]
-                    
-                    # Manual VAD processing for async callback support
-                    pcm16_8k = audioop.ulaw2lin(frame, 2)
-                    is_speech = vad.is_speech(pcm16_8k, sample_rate=8000)
-                    utt_ms += FRAME_MS
+                # Endpoint on 20ms frames; all whole frames buffered so far are classified in one batch
+                # (caller_pcm decoded - and echo-cancelled if enabled - by ingest_media above)
+                for utterance in session.endpointer.feed(caller_pcm):
+                    # Finalize utterance - trim to speech and encode at native 8 kHz for ASR
+                    asr_payload = await dsp_pool.run("asr_payload", build_asr_payload, utterance.pcm16, utterance.frame_flags)
+                    log(f"Utterance detected: {utterance.speech_ms}ms speech, {utterance.silence_ms}ms silence")
                     
-                    if is_speech:
-                        in_speech = True
-                        speech_ms += FRAME_MS
-                        sil_ms = 0
-                        buf_pcm16_8k.extend(pcm16_8k)
-                    else:
-                        if in_speech:
-                            sil_ms += FRAME_MS
-                            buf_pcm16_8k.extend(pcm16_8k)
+                    # Process with BosonAI (async) - moves the session through thinking/speaking
+                    # Pass speech duration to filter out short noise
+                    await on_utterance(asr_payload, utterance.speech_ms)
                     
-                    # Check for utterance endpoint
-                    if in_speech and (sil_ms >= END_SIL_MS or utt_ms >= MAX_UTT_MS):
-                        # Finalize utterance - upsample to 16 kHz for ASR
-                        pcm16_16k, _ = audioop.ratecv(bytes(buf_pcm16_8k), 2, 1, 8000, 16000, None)
-                        log(f"Utterance detected: {speech_ms}ms speech, {sil_ms}ms silence")
-                        
-                        # Process with BosonAI (async) - this will set bot_is_speaking=True
-                        # Pass speech duration to filter out short noise
-                        await on_utterance(pcm16_16k, speech_ms)
-                        
-                        # Reset VAD state
-                        buf_pcm16_8k.clear()
-                        sil_ms = speech_ms = utt_ms = 0
-                        in_speech = False
+                    # Audio that arrived while the bot was responding is discarded
+                    session.endpointer.reset()
+                    break
             
             elif data['event'] == "stop":
                 log("Stop Message received:", message)
@@ -1720,25 +1888,59 @@ async def media_stream(websocket: WebSocket):
                 log("Closed Message received:", message)
                 break
             
-            count += 1
+            session.messages += 1
     
     except WebSocketDisconnect:
         log("WebSocket disconnected")
     except Exception as e:
-        log(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
+        if session.state == ENDING:
+            log("Stream closed by drain")
+        else:
+            log(f"Error: {e}")
+            import traceback
+            traceback.print_exc()
     finally:
+        session.transition(ENDING)
         call_end_time = datetime.now()
         
-        # Close the WAV file
-        if wav_file:
-            wav_file.close()
-            log(f"WAV file saved successfully - ready to play!")
-        
-        # Save final transcript to file (mark as complete)
-        if conversation_log and call_sid:
-            save_transcript(call_sid, from_number, conversation_log, call_start_time, call_end_time, final_action, call_in_progress=False)
+        # Flush the recorder and finalize the WAV header (blocking join runs off the event loop)
+        if session.recorder:
+            await asyncio.to_thread(session.finish_recording)
+            log(f"WAV file saved successfully - ready to play! Recorder stats: {session.recorder.stats()}")
+            log(f"Bot playback timeline (ms since stream start): {session.recorder.bot_segments}")
+        
+        conversation_log = session.conversation_log
+        voicemail_entry = None
+        if session.mode == VOICEMAIL and session.recorder and session.call_sid:
+            # Placeholder until the deferred transcription fills it in
+            session.final_action = "VOICEMAIL"
+            voicemail_entry = {
+                "speaker": "Caller",
+                "duration_ms": int((call_end_time - session.call_start_time).total_seconds() * 1000),
+                "text": None,
+                "timestamp": call_end_time.isoformat(),
+            }
+            conversation_log.append(voicemail_entry)
+        
+        # Write the final transcript and close the call's journal (on the writer thread)
+        if session.call_sid:
+            transcript = journal.finalize(session.call_sid, session.from_number, conversation_log, session.call_start_time,
+                                          call_end_time, session.final_action)
+            await asyncio.to_thread(call_catalog.call_ended, session.call_sid, transcript,
+                                    transcript_path(session.call_sid, session.call_start_time), bool(voicemail_entry))
+            if not voicemail_entry:
+                schedule_summary(session.call_sid, transcript["conversation"])  # voicemails are summarized once transcribed
+        if voicemail_entry:
+            deferred_voicemails.put_nowait({
+                "call_sid": session.call_sid,
+                "from_number": session.from_number,
+                "recording": session.recorder.path,
+                "conversation_log": conversation_log,
+                "entry": voicemail_entry,
+                "call_start_time": session.call_start_time,
+                "call_end_time": call_end_time,
+            })
+            log(f"📥 Voicemail queued for transcription ({deferred_voicemails.qsize()} waiting)")
         # Determine if call was spam based on conversation
         # is_spam = False
         # for entry in conversation_log:
@@ -1779,12 +1981,94 @@ async def media_stream(websocket: WebSocket):
             log(f"{'='*60}\n")
         
         # Log transcripts (old format for backward compatibility)
-        if transcripts:
-            log(f"Call summary - {len(transcripts)} bot response(s):")
-            for i, t in enumerate(transcripts, 1):
+        if session.transcripts:
+            log(f"Call summary - {len(session.transcripts)} bot response(s):")
+            for i, t in enumerate(session.transcripts, 1):
                 log(f"  [{i}] {t}")
         
-        log(f"Connection closed. Received a total of {count} messages")
+        stats = session.component_stats()
+        log(f"VAD stats: {stats['vad']}")
+        log(f"Jitter buffer: {stats['jitter']}")
+        if stats['calibration']:
+            log(f"Line calibration: {stats['calibration']}")
+        if stats['echo']:
+            log(f"Echo canceller ({AEC_MODE}): {stats['echo']}")
+        log(f"Call states: {session.snapshot()['state_ms']} ms, max turn {session.max_turn_ms:.0f}ms")
+        lag = loop_lag.stats()
+        log(f"Event loop lag: p50 {lag['p50_ms']}ms, p99 {lag['p99_ms']}ms, max {lag['max_ms']}ms over {lag['count']} probes")
+        call_registry.unregister(session)
+        if worker_registry and session.call_sid:
+            await asyncio.to_thread(worker_registry.release_call, session.call_sid)
+        log(f"Connection closed. Received a total of {session.messages} messages")
+
+
+@app.post("/admin/drain")
+async def admin_drain(timeout: float = None):
+    """Stop admitting calls and let active ones finish (the process exits when done if run via main.py)"""
+    started = drain.begin("admin request", timeout if timeout is not None else DRAIN_TIMEOUT_SECONDS)
+    return {"started": started, **drain.stats()}
+
+
+@app.get("/admin/drain")
+async def admin_drain_status():
+    """Drain progress"""
+    return {**drain.stats(), "deferred_voicemails": deferred_voicemails.qsize()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Event-loop lag, slow-callback sites with stack samples, DSP job latencies and admission counters"""
+    return {
+        "pid": os.getpid(),
+        "active_calls": len(call_registry),
+        "loop_lag": loop_lag.stats(),
+        "slow_callbacks": slow_callbacks.stats(),
+        "dsp": dsp_pool.stats(),
+        "admission": admission.stats(),
+        "transcripts": journal.stats(),
+        "maintenance": maintenance_job.stats() if maintenance_job else None,
+    }
+
+
+@app.get("/admin/calls")
+async def admin_calls():
+    """Active calls in this process: state, time per state, queue depths and turn latency (plus every worker's calls in multi-worker mode)"""
+    snapshot = call_registry.snapshot()
+    snapshot["loop_lag"] = loop_lag.stats()
+    snapshot["dsp"] = dsp_pool.stats()
+    snapshot["admission"] = admission.stats() | {"deferred_voicemails": deferred_voicemails.qsize()}
+    if worker_registry:
+        snapshot["worker_pid"] = os.getpid()
+        snapshot["cluster"] = await asyncio.to_thread(worker_registry.snapshot)
+    return snapshot
+
+
+@app.get("/transcripts/{call_sid}.txt")
+async def transcript_txt(call_sid: str):
+    """Human-readable transcript, rendered from the final JSON (or the live journal while the call is active)"""
+    call = await asyncio.to_thread(call_catalog.get, call_sid)
+    if not call or not call['transcript_path']:
+        return Response(content="Transcript not found\n", status_code=404, media_type="text/plain")
+    transcript = await asyncio.to_thread(load_transcript, call['transcript_path'])
+    return Response(content=render_txt(transcript), media_type="text/plain; charset=utf-8")
+
+
+@app.get("/calls/search")
+async def search_calls(q: str, limit: int = 20, offset: int = 0, sort: str = "recent"):
+    """Full-text search over finished calls (caller/bot text, caller name, number, emotions, summary); sort=recent (default) or relevance"""
+    if sort not in SEARCH_ORDERS:
+        return Response(content=f"sort must be one of {', '.join(SEARCH_ORDERS)}\n", status_code=400, media_type="text/plain")
+    limit = max(1, min(limit, 100))
+    offset = max(offset, 0)
+    results = await asyncio.to_thread(call_catalog.search, q, limit + 1, offset, sort)
+    return {
+        "query": q,
+        "sort": sort,
+        "offset": offset,
+        "limit": limit,
+        "results": results[:limit],
+        "next_offset": offset + limit if len(results) > limit else None,
+    }
 
 
 @app.api_route("/", methods=["GET", "POST"])
@@ -1792,25 +2076,20 @@ async def root(request: Request):
     """Health check endpoint - accepts both GET and POST"""
     if request.method == "POST":
         # If Twilio is POSTing to root, return TwiML
-        host = request.headers.get('host', f'localhost:{HTTP_SERVER_PORT}')
-        protocol = 'wss' if request.url.scheme == 'https' else 'ws'
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Connect>
-        <Stream url="{protocol}://{host}/media-stream" />
-    </Connect>
-</Response>"""
-        return Response(content=twiml, media_type="application/xml")
+        return stream_twiml(request)
     
     # GET request - return JSON status
     return {
-        "status": "running",
+        "status": "draining" if drain.draining else "running",
         "message": "Twilio Media Stream FastAPI Server",
         "endpoints": {
             "twiml": "/twiml (POST)",
             "websocket": "/media-stream (WebSocket)",
             "voicemails": "/voicemails (GET)",
-            "voicemail_recording": "/voicemail/{id}/recording (GET)"
+            "voicemail_recording": "/voicemail/{id}/recording (GET)",
+            "admin_calls": "/admin/calls (GET)",
+            "metrics": "/metrics (GET)",
+            "admin_drain": "/admin/drain (GET progress, POST to start)"
         },
         "database": "enabled" if SQLITE_URL else "disabled"
     }
@@ -1819,12 +2098,14 @@ async def root(request: Request):
 @app.api_route("/status-callback", methods=["GET", "POST"])
 async def status_callback(request: Request):
     """Handle Twilio status callbacks (for call status updates)"""
+    await route_call_event(request, "status-callback")
     return Response(content='<?xml version="1.0" encoding="UTF-8"?><Response></Response>', media_type="application/xml")
 
 
 @app.api_route("/call-events", methods=["GET", "POST"])
 async def call_events(request: Request):
     """Handle any call event webhooks from Twilio"""
+    await route_call_event(request, "call-event")
     return Response(content='<?xml version="1.0" encoding="UTF-8"?><Response></Response>', media_type="application/xml")
 
 
@@ -1888,4 +2169,14 @@ async def call_events(request: Request):
 if __name__ == '__main__':
     print(f"Server listening on: http://localhost:{HTTP_SERVER_PORT}")
     print("Starting FastAPI server with WebSocket support...")
-    uvicorn.run(app, host="0.0.0.0", port=HTTP_SERVER_PORT)
+    if WORKERS > 1:
+        # Render the greeting once here so workers start with a warm prompt cache instead of all calling TTS
+        if PROMPT_CACHE_WARM and asr_tts_client:
+            asyncio.run(warm_prompt_cache_before_fork())
+        print(f"Starting {WORKERS} workers (call registry: {WORKER_DB_PATH})")
+        # Same as uvicorn.run(workers=...), but each worker is a DrainingServer: SIGTERM drains calls before exiting
+        from uvicorn.supervisors import Multiprocess
+        config = uvicorn.Config("main:app", host="0.0.0.0", port=HTTP_SERVER_PORT, workers=WORKERS)
+        Multiprocess(config, target=DrainingServer(config).run, sockets=[config.bind_socket()]).run()
+    else:
+        DrainingServer(uvicorn.Config(app, host="0.0.0.0", port=HTTP_SERVER_PORT)).run()
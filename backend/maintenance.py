@@ -0,0 +1,322 @@
+"""
+Retention and compaction for call data.
+
+One maintenance run works through these steps, MAINTENANCE_BATCH calls at a
+time:
+
+    expire     delete calls past retention - recording, transcript files,
+               catalog and search rows. Spam calls (final_action END) are kept
+               RETENTION_SPAM_DAYS, everything else RETENTION_CALL_DAYS.
+    compact    calls older than COMPACT_AFTER_DAYS: transcode the recording
+               to COMPACT_FORMAT and delete the redundant JSONL journal and
+               legacy .txt transcript next to the final JSON.
+    partials   recordings left as <name>.part by a worker that died mid-call
+               (untouched for PARTIAL_STALE_HOURS): repaired into the final
+               file, or removed if they hold no audio. One that can't be
+               repaired is renamed <name>.part.failed and kept.
+    voicemails delete expired rows from the sqlitecloud voicemails table (same
+               retention, by its spam flag; only with SQLITECLOUD_URL set).
+    vacuum     merge the search index, checkpoint and (if worth it) VACUUM
+               the catalog, and VACUUM the voicemails database.
+
+The server runs it when the last run (MAINTENANCE_STATE_PATH, shared by the
+workers and kept across restarts) is MAINTENANCE_INTERVAL_HOURS old. Before
+each batch it waits until the worker is idle (no active calls, admission not
+degraded), and the file work runs on a thread, so maintenance I/O never
+overlaps a live call on this worker. An flock on MAINTENANCE_LOCK_PATH keeps
+several workers from running it at once; the OS drops it if the holder dies.
+
+Run it once by hand (no idle wait) with:
+
+    python maintenance.py [--dry-run]
+"""
+import argparse
+import asyncio
+import fcntl
+import glob
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from call_catalog import CALL_CATALOG_PATH, RECORDINGS_DIR, CallCatalog
+from database.wav_bytes import flac_available, salvage_recording, transcode_recording
+from storage import PARTIAL_SUFFIX, atomic_write_bytes, find_call_files
+from transcript_journal import TRANSCRIPTS_DIR
+
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))   # 0 disables the scheduled run
+RETENTION_SPAM_DAYS = int(os.getenv("RETENTION_SPAM_DAYS", "30"))
+RETENTION_CALL_DAYS = int(os.getenv("RETENTION_CALL_DAYS", "365"))
+COMPACT_AFTER_DAYS = int(os.getenv("COMPACT_AFTER_DAYS", "7"))
+COMPACT_FORMAT = os.getenv("COMPACT_FORMAT", "flac" if flac_available() else "mulaw")
+PARTIAL_STALE_HOURS = float(os.getenv("PARTIAL_STALE_HOURS", "6"))    # a live recording's .part is written every second
+FAILED_PARTIAL_SUFFIX = ".failed"    # appended to a .part that couldn't be repaired (kept for a manual look)
+MAINTENANCE_BATCH = 50          # calls per batch; the idle check runs between batches
+MAINTENANCE_IDLE_POLL_SECONDS = 5
+MAINTENANCE_LOCK_PATH = "run/maintenance.lock"
+MAINTENANCE_STATE_PATH = "run/maintenance.last"    # time of the latest run
+MAINTENANCE_LOCK_RETRY_SECONDS = 300    # wait before re-checking while another worker runs it
+SPAM_ACTIONS = ("END",)         # final_action values counted as spam
+
+
+def _remove(path: str, root: str):
+    """Delete a file, then its parent directories up to (not including) root while they are empty."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path)
+    root = os.path.abspath(root)
+    while os.path.abspath(directory).startswith(root + os.sep):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break   # not empty
+        directory = os.path.dirname(directory)
+
+
+def _sibling_transcripts(transcript_path: str) -> list:
+    """Other transcript files of the same call next to transcript_path (its journal, a legacy .txt)."""
+    stem = os.path.basename(transcript_path).split(".", 1)[0]
+    return [path for path in glob.glob(os.path.join(os.path.dirname(transcript_path), glob.escape(stem) + ".*"))
+            if path != transcript_path]
+
+
+class MaintenanceJob:
+    """One worker's maintenance runs and their counters."""
+
+    def __init__(self, catalog: CallCatalog, transcripts_dir: str = TRANSCRIPTS_DIR, recordings_dir: str = RECORDINGS_DIR,
+                 sqlite_url: str = None, log=print, dry_run: bool = False):
+        self.catalog = catalog
+        self.transcripts_dir = transcripts_dir
+        self.recordings_dir = recordings_dir
+        self.sqlite_url = sqlite_url
+        self.log = log
+        self.dry_run = dry_run
+        self.running = False
+        self.last_run = None        # stats of the latest finished run
+
+    @staticmethod
+    def _cutoff(days: int) -> str:
+        return (datetime.now() - timedelta(days=days)).isoformat()
+
+    def expire_batch(self) -> int:
+        calls = self.catalog.expired(self._cutoff(RETENTION_SPAM_DAYS), self._cutoff(RETENTION_CALL_DAYS),
+                                     SPAM_ACTIONS, MAINTENANCE_BATCH)
+        for call in calls:
+            if self.dry_run:
+                self.log(f"Would delete {call['call_sid']}: {call['recording_path']}, {call['transcript_path']}")
+                continue
+            if call['recording_path']:
+                _remove(call['recording_path'], self.recordings_dir)
+            if call['transcript_path']:
+                for path in _sibling_transcripts(call['transcript_path']) + [call['transcript_path']]:
+                    _remove(path, self.transcripts_dir)
+        if calls and not self.dry_run:
+            self.catalog.delete([call['call_sid'] for call in calls])
+        return len(calls)
+
+    def compact_batch(self) -> dict:
+        calls = self.catalog.uncompacted(self._cutoff(COMPACT_AFTER_DAYS), MAINTENANCE_BATCH)
+        done = {"calls": len(calls), "transcoded": 0, "bytes_saved": 0, "transcripts_removed": 0}
+        for call in calls:
+            recording_path = call['recording_path']
+            if recording_path and os.path.exists(recording_path):
+                if self.dry_run:
+                    self.log(f"Would transcode {recording_path} to {COMPACT_FORMAT}")
+                else:
+                    size_before = os.path.getsize(recording_path)
+                    try:
+                        new_path = transcode_recording(recording_path, COMPACT_FORMAT)
+                    except Exception as e:
+                        self.log(f"⚠️ Maintenance: can't transcode {recording_path}: {e}")
+                        new_path = None
+                    if new_path:
+                        done["transcoded"] += 1
+                        done["bytes_saved"] += size_before - os.path.getsize(new_path)
+                        recording_path = new_path
+            transcript_path = call['transcript_path']
+            if transcript_path and transcript_path.endswith(".json") and os.path.exists(transcript_path):
+                for path in _sibling_transcripts(transcript_path):
+                    if self.dry_run:
+                        self.log(f"Would remove {path}")
+                    else:
+                        _remove(path, self.transcripts_dir)
+                    done["transcripts_removed"] += 1
+            if not self.dry_run:
+                self.catalog.mark_compacted(call['call_sid'], recording_path)
+        return done
+
+    def partials_batch(self) -> dict:
+        """Repair or remove one batch of stale .part recordings."""
+        cutoff = time.time() - PARTIAL_STALE_HOURS * 3600
+        stale = [path for path in find_call_files(self.recordings_dir, "call_*" + PARTIAL_SUFFIX)
+                 if os.path.getmtime(path) < cutoff][:MAINTENANCE_BATCH]
+        done = {"files": len(stale), "recovered": 0, "removed": 0, "failed": 0}
+        for path in stale:
+            final_path = path[:-len(PARTIAL_SUFFIX)]
+            if self.dry_run:
+                self.log(f"Would recover {path}")
+                continue
+            try:
+                if os.path.exists(final_path):
+                    raise FileExistsError(f"{final_path} already exists")
+                recovered = salvage_recording(path, final_path)
+            except Exception as e:
+                # It may still hold audio - set it aside (out of the next scan) rather than delete it
+                self.log(f"⚠️ Maintenance: can't recover {path}, keeping it as {path + FAILED_PARTIAL_SUFFIX}: {e}")
+                os.replace(path, path + FAILED_PARTIAL_SUFFIX)
+                done["failed"] += 1
+                continue
+            if recovered:
+                done["recovered"] += 1
+            else:
+                _remove(path, self.recordings_dir)   # no audio in it
+                done["removed"] += 1
+        return done
+
+    def voicemails_batch(self) -> int:
+        if not self.sqlite_url or self.dry_run:
+            return 0
+        from database.db_actions import delete_expired_rows   # needs sqlitecloud
+
+        def utc_cutoff(days):
+            return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return delete_expired_rows(self.sqlite_url, utc_cutoff(RETENTION_SPAM_DAYS), utc_cutoff(RETENTION_CALL_DAYS),
+                                   MAINTENANCE_BATCH)
+
+    def vacuum(self) -> dict:
+        if self.dry_run:
+            return {}
+        result = {"catalog": self.catalog.vacuum()}
+        if self.sqlite_url:
+            from database.db_actions import vacuum_db
+            vacuum_db(self.sqlite_url)
+            result["voicemails"] = "vacuumed"
+        return result
+
+    async def run(self, wait_idle=None) -> dict:
+        """
+        One maintenance run. wait_idle is awaited before every batch (the
+        server passes one that returns once no calls are active).
+        """
+        async def batch(fn):
+            if wait_idle:
+                await wait_idle()
+            return await asyncio.to_thread(fn)
+
+        self.running = True
+        started = time.time()
+        stats = {"expired": 0, "compacted": 0, "transcoded": 0, "bytes_saved": 0, "transcripts_removed": 0,
+                 "partials_recovered": 0, "partials_removed": 0, "partials_failed": 0, "voicemails_deleted": 0}
+        try:
+            while (expired := await batch(self.expire_batch)):
+                stats["expired"] += expired
+                if self.dry_run:
+                    break
+            while True:
+                done = await batch(self.compact_batch)
+                if not done["calls"]:
+                    break
+                stats["compacted"] += done["calls"]
+                for key in ("transcoded", "bytes_saved", "transcripts_removed"):
+                    stats[key] += done[key]
+                if self.dry_run:
+                    break
+            while True:
+                done = await batch(self.partials_batch)
+                stats["partials_recovered"] += done["recovered"]
+                stats["partials_removed"] += done["removed"]
+                stats["partials_failed"] += done["failed"]
+                if not done["files"] or self.dry_run:
+                    break
+            try:
+                while (deleted := await batch(self.voicemails_batch)) > 0:   # rowcount can be -1
+                    stats["voicemails_deleted"] += deleted
+            except Exception as e:
+                self.log(f"⚠️ Maintenance: voicemails table cleanup failed: {e}")
+            stats["vacuum"] = await batch(self.vacuum)
+        finally:
+            self.running = False
+        stats["seconds"] = round(time.time() - started, 1)
+        stats["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        self.last_run = stats
+        self.log(f"🧹 Maintenance {'dry run ' if self.dry_run else ''}done: {stats}")
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_hours": MAINTENANCE_INTERVAL_HOURS,
+            "retention_days": {"spam": RETENTION_SPAM_DAYS, "other": RETENTION_CALL_DAYS},
+            "compact_after_days": COMPACT_AFTER_DAYS,
+            "compact_format": COMPACT_FORMAT,
+            "last_run": self.last_run,
+        }
+
+
+def acquire_lock(path: str = MAINTENANCE_LOCK_PATH):
+    """
+    Take the cross-worker maintenance lock (an flock, held however long the
+    run takes and dropped by the OS if the process dies).
+
+    Returns:
+        The open lock file (pass it to release_lock), or None if another process holds it
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def release_lock(lock_file):
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()
+
+
+def last_run_time(path: str = MAINTENANCE_STATE_PATH) -> float:
+    """Unix time the latest run started (on any worker), 0 if it never ran."""
+    try:
+        with open(path) as f:
+            return float(f.read())
+    except (FileNotFoundError, ValueError):
+        return 0.0
+
+
+def record_run(started: float, path: str = MAINTENANCE_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    atomic_write_bytes(path, str(started).encode())
+
+
+def seconds_until_due() -> float:
+    """Seconds until the next scheduled run (<= 0 when it is due)."""
+    return last_run_time() + MAINTENANCE_INTERVAL_HOURS * 3600 - time.time()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Apply retention and compact old call data")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be deleted or compacted")
+    parser.add_argument("--db", default=CALL_CATALOG_PATH)
+    parser.add_argument("--transcripts", default=TRANSCRIPTS_DIR)
+    parser.add_argument("--recordings", default=RECORDINGS_DIR)
+    args = parser.parse_args()
+
+    lock = acquire_lock()
+    if not lock:
+        raise SystemExit(f"Maintenance is already running ({MAINTENANCE_LOCK_PATH})")
+    try:
+        catalog = CallCatalog(args.db)
+        job = MaintenanceJob(catalog, args.transcripts, args.recordings, os.getenv("SQLITECLOUD_URL"), dry_run=args.dry_run)
+        started = time.time()
+        asyncio.run(job.run())
+        if not args.dry_run:
+            record_run(started)
+        catalog.close()
+    finally:
+        release_lock(lock)
@@ -0,0 +1,219 @@
+"""
+In-process latency metrics: fixed-bucket histograms, an event-loop lag gauge
+and a slow-callback sampler.
+
+Histograms are cheap enough to observe on every job (one bisect and a few
+adds) and give count / mean / max plus bucket-interpolated percentiles.
+LoopLagMonitor sleeps LOOP_LAG_INTERVAL_MS at a time on the event loop and
+records how late each wake-up is; anything that blocks the loop (inline
+resampling, a slow callback) shows up there as lag for every call.
+
+The lag gauge says *that* the loop was blocked; SlowCallbackSampler says
+*where*. A watchdog thread notices when the probe hasn't ticked for
+SLOW_CALLBACK_MS and samples the loop thread's stack (sys._current_frames)
+every SLOW_CALLBACK_SAMPLE_MS until it ticks again. Each block is recorded
+with its duration, the most frequent stack and the innermost frame in our own
+code, and blocks are totalled per site.
+"""
+import asyncio
+import bisect
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+
+LOOP_LAG_INTERVAL_MS = int(os.getenv("LOOP_LAG_INTERVAL_MS", "20"))   # one media frame
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "100"))           # loop blocked this long gets stack-sampled
+SLOW_CALLBACK_SAMPLE_MS = 10     # watchdog poll / stack sample interval
+SLOW_CALLBACK_KEEP = 20          # recent blocks kept with their stacks
+SLOW_CALLBACK_STACK_DEPTH = 12   # innermost frames kept per stack sample
+LOOP_LAG_SMOOTHING = 0.05    # EWMA weight of each probe (~20 probes = 0.4 s memory)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    """Latency histogram with fixed upper bounds (ms); the last bucket is open-ended."""
+
+    def __init__(self, buckets_ms: tuple = LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q: float) -> float:
+        """Approximate q-quantile (0-1), interpolated linearly inside the bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets_ms[i - 1] if i else 0.0
+                high = self.buckets_ms[i] if i < len(self.buckets_ms) else self.max_ms
+                return min(low + (high - low) * (rank - seen) / n, self.max_ms)
+            seen += n
+        return self.max_ms
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.5), 2),
+            "p95_ms": round(self.percentile(0.95), 2),
+            "p99_ms": round(self.percentile(0.99), 2),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {f"le_{bound}": n for bound, n in zip(self.buckets_ms, self.counts)} | {"inf": self.counts[-1]},
+        }
+
+
+class LoopLagMonitor:
+    """Measures event-loop scheduling lag: how late a sleep(interval) wakes up."""
+
+    def __init__(self, interval_ms: int = LOOP_LAG_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self.histogram = Histogram()
+        self.last_ms = 0.0
+        self.smoothed_ms = 0.0       # EWMA, for load decisions that shouldn't react to a single hiccup
+        self.last_tick = 0.0         # time.monotonic() of the latest wake-up (read by SlowCallbackSampler)
+        self._task = None
+
+    async def _run(self):
+        interval = self.interval_ms / 1000
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.last_tick = time.monotonic()
+            self.last_ms = max((time.perf_counter() - start - interval) * 1000, 0.0)
+            self.histogram.observe(self.last_ms)
+            self.smoothed_ms += LOOP_LAG_SMOOTHING * (self.last_ms - self.smoothed_ms)
+
+    def start(self):
+        """Start probing on the running loop (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"interval_ms": self.interval_ms, "current_ms": round(self.last_ms, 2), "smoothed_ms": round(self.smoothed_ms, 2), **self.histogram.stats()}
+
+
+
+_CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_own_code(filename: str) -> bool:
+    return filename.startswith(_CODE_DIR) and "site-packages" not in filename
+
+
+class SlowCallbackSampler:
+    """Watchdog thread that stack-samples the event loop thread while it is blocked."""
+
+    def __init__(self, monitor: LoopLagMonitor, threshold_ms: float = SLOW_CALLBACK_MS,
+                 sample_ms: float = SLOW_CALLBACK_SAMPLE_MS, keep: int = SLOW_CALLBACK_KEEP, log=print):
+        self.monitor = monitor
+        self.threshold_ms = threshold_ms
+        self.sample_ms = sample_ms
+        self.log = log
+        self.recent = deque(maxlen=keep)
+        self.by_site = {}            # site -> {"count", "total_ms", "max_ms"}
+        self.blocks = 0
+        self._loop_thread = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start watching the calling thread's event loop (call from the loop thread)."""
+        if self._thread is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-callback-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        samples = []
+        block_tick = None
+        while not self._stop.wait(self.sample_ms / 1000):
+            tick = self.monitor.last_tick
+            if not tick:
+                continue
+            if samples and tick != block_tick:
+                # The probe ticked again: the block is over
+                try:
+                    self._record(samples, (tick - block_tick) * 1000 - self.monitor.interval_ms)
+                except Exception as e:
+                    self.log(f"⚠️ Slow-callback sampler failed to record a block: {e}")
+                samples = []
+            blocked_ms = (time.monotonic() - tick) * 1000 - self.monitor.interval_ms
+            if blocked_ms >= self.threshold_ms:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    samples.append(tuple((f.filename, f.lineno, f.name)
+                                         for f in traceback.extract_stack(frame)[-SLOW_CALLBACK_STACK_DEPTH:]))
+                    block_tick = tick
+                del frame
+
+    @staticmethod
+    def _site(stack: tuple) -> str:
+        """Innermost frame in our own code (what to fix), else the innermost frame."""
+        own = [f for f in stack if _is_own_code(f[0])]
+        filename, lineno, name = own[-1] if own else stack[-1]
+        return f"{os.path.basename(filename)}:{lineno} {name}"
+
+    def _record(self, samples: list, blocked_ms: float):
+        stack, hits = Counter(samples).most_common(1)[0]
+        sites = Counter(self._site(sample) for sample in samples)
+        shares = {site: round(n / len(samples), 2) for site, n in sites.most_common()}
+        event = {
+            "at": datetime.now().isoformat(timespec="milliseconds"),
+            "blocked_ms": round(blocked_ms, 1),
+            "site": self._site(stack),
+            "sites": shares,             # share of samples per site (a block can span several steps)
+            "samples": len(samples),
+            "stack": [f"{os.path.basename(filename)}:{lineno} {name}" for filename, lineno, name in stack],
+        }
+        with self._lock:
+            self.blocks += 1
+            self.recent.append(event)
+            for site, n in sites.items():
+                site_ms = blocked_ms * n / len(samples)
+                totals = self.by_site.setdefault(site, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                totals["count"] += 1
+                totals["total_ms"] += site_ms
+                totals["max_ms"] = max(totals["max_ms"], site_ms)
+        self.log(f"🐢 Event loop blocked {blocked_ms:.0f}ms - {', '.join(f'{site} {share:.0%}' for site, share in shares.items())}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            sites = sorted(self.by_site.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+            return {
+                "threshold_ms": self.threshold_ms,
+                "blocks": self.blocks,
+                "by_site": {site: {"count": t["count"], "total_ms": round(t["total_ms"], 1), "max_ms": round(t["max_ms"], 1)}
+                            for site, t in sites},
+                "recent": list(self.recent),
+            }
+
+
+loop_lag = LoopLagMonitor()
+slow_callbacks = SlowCallbackSampler(loop_lag)
@@ -0,0 +1,69 @@
+"""
+Move recordings and transcripts from the old flat directories into the sharded
+layout (see storage.py), then rebuild the call catalog so it points at the
+new paths (summaries are kept).
+
+Files are moved with a rename, so each one is either at its old path or its
+new one, and the tool can be re-run after an interruption. Files that aren't
+call files, or whose target already exists, are left in place.
+
+Usage:
+    python migrate_storage.py [--dry-run] [--recordings recordings] [--transcripts transcripts]
+"""
+import argparse
+import os
+import time
+
+from call_catalog import CALL_CATALOG_PATH, RECORDINGS_DIR, CallCatalog
+from storage import PARTIAL_SUFFIX, TMP_SUFFIX, call_file, parse_call_file
+from transcript_journal import TRANSCRIPTS_DIR
+
+
+def migrate_directory(root: str, prefix: str, dry_run: bool = False):
+    """
+    Move root/<prefix>*.* into root/YYYY/MM/DD/<call_sid>/.
+
+    Returns:
+        tuple: (files moved, files skipped)
+    """
+    moved = skipped = 0
+    if not os.path.isdir(root):
+        return moved, skipped
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if not entry.is_file() or entry.name.endswith((PARTIAL_SUFFIX, TMP_SUFFIX)):
+            continue
+        parsed = parse_call_file(entry.name, prefix)
+        if not parsed:
+            continue
+        call_sid, call_start_time = parsed
+        ext = entry.name[entry.name.index("."):] if "." in entry.name else ""
+        target = call_file(root, prefix, call_sid, call_start_time, ext)
+        if os.path.exists(target):
+            print(f"⚠️ Skipping {entry.path}: {target} already exists")
+            skipped += 1
+            continue
+        if not dry_run:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(entry.path, target)
+        moved += 1
+        print(f"{'Would move' if dry_run else '✅'} {entry.path} -> {target}")
+    return moved, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move call files into the sharded YYYY/MM/DD/<call_sid>/ layout")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be moved")
+    parser.add_argument("--recordings", default=RECORDINGS_DIR)
+    parser.add_argument("--transcripts", default=TRANSCRIPTS_DIR)
+    parser.add_argument("--db", default=CALL_CATALOG_PATH)
+    args = parser.parse_args()
+
+    start = time.time()
+    recordings = migrate_directory(args.recordings, "call_", args.dry_run)
+    transcripts = migrate_directory(args.transcripts, "transcript_", args.dry_run)
+    print(f"{'Would move' if args.dry_run else 'Moved'} {recordings[0]} recording(s) and {transcripts[0]} transcript file(s) "
+          f"in {time.time() - start:.1f}s ({recordings[1] + transcripts[1]} skipped)")
+    if not args.dry_run:
+        catalog = CallCatalog(args.db)
+        catalog.rebuild(args.transcripts, args.recordings)
+        catalog.close()
@@ -0,0 +1,196 @@
+"""
+Pre-encoded Twilio payload cache for fixed prompts (greeting, hold lines).
+
+Each prompt is stored once as ready-to-send media message text: split into
+PROMPT_CHUNK_MS chunks, μ-law encoded, base64'd and serialized, minus the
+streamSid. Sending a cached prompt is one string concat per message:
+
+    MESSAGE_PREFIX + stream_sid + suffix
+
+All prompts live in one file that every worker process memory-maps read-only,
+so the OS page cache holds a single shared copy: a prompt's PCM is served as a
+memoryview into the map, and its message suffixes are decoded once per
+process. The file is replaced atomically (temp file + rename) under an flock
+when prompts are added, so concurrent writers don't drop each other's
+prompts; readers pick up the new file on their next lookup.
+
+File layout: MAGIC, 8-byte little-endian index length, JSON index, data.
+The index maps prompt name -> {"pcm": [offset, length], "chunks": [[offset, length], ...],
+"duration_ms": ..., "meta": {...}} with offsets into the data section.
+"""
+import audioop
+import base64
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+
+PROMPT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", "prompt-cache/prompts.bin")
+PROMPT_CHUNK_MS = 100        # audio per media message (matches the live TTS path)
+SAMPLE_RATE = 8000
+MAGIC = b"TWPROMPT1\n"
+MESSAGE_PREFIX = '{"event": "media", "streamSid": "'
+
+
+def prompt_key(text: str, emotion: str, voice: str) -> str:
+    """
+    Stable cache name for a TTS prompt: changes when the text, emotion or voice
+    change. voice should identify the voice by content (e.g. a hash of the clone
+    reference), not by a file path that can be overwritten.
+    """
+    return hashlib.sha1(f"{text}|{emotion}|{voice}".encode("utf-8")).hexdigest()[:16]
+
+
+# json.dumps of a media message split around its payload (base64 needs no escaping)
+PAYLOAD_HEAD, PAYLOAD_TAIL = json.dumps(
+    {"event": "media", "streamSid": "", "media": {"payload": "|"}})[len(MESSAGE_PREFIX):].split("|")
+
+
+def encode_chunks(pcm16_8k: bytes, chunk_ms: int = PROMPT_CHUNK_MS, ulaw: bytes = None) -> list:
+    """
+    PCM16 8 kHz -> media message suffixes (everything after the streamSid value).
+    Pass ulaw (the same audio already μ-law encoded, e.g. by dsp.ulaw_encode)
+    to skip the audioop conversion.
+    """
+    if ulaw is None:
+        ulaw = audioop.lin2ulaw(pcm16_8k, 2)
+    chunk_bytes = SAMPLE_RATE * chunk_ms // 1000
+    suffixes = []
+    for i in range(0, len(ulaw), chunk_bytes):
+        chunk = ulaw[i:i + chunk_bytes]
+        if len(chunk) < 2:  # Need at least 2 samples
+            continue
+        suffixes.append(PAYLOAD_HEAD + base64.b64encode(chunk).decode("ascii") + PAYLOAD_TAIL)
+    return suffixes
+
+
+class CachedPrompt:
+    """A prompt's PCM (for recording/echo reference; bytes or a memoryview into the cache file) and its pre-encoded message suffixes."""
+
+    def __init__(self, name: str, pcm16_8k, suffixes: list, duration_ms: int, meta: dict):
+        self.name = name
+        self.pcm16_8k = pcm16_8k
+        self.suffixes = suffixes
+        self.duration_ms = duration_ms
+        self.meta = meta
+
+    def messages(self, stream_sid: str):
+        """Ready-to-send media messages for one stream."""
+        head = MESSAGE_PREFIX + stream_sid
+        for suffix in self.suffixes:
+            yield head + suffix
+
+
+class PromptCache:
+    """Read-mostly prompt store memory-mapped from a single file."""
+
+    def __init__(self, path: str = PROMPT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mm = None
+        self._index = {}
+        self._data_start = 0
+        self._stat = None            # (inode, mtime_ns, size) of the mapped file
+        self._loaded = {}            # name -> CachedPrompt decoded from the current map
+        self.hits = 0
+        self.misses = 0
+
+    def _refresh(self):
+        """Map the current file if it changed since the last lookup (another process may have added prompts)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp == self._stat:
+            return
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(MAGIC)] != MAGIC:
+            mm.close()
+            raise ValueError(f"{self.path} is not a prompt cache file")
+        (index_len,) = struct.unpack_from("<Q", mm, len(MAGIC))
+        index_start = len(MAGIC) + 8
+        self._index = json.loads(mm[index_start:index_start + index_len])
+        self._data_start = index_start + index_len
+        # The previous map isn't closed: prompts handed out still hold memoryviews into it,
+        # and it is unmapped once the last of them is gone
+        self._mm = mm
+        self._stat = stamp
+        self._loaded = {}
+
+    def _load(self, name: str, entry: dict) -> CachedPrompt:
+        """The prompt from the current map: PCM as a shared memoryview, suffixes decoded on first use."""
+        cached = self._loaded.get(name)
+        if cached is None:
+            view, base = memoryview(self._mm), self._data_start
+            offset, length = entry["pcm"]
+            pcm16_8k = view[base + offset:base + offset + length]
+            suffixes = [str(view[base + o:base + o + n], "ascii") for o, n in entry["chunks"]]
+            cached = self._loaded[name] = CachedPrompt(name, pcm16_8k, suffixes, entry["duration_ms"], entry.get("meta", {}))
+        return cached
+
+    def get(self, name: str):
+        """Return the CachedPrompt for name, or None."""
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._load(name, entry)
+
+    def put(self, name: str, pcm16_8k: bytes, meta: dict = None, suffixes: list = None) -> CachedPrompt:
+        """
+        Store a prompt (encoding it unless suffixes are given), rewriting the cache
+        file atomically. Blocking (file I/O) - call it off the event loop.
+        """
+        suffixes = suffixes if suffixes is not None else encode_chunks(pcm16_8k)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Read-modify-write of a file shared by every worker: hold the lock from reading the
+        # current prompts until the new file is in place, or a concurrent put() loses its prompt
+        with open(self.path + ".lock", "a") as lock_file, self._lock:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._refresh()
+            prompts = {}
+            for key, entry in self._index.items():
+                cached = self._load(key, entry)
+                prompts[key] = (cached.pcm16_8k, cached.suffixes, cached.meta)
+            prompts[name] = (pcm16_8k, suffixes, meta or {})
+            self._write(prompts)
+        return CachedPrompt(name, pcm16_8k, suffixes, len(pcm16_8k) * 1000 // (SAMPLE_RATE * 2), meta or {})
+
+    def _write(self, prompts: dict):
+        """Write {name: (pcm, suffixes, meta)} as the new cache file (temp file + rename)."""
+        index, blobs, offset = {}, [], 0
+        for key, (pcm, chunk_suffixes, chunk_meta) in prompts.items():
+            entry = {"pcm": [offset, len(pcm)], "chunks": [],
+                     "duration_ms": len(pcm) * 1000 // (SAMPLE_RATE * 2), "meta": chunk_meta}
+            blobs.append(pcm)
+            offset += len(pcm)
+            for suffix in chunk_suffixes:
+                data = suffix.encode("ascii")
+                entry["chunks"].append([offset, len(data)])
+                blobs.append(data)
+                offset += len(data)
+            index[key] = entry
+        index_bytes = json.dumps(index).encode("utf-8")
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(index_bytes)))
+            f.write(index_bytes)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> dict:
+        return {"path": self.path, "prompts": len(self._index), "hits": self.hits, "misses": self.misses}
+
+
+prompt_cache = PromptCache()
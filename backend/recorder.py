@@ -0,0 +1,250 @@
+"""
+Buffered stereo call recorder.
+
+Caller audio goes to the left channel and bot audio to the right channel.
+Both tracks are placed on one sample-accurate timeline: caller frames by
+Twilio's media.timestamp, bot audio by the time it was sent. Gaps are filled
+with silence. Finished audio is batched into large blocks, interleaved with
+NumPy in one operation per block, and written to disk by a dedicated writer
+thread behind a bounded queue so the asyncio event loop never touches the file.
+The file is written as <path>.part and renamed to <path> once it is complete.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from database.wav_bytes import open_recording_writer
+from storage import PARTIAL_SUFFIX
+
+RECORDING_SAMPLE_RATE = 8000   # native PSTN rate
+RECORDER_BLOCK_MS = 1000       # audio batched per block handed to the writer thread
+RECORDER_QUEUE_BLOCKS = 30     # bounded writer queue depth (blocks); full queue drops blocks
+MIXER_HOLD_MS = 500            # keep this much audio behind the caller watermark for late frames
+
+
+def interleave_stereo(left: bytes, right: bytes) -> bytes:
+    """
+    Interleave two mono PCM16 buffers into one stereo PCM16 buffer (L, R, L, R, ...).
+    The shorter channel is padded with silence.
+    """
+    left_samples = np.frombuffer(left, dtype="<i2")
+    right_samples = np.frombuffer(right, dtype="<i2")
+    stereo = np.zeros((max(len(left_samples), len(right_samples)), 2), dtype="<i2")
+    stereo[:len(left_samples), 0] = left_samples
+    stereo[:len(right_samples), 1] = right_samples
+    return stereo.tobytes()
+
+
+class TimelineMixer:
+    """
+    Places caller and bot PCM16 audio on a shared timeline measured in samples
+    from the start of the media stream. Unwritten positions are silence.
+    """
+
+    def __init__(self, sample_rate: int = RECORDING_SAMPLE_RATE, hold_ms: int = MIXER_HOLD_MS):
+        self.sample_rate = sample_rate
+        self.hold_samples = sample_rate * hold_ms // 1000
+        self._base = 0                 # timeline sample index of _left[0] / _right[0]
+        self._left = bytearray()
+        self._right = bytearray()
+        self._caller_end = 0           # furthest caller sample placed so far (watermark)
+        self._bot_end = 0              # bot audio plays back-to-back, so it never overlaps itself
+        self.late_caller_samples = 0   # caller audio that arrived after its slot was flushed
+
+    def ms_to_samples(self, ms: float) -> int:
+        return int(round(ms * self.sample_rate / 1000))
+
+    @staticmethod
+    def _place(track: bytearray, base: int, start: int, pcm: bytes):
+        offset = (start - base) * 2
+        end = offset + len(pcm)
+        if len(track) < end:
+            track.extend(bytes(end - len(track)))
+        track[offset:end] = pcm
+
+    def add_caller(self, pcm: bytes, timestamp_ms: float):
+        """Place a caller frame at its Twilio media timestamp (ms since stream start)."""
+        start = self.ms_to_samples(timestamp_ms)
+        if start < self._base:
+            skip = self._base - start
+            self.late_caller_samples += min(skip, len(pcm) // 2)
+            pcm = pcm[skip * 2:]
+            start = self._base
+        if not pcm:
+            return
+        self._place(self._left, self._base, start, pcm)
+        self._caller_end = max(self._caller_end, start + len(pcm) // 2)
+
+    def add_bot(self, pcm: bytes, at_ms: float) -> int:
+        """
+        Place bot audio sent at at_ms (ms since stream start). Twilio queues outbound
+        media, so audio sent while earlier audio is still playing starts after it.
+        Returns the timeline sample where playback starts.
+        """
+        start = max(self.ms_to_samples(at_ms), self._bot_end, self._base)
+        if pcm:
+            self._place(self._right, self._base, start, pcm)
+            self._bot_end = start + len(pcm) // 2
+        return start
+
+    def pop_ready(self, final: bool = False) -> tuple[bytes, bytes]:
+        """
+        Remove and return (left, right) audio that can no longer change: everything
+        older than the caller watermark minus the hold window, or everything if final.
+        """
+        if final:
+            upto = max(self._caller_end, self._bot_end)
+        else:
+            upto = self._caller_end - self.hold_samples
+        count = upto - self._base
+        if count <= 0:
+            return b"", b""
+        nbytes = count * 2
+        left = bytes(self._left[:nbytes]).ljust(nbytes, b"\x00")
+        right = bytes(self._right[:nbytes]).ljust(nbytes, b"\x00")
+        del self._left[:nbytes]
+        del self._right[:nbytes]
+        self._base = upto
+        return left, right
+
+    def caller_end_ms(self) -> float:
+        return self._caller_end * 1000 / self.sample_rate
+
+    def ready_samples(self) -> int:
+        """Samples pop_ready would return now (bot audio queued ahead of the caller doesn't count)."""
+        return self._caller_end - self.hold_samples - self._base
+
+
+class CallRecorder:
+    """
+    Stereo recorder (Left=Caller, Right=Bot) with off-loop disk writes.
+    fmt selects the storage format: "pcm" (16-bit WAV), "mulaw" (G.711 WAV) or "flac".
+    """
+
+    def __init__(self, path: str, fmt: str = "pcm", sample_rate: int = RECORDING_SAMPLE_RATE,
+                 block_ms: int = RECORDER_BLOCK_MS, queue_blocks: int = RECORDER_QUEUE_BLOCKS):
+        self.path = path
+        self.fmt = fmt
+        self.sample_rate = sample_rate
+        self.block_samples = sample_rate * block_ms // 1000
+        self.mixer = TimelineMixer(sample_rate)
+        self._queue = queue.Queue(maxsize=queue_blocks)
+        self._closed = False
+        self._stream_t0 = None         # monotonic time of media timestamp 0
+
+        # Bot playback segments on the timeline, for latency analysis
+        self.bot_segments = []
+
+        # Counters (written by both threads, read via stats())
+        self.blocks_written = 0
+        self.blocks_dropped = 0
+        self.frames_written = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+        self._thread = threading.Thread(target=self._writer_loop, name=f"recorder:{path}", daemon=True)
+        self._thread.start()
+
+    def stream_time_ms(self) -> float:
+        """Current position on the media stream clock (ms since media timestamp 0)."""
+        if self._stream_t0 is None:
+            return 0.0
+        return (time.monotonic() - self._stream_t0) * 1000
+
+    def add_caller(self, caller_pcm: bytes, timestamp_ms: float = None):
+        """
+        Record one inbound caller frame (PCM16) at its Twilio media timestamp.
+        Frames without a timestamp are appended after the latest caller audio.
+        """
+        if self._closed:
+            return
+        if timestamp_ms is None:
+            timestamp_ms = self.mixer.caller_end_ms()
+        if self._stream_t0 is None:
+            # Anchor the stream clock on the first frame so bot send times share its origin
+            self._stream_t0 = time.monotonic() - timestamp_ms / 1000
+        self.mixer.add_caller(caller_pcm, timestamp_ms)
+        if self.mixer.ready_samples() >= self.block_samples:
+            self._flush_block()
+
+    def add_bot(self, bot_pcm: bytes, at_ms: float = None):
+        """
+        Record bot audio (PCM16) sent to Twilio at at_ms on the stream clock (default: now).
+        Returns the timeline sample where its playback starts (None if not recorded).
+        """
+        if self._closed or not bot_pcm:
+            return None
+        if at_ms is None:
+            at_ms = self.stream_time_ms()
+        start = self.mixer.add_bot(bot_pcm, at_ms)
+        self.bot_segments.append({
+            "sent_ms": round(at_ms, 1),
+            "start_ms": round(start * 1000 / self.sample_rate, 1),
+            "duration_ms": round(len(bot_pcm) * 500 / self.sample_rate, 1),
+        })
+        return start
+
+    def _flush_block(self, final: bool = False):
+        left, right = self.mixer.pop_ready(final=final)
+        if not left:
+            return
+        stereo = interleave_stereo(left, right)
+        try:
+            self._queue.put_nowait((time.monotonic(), stereo))
+        except queue.Full:
+            # Disk can't keep up - drop rather than stall the event loop
+            self.blocks_dropped += 1
+
+    def _writer_loop(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        partial_path = self.path + PARTIAL_SUFFIX
+        writer = open_recording_writer(partial_path, self.fmt, 2, self.sample_rate)  # Stereo (Left=Caller, Right=Bot)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                queued_at, stereo = item
+                writer.writeframes(stereo)
+                self.blocks_written += 1
+                self.frames_written += len(stereo) // 4
+                self.last_lag_ms = (time.monotonic() - queued_at) * 1000
+                self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+        finally:
+            writer.close()
+            with open(partial_path, "rb") as f:
+                os.fsync(f.fileno())   # a rename alone can leave an empty file after a power loss
+            os.replace(partial_path, self.path)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Flush buffered audio, stop the writer thread and finalize the file header.
+        Blocks until the writer finishes - call it off the event loop.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._flush_block(final=True)
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass  # Writer thread is stuck or gone - nothing more we can do
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Writer lag and drop counters for logging/metrics."""
+        return {
+            "path": self.path,
+            "format": self.fmt,
+            "blocks_written": self.blocks_written,
+            "blocks_dropped": self.blocks_dropped,
+            "late_caller_ms": round(self.mixer.late_caller_samples * 1000 / self.sample_rate, 1),
+            "bot_segments": len(self.bot_segments),
+            "queue_depth": self._queue.qsize(),
+            "seconds_written": round(self.frames_written / self.sample_rate, 2),
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
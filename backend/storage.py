@@ -0,0 +1,79 @@
+"""
+On-disk layout for call files.
+
+Recordings and transcripts are sharded by call start date and call:
+
+    recordings/YYYY/MM/DD/<CallSid>/call_<CallSid>_<YYYYmmdd_HHMMSS>.wav
+    transcripts/YYYY/MM/DD/<CallSid>/transcript_<CallSid>_<YYYYmmdd_HHMMSS>.json
+
+so no directory grows past one day of calls, and one call's files sit
+together. File names keep the call SID and start time, so a file still says
+what it is when moved around, and scans (catalog rebuild, transcoding) read
+both this layout and the old flat one.
+
+Files are never written in place: finished files are written to a temporary
+name next to the target, fsynced and renamed over it, and a recording is
+written as <name>.part until its recorder closes. A crash leaves either the
+old file or the new one, never half of one. (The JSONL journal is the
+exception - it is append-only and its reader skips a torn last line.)
+
+Move files from the flat layout with:
+
+    python migrate_storage.py [--dry-run]
+"""
+import glob
+import json
+import os
+from datetime import datetime
+
+PARTIAL_SUFFIX = ".part"    # recording still being written
+TMP_SUFFIX = ".tmp"         # atomic write in progress
+
+
+def call_dir(root: str, call_sid: str, call_start_time: datetime) -> str:
+    """root/YYYY/MM/DD/<call_sid>"""
+    return os.path.join(root, call_start_time.strftime("%Y"), call_start_time.strftime("%m"),
+                        call_start_time.strftime("%d"), call_sid)
+
+
+def call_file(root: str, prefix: str, call_sid: str, call_start_time: datetime, ext: str) -> str:
+    """Path of a call's file: root/YYYY/MM/DD/<call_sid>/<prefix><call_sid>_<YYYYmmdd_HHMMSS><ext>"""
+    name = f"{prefix}{call_sid}_{call_start_time.strftime('%Y%m%d_%H%M%S')}{ext}"
+    return os.path.join(call_dir(root, call_sid, call_start_time), name)
+
+
+def parse_call_file(path: str, prefix: str):
+    """(call_sid, start time) from a call file name, or None if it isn't one."""
+    stem = os.path.basename(path).split(".", 1)[0]
+    if not stem.startswith(prefix):
+        return None
+    try:
+        call_sid, date, clock = stem[len(prefix):].rsplit("_", 2)
+        return call_sid, datetime.strptime(f"{date}_{clock}", "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def find_call_files(root: str, pattern: str) -> list:
+    """Files matching pattern in the sharded layout and the old flat one."""
+    return glob.glob(os.path.join(root, "**", pattern), recursive=True)
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Write data to path via a fsynced temp file and rename."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}{TMP_SUFFIX}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, data, indent: int = 2):
+    atomic_write_bytes(path, json.dumps(data, indent=indent, ensure_ascii=False).encode("utf-8"))
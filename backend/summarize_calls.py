@@ -0,0 +1,77 @@
+"""
+Backfill call summaries: summarize every finished call in the catalog whose
+transcript has no summary yet (or changed since it was summarized).
+
+Needs BOSONAI_API_KEY2 (the Qwen key) and prompts.json, like the server.
+
+Usage:
+    python summarize_calls.py [--concurrency 4] [--limit N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import openai
+
+from call_catalog import CALL_CATALOG_PATH, CallCatalog
+from call_summary import BOSONAI_BASE_URL, CallSummarizer
+from transcript_journal import load_transcript
+
+SUMMARY_BACKFILL_CONCURRENCY = 4   # summaries in flight at once
+
+
+async def backfill(catalog: CallCatalog, summarizer: CallSummarizer, concurrency: int = SUMMARY_BACKFILL_CONCURRENCY,
+                   limit: int = None):
+    """
+    Returns:
+        tuple: (calls summarized, calls that failed)
+    """
+    stale = await asyncio.to_thread(catalog.stale_summaries, limit)
+    print(f"{len(stale)} call(s) need a summary (concurrency {concurrency})")
+    semaphore = asyncio.Semaphore(concurrency)
+    done = failed = 0
+
+    async def summarize(call_sid, path):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                transcript = await asyncio.to_thread(load_transcript, path)
+                summary = await summarizer.summarize(catalog, call_sid, transcript.get("conversation", []))
+            except Exception as e:
+                summary = None
+                print(f"⚠️ {call_sid}: {e}")
+            if summary:
+                done += 1
+                print(f"✅ {call_sid}: {summary}")
+            else:
+                failed += 1
+
+    await asyncio.gather(*(summarize(call_sid, path) for call_sid, path in stale))
+    return done, failed
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Summarize past calls that have no current summary")
+    parser.add_argument("--concurrency", type=int, default=SUMMARY_BACKFILL_CONCURRENCY)
+    parser.add_argument("--limit", type=int, default=None, help="Newest N calls only")
+    parser.add_argument("--db", default=CALL_CATALOG_PATH)
+    parser.add_argument("--prompts", default="prompts.json")
+    args = parser.parse_args()
+
+    api_key = os.getenv("BOSONAI_API_KEY2")
+    if not api_key:
+        raise SystemExit("BOSONAI_API_KEY2 is not set")
+    with open(args.prompts, encoding="utf-8") as f:
+        prompts = json.load(f)
+    summarizer = CallSummarizer(openai.Client(api_key=api_key, base_url=BOSONAI_BASE_URL), prompts)
+
+    start = time.time()
+    catalog = CallCatalog(args.db)
+    done, failed = asyncio.run(backfill(catalog, summarizer, args.concurrency, args.limit))
+    catalog.close()
+    print(f"Summarized {done} call(s) in {time.time() - start:.1f}s ({failed} failed)")
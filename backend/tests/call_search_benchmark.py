@@ -0,0 +1,103 @@
+"""
+Call search latency over a large catalog.
+
+Fills a temporary catalog with CALLS synthetic finished calls (a few turns
+each, random names, numbers, topics and emotions, half of them summarized),
+then times search() for common words, rare words, multi-word queries, number
+prefixes and deep pages, newest first and by relevance.
+
+Usage (from backend/):
+    python tests/call_search_benchmark.py
+    python tests/call_search_benchmark.py 20000     # calls
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from call_catalog import CallCatalog
+from metrics import Histogram
+from transcript_journal import build_transcript, transcript_hash
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+REPEATS = 20
+
+NAMES = ["Alice Chen", "Bob Martin", "Carla Diaz", "Dev Patel", "Erin Walsh", "Farid Khan", "Grace Liu", "Hugo Silva"]
+TOPICS = ["the hackathon schedule", "a car warranty", "a job interview", "the invoice from March", "a package delivery",
+          "meeting next Tuesday", "your credit card account", "the project demo", "a dentist appointment"]
+EMOTIONS = ["calm", "happy", "frustrated", "anxious", "neutral", "excited"]
+WORDS = ("please call me back when you get a chance it is about something important thanks so much "
+         "the deadline moved and we need to talk before friday").split()
+
+
+def synthetic_transcript(rng: random.Random, i: int, start: datetime) -> dict:
+    name, topic = rng.choice(NAMES), rng.choice(TOPICS)
+    conversation = [{"speaker": "AI Receptionist", "text": "Hello, you've reached the receptionist. How can I help?",
+                     "timestamp": start.isoformat(), "emotion_used": "friendly"}]
+    conversation.append({"speaker": "Caller", "duration_ms": 3000, "audio_size_bytes": 24000,
+                         "text": f"Hi, this is {name}, I'm calling about {topic}. " + " ".join(rng.sample(WORDS, 8)),
+                         "emojis": [], "detected_emotion": rng.choice(EMOTIONS)})
+    for _ in range(rng.randint(1, 4)):
+        conversation.append({"speaker": "AI Receptionist", "text": "Thanks, " + " ".join(rng.sample(WORDS, 10)),
+                             "timestamp": start.isoformat(), "emotion_used": rng.choice(EMOTIONS)})
+        conversation.append({"speaker": "Caller", "duration_ms": 2000, "audio_size_bytes": 16000,
+                             "text": " ".join(rng.sample(WORDS, 12)), "emojis": [], "detected_emotion": rng.choice(EMOTIONS)})
+    transcript = build_transcript(f"CA{i:032x}", f"+1{rng.randint(2000000000, 9999999999)}", conversation, start,
+                                  start + timedelta(seconds=rng.randint(20, 300)), rng.choice(["FORWARD", "END", None]))
+    return transcript
+
+
+def main():
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp(prefix="call-search-")
+    catalog = CallCatalog(os.path.join(directory, "calls.sqlite"))
+
+    start = time.perf_counter()
+    base = datetime(2025, 1, 1)
+    numbers = []
+    for i in range(CALLS):
+        call_start = base + timedelta(minutes=7 * i)
+        transcript = synthetic_transcript(rng, i, call_start)
+        call_sid = transcript["call_sid"]
+        path = f"transcripts/transcript_{call_sid}.json"
+        catalog.call_started(call_sid, transcript["from_number"], call_start, path)
+        catalog.call_ended(call_sid, transcript, path)
+        if i % 2:
+            catalog.set_summary(call_sid, f"{transcript['conversation'][1]['text'][:60]} - wants a call back",
+                                transcript_hash(transcript["conversation"]))
+        if i % 1000 == 0:
+            numbers.append(transcript["from_number"][2:8])
+    print(f"Indexed {CALLS} calls in {time.perf_counter() - start:.1f}s "
+          f"({os.path.getsize(catalog.path) / 1e6:.0f} MB + WAL)")
+
+    queries = [
+        ("common word", "please", 0),
+        ("name", "grace liu", 0),
+        ("topic phrase", "car warranty", 0),
+        ("emotion + word", "frustrated deadline", 0),
+        ("prefix", "interv", 0),
+        ("number prefix", numbers[len(numbers) // 2], 0),
+        ("rare (no hits)", "zyzzyva", 0),
+        ("page 50", "invoice", 50 * 20),
+    ]
+    for order in ("recent", "relevance"):
+        print(f"order={order}")
+        for label, text, offset in queries:
+            latency = Histogram()
+            for _ in range(REPEATS):
+                t0 = time.perf_counter()
+                results = catalog.search(text, 21, offset, order)
+                latency.observe((time.perf_counter() - t0) * 1000)
+            stats = latency.stats()
+            snippet = results[0]["snippet"][:60].replace("\n", " ") if results else "-"
+            print(f"  {label:16s} {text!r:22s} p50 {stats['p50_ms']:7.2f}ms  max {stats['max_ms']:7.2f}ms  "
+                  f"{len(results):2d} hits  {snippet}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Event-loop lag while TTS replies are converted for Twilio: inline audioop vs the DSP pool.
+
+Simulates CALLS live calls ticking every 20 ms (one media frame each) and
+measures how late the ticks run while REPLIES long TTS replies (synthetic
+PCM16 24 kHz) are resampled and encoded at the same time. Inline conversion
+blocks every call's frame; on the pool the NumPy kernels run with the GIL
+released. Lag is noisy on a loaded box - compare several runs.
+
+Usage (from backend/):
+    python tests/dsp_loop_lag_benchmark.py
+    python tests/dsp_loop_lag_benchmark.py 20 8 15     # calls, replies, reply seconds
+"""
+import asyncio
+import audioop
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dsp import dsp_pool, encode_for_twilio
+from metrics import Histogram
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+REPLIES = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+REPLY_SECONDS = float(sys.argv[3]) if len(sys.argv) > 3 else 12.0
+
+
+def encode_inline(pcm16_24k):
+    """What process_utterance_and_respond used to do on the event loop."""
+    pcm16_8k, _ = audioop.ratecv(pcm16_24k, 2, 1, 24000, 8000, None)
+    messages = []
+    for i in range(0, len(pcm16_8k), 1600):
+        payload = base64.b64encode(audioop.lin2ulaw(pcm16_8k[i:i + 1600], 2)).decode("utf-8")
+        messages.append(json.dumps({"event": "media", "streamSid": "MZ", "media": {"payload": payload}}))
+    return pcm16_8k, messages
+
+
+async def call_ticks(lag: Histogram, stop: asyncio.Event):
+    next_tick = time.perf_counter()
+    while not stop.is_set():
+        next_tick += 0.020
+        await asyncio.sleep(max(next_tick - time.perf_counter(), 0))
+        lag.observe(max((time.perf_counter() - next_tick) * 1000, 0.0))
+
+
+async def scenario(name, convert, replies):
+    lag = Histogram()
+    stop = asyncio.Event()
+    ticks = [asyncio.create_task(call_ticks(lag, stop)) for _ in range(CALLS)]
+    await asyncio.sleep(0.2)
+    start = time.perf_counter()
+    for pcm in replies:
+        await convert(pcm)
+        await asyncio.sleep(0.05)   # replies arrive a little apart
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.2)
+    stop.set()
+    await asyncio.gather(*ticks)
+    stats = lag.stats()
+    print(f"{name:8s}: frame lag p50 {stats['p50_ms']:6.2f}ms  p99 {stats['p99_ms']:6.2f}ms  "
+          f"max {stats['max_ms']:6.2f}ms  ({stats['count']} ticks, conversions {elapsed:.2f}s)")
+
+
+async def run():
+    rng = np.random.default_rng(0)
+    replies = [(rng.standard_normal(int(24000 * REPLY_SECONDS)) * 3000).astype("<i2").tobytes() for _ in range(REPLIES)]
+    print(f"{CALLS} calls, {REPLIES} replies of {REPLY_SECONDS:.0f}s")
+
+    async def inline(pcm):
+        encode_inline(pcm)
+
+    async def pooled(pcm):
+        await dsp_pool.run("tts_to_twilio", encode_for_twilio, pcm)
+
+    await scenario("inline", inline, replies)
+    await scenario("dsp pool", pooled, replies)
+    print(f"DSP job times: {dsp_pool.stats()['jobs']['tts_to_twilio']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+"""
+Compare single-request TTS against parallel multi-segment TTS.
+
+Synthesizes each sample reply both ways with the live TTS model (same
+emotion and voice-clone reference as calls) and prints the wall-clock times.
+Needs BOSONAI_API_KEY1 in the environment.
+
+Usage (from backend/):
+    python tests/tts_parallel_benchmark.py
+    python tests/tts_parallel_benchmark.py "Some reply. With several sentences."
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import generate_speech_with_emotion
+from tts_segments import TTS_CONCURRENCY, split_sentences, synthesize_segmented
+
+EMOTION = "friendly and professional"
+SAMPLE_REPLIES = [
+    "Thanks for calling BosonAI. I'm the virtual receptionist.",
+    "Thanks for calling BosonAI. The team is in a meeting right now, but I can take a message. "
+    "Could you tell me your name and what this is about?",
+    "I understand this is urgent. I'll connect you to someone on the team right away. "
+    "If nobody picks up, I'll make sure they get your message and call you back today. "
+    "Please stay on the line while I put you through.",
+]
+
+
+async def bench(text):
+    start = time.time()
+    single = await generate_speech_with_emotion(text=text, emotion=EMOTION)
+    single_s = time.time() - start
+
+    start = time.time()
+    parallel = await synthesize_segmented(text, EMOTION, generate_speech_with_emotion)
+    parallel_s = time.time() - start
+
+    segments = len(split_sentences(text))
+    single_audio = len(single.content) / 48000 if single else 0.0
+    parallel_audio = len(parallel.content) / 48000 if parallel else 0.0
+    print(f"{len(text):4d} chars, {segments} segment(s): single {single_s:.2f}s ({single_audio:.1f}s audio) | "
+          f"parallel {parallel_s:.2f}s ({parallel_audio:.1f}s audio{'' if parallel else ', a segment failed'}) | "
+          f"speedup {single_s / parallel_s if parallel_s else 0:.2f}x")
+
+
+async def run(replies):
+    print(f"Concurrency cap: {TTS_CONCURRENCY}")
+    for text in replies:
+        await bench(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(sys.argv[1:] or SAMPLE_REPLIES))
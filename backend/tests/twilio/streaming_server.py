@@ -12,11 +12,15 @@ import json
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
-import numpy as np
 import wave
 import io
+import sys
 from collections import defaultdict, deque
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from vad import EnergyDetector, Endpointer
+
 load_dotenv()
 
 app = FastAPI()
@@ -44,27 +48,19 @@ class AudioBuffer:
         self.sample_rate = sample_rate
         self.silence_threshold = 500
         self.silence_duration = 1.5  # seconds
-        self.silence_chunks = 0
-        self.required_silence_chunks = int((self.silence_duration / 0.02))  # 20ms chunks
-        self.has_speech = False
+        # Shared endpointer from backend/vad.py with a simple energy detector
+        self.endpointer = Endpointer(EnergyDetector(self.silence_threshold, sample_rate), sample_rate=sample_rate,
+                                     end_silence_ms=int(self.silence_duration * 1000))
         
     def add_chunk(self, audio_bytes):
         """Add audio chunk and check if sentence is complete"""
-        self.buffer.extend(audio_bytes)
-        
-        # Simple VAD: check if this chunk has audio
-        audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
-        rms = np.sqrt(np.mean(audio_array**2))
-        
-        if rms < self.silence_threshold:
-            if self.has_speech:
-                self.silence_chunks += 1
-        else:
-            self.has_speech = True
-            self.silence_chunks = 0
+        utterances = self.endpointer.feed(audio_bytes)
+        if utterances:
+            # Buffer holds the utterance from its first speech frame
+            self.buffer = bytearray(utterances[0].pcm16)
         
         # Return True if we've detected end of sentence
-        return self.has_speech and self.silence_chunks >= self.required_silence_chunks
+        return bool(utterances)
     
     def get_audio_wav(self):
         """Convert buffer to WAV format bytes"""
@@ -83,8 +79,7 @@ class AudioBuffer:
     def clear(self):
         """Clear the buffer"""
         self.buffer = bytearray()
-        self.silence_chunks = 0
-        self.has_speech = False
+        self.endpointer.reset()
 
 
 class ConversationState:
@@ -0,0 +1,80 @@
+"""
+Benchmark the shared VAD engine (vad.py).
+
+Feeds the same audio through Endpointer with each detector, once frame by
+frame (how a live Twilio stream arrives) and once in 1 s batches, and prints
+the cost per 20 ms frame and the utterances found. Without arguments a
+synthetic call is used: line noise with bursts of a speech-like harmonic
+signal; pass recordings to benchmark real caller audio instead.
+
+Usage (from backend/):
+    python tests/vad_benchmark.py
+    python tests/vad_benchmark.py recordings/*.wav
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from vad import DETECTORS, Endpointer, make_detector, pcm_rms
+
+FRAME_BYTES = 320
+BATCH_FRAMES = 50
+REPEATS = 3
+
+
+def synthetic_call(seconds=60, seed=0):
+    """Line noise with 1-3 s voiced bursts separated by 1.5-4 s pauses (PCM16 8 kHz)."""
+    rng = np.random.default_rng(seed)
+    total = seconds * 8000
+    audio = rng.normal(0, 80, total)
+    position = 8000
+    while position < total - 8000:
+        length = int(rng.uniform(1, 3) * 8000)
+        t = np.arange(length) / 8000
+        pitch = rng.uniform(100, 220)
+        burst = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 8))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)   # syllable-rate amplitude modulation
+        audio[position:position + length] += 4000 * burst * envelope
+        position += length + int(rng.uniform(1.5, 4) * 8000)
+    return np.clip(audio, -32768, 32767).astype("<i2").tobytes()
+
+
+def caller_audio(paths):
+    from tests.vad_gate_check import caller_channel
+    return b"".join(caller_channel(path) for path in paths)
+
+
+def run(kind, pcm16, batch_frames):
+    """Best-of-REPEATS time per frame (us) and the utterances found."""
+    best = None
+    for _ in range(REPEATS):
+        endpointer = Endpointer(make_detector(kind))
+        step = batch_frames * FRAME_BYTES
+        utterances = []
+        start = time.perf_counter()
+        for i in range(0, len(pcm16), step):
+            for utterance in endpointer.feed(pcm16[i:i + step]):
+                utterances.append((utterance.speech_ms, utterance.silence_ms))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6 / (len(pcm16) // FRAME_BYTES), utterances
+
+
+def main(paths):
+    pcm16 = caller_audio(paths) if paths else synthetic_call()
+    frames = len(pcm16) // FRAME_BYTES
+    print(f"{frames} frames ({frames * 20 / 1000:.1f}s), overall RMS {pcm_rms(np.frombuffer(pcm16, dtype='<i2')):.0f}")
+    print(f"{'detector':<10} {'1 frame/feed':>14} {f'{BATCH_FRAMES} frames/feed':>16}  utterances")
+    for kind in DETECTORS:
+        single_us, utterances = run(kind, pcm16, 1)
+        batch_us, batch_utterances = run(kind, pcm16, BATCH_FRAMES)
+        note = "" if utterances == batch_utterances else " (batching changed endpoints!)"
+        print(f"{kind:<10} {single_us:>11.1f} us {batch_us:>13.1f} us  {len(utterances)}{note}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
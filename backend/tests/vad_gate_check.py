@@ -0,0 +1,72 @@
+"""
+Check the energy pre-gate against plain webrtcvad on recorded calls.
+
+Runs the shared Endpointer over the caller channel of each recording twice -
+once with WebrtcDetector, once with CombinedDetector - and reports how many
+VAD calls the gate avoided and whether the detected utterances are identical.
+
+Usage (from backend/):
+    python tests/vad_gate_check.py recordings/*.wav
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audioop
+
+from database.wav_bytes import read_recording
+from vad import CombinedDetector, Endpointer, WebrtcDetector
+
+VAD_MODE = 2
+FRAME_BYTES = 320
+BATCH_BYTES = 50 * FRAME_BYTES   # feed in 1s batches
+
+
+def endpoints(endpointer, pcm16):
+    """Run the shared endpointer over pcm16. Returns [(batch_start_frame, utterance_frames, speech_ms)]."""
+    result = []
+    for i in range(0, len(pcm16), BATCH_BYTES):
+        for utterance in endpointer.feed(pcm16[i:i + BATCH_BYTES]):
+            result.append((i // FRAME_BYTES, len(utterance.pcm16) // FRAME_BYTES, utterance.speech_ms))
+    return result
+
+
+def caller_channel(path):
+    pcm16, nchannels, framerate = read_recording(path)
+    if nchannels == 2:
+        pcm16 = audioop.tomono(pcm16, 2, 1, 0)  # Left = caller
+    if framerate != 8000:
+        pcm16, _ = audioop.ratecv(pcm16, 2, 1, framerate, 8000, None)
+    return pcm16[:len(pcm16) // FRAME_BYTES * FRAME_BYTES]
+
+
+def check(path):
+    pcm16 = caller_channel(path)
+
+    start = time.perf_counter()
+    plain = endpoints(Endpointer(WebrtcDetector(VAD_MODE)), pcm16)
+    plain_s = time.perf_counter() - start
+
+    gate = CombinedDetector(VAD_MODE)
+    start = time.perf_counter()
+    gated = endpoints(Endpointer(gate), pcm16)
+    gated_s = time.perf_counter() - start
+
+    same = plain == gated
+    stats = gate.stats()
+    print(f"{path}: {len(pcm16) // FRAME_BYTES} frames, {stats['vad_skipped']} VAD calls avoided ({stats['skipped_pct']}%), "
+          f"{plain_s * 1000:.1f}ms -> {gated_s * 1000:.1f}ms, endpoints {'identical' if same else 'DIFFER'}")
+    if not same:
+        print(f"  plain: {plain}")
+        print(f"  gated: {gated}")
+    return same
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    results = [check(path) for path in sys.argv[1:]]
+    sys.exit(0 if all(results) else 1)
@@ -2,6 +2,9 @@
 Voice Activity Detection (VAD) - Records from microphone until silence is detected
 Automatically stops recording at the end of a sentence/pause
 """
+import os
+import sys
+
 import sounddevice as sd
 import soundfile as sf
 import numpy as np
@@ -9,6 +12,10 @@ import wave
 from collections import deque
 import time
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vad import EnergyDetector, Endpointer, pcm_rms
+
 # Audio settings
 SAMPLE_RATE = 16000  # 16kHz is good for speech
 CHANNELS = 1
@@ -35,9 +42,9 @@ class VoiceActivityDetector:
         # Buffer to store audio chunks
         self.audio_buffer = []
         
-        # Track silence duration
-        self.silence_chunks = 0
-        self.required_silence_chunks = int(silence_duration / chunk_duration)
+        # Shared endpointer (backend/vad.py) with an energy detector; the mic's max_duration limits length
+        self.endpointer = Endpointer(EnergyDetector(silence_threshold, sample_rate), sample_rate=sample_rate,
+                                     end_silence_ms=int(silence_duration * 1000), max_utterance_ms=10 ** 9)
         
         # Track if we've detected speech
         self.speech_detected = False
@@ -45,32 +52,22 @@ class VoiceActivityDetector:
         
     def is_silence(self, audio_chunk):
         """Check if audio chunk is silence"""
-        # Calculate RMS (Root Mean Square) amplitude
-        rms = np.sqrt(np.mean(audio_chunk**2))
-        return rms < self.silence_threshold
+        # RMS (Root Mean Square) amplitude, computed without int16 overflow
+        return pcm_rms(audio_chunk) < self.silence_threshold
     
     def process_chunk(self, audio_chunk):
         """Process incoming audio chunk"""
         # Store the chunk
         self.audio_buffer.append(audio_chunk.copy())
         
-        if self.is_silence(audio_chunk):
-            # If we've detected speech before, count silence
-            if self.speech_detected:
-                self.silence_chunks += 1
-                
-                # Check if we've had enough silence
-                if self.silence_chunks >= self.required_silence_chunks:
-                    print("🛑 End of sentence detected!")
-                    self.is_recording = False
-                    return False
-            # else: still waiting for speech to start
-        else:
-            # Speech detected
-            if not self.speech_detected:
-                print("🎤 Speech detected, recording...")
+        if self.endpointer.feed(np.ascontiguousarray(audio_chunk, dtype=np.int16).tobytes()):
+            print("🛑 End of sentence detected!")
+            self.is_recording = False
+            return False
+        
+        if self.endpointer.in_speech and not self.speech_detected:
+            print("🎤 Speech detected, recording...")
             self.speech_detected = True
-            self.silence_chunks = 0
         
         return True
     
@@ -179,7 +176,7 @@ def calibrate_microphone():
     sd.wait()
     
     # Calculate average amplitude
-    rms = np.sqrt(np.mean(audio**2))
+    rms = pcm_rms(audio)
     suggested_threshold = rms * 3  # 3x the noise floor
     
     print(f"Ambient noise level: {rms:.2f}")
@@ -192,7 +189,7 @@ def calibrate_microphone():
                    dtype=DTYPE)
     sd.wait()
     
-    speech_rms = np.sqrt(np.mean(audio**2))
+    speech_rms = pcm_rms(audio)
     print(f"Speech level: {speech_rms:.2f}")
     
     if speech_rms > suggested_threshold:
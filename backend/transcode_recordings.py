@@ -0,0 +1,59 @@
+"""
+Transcode existing call recordings to a compressed storage format.
+
+Usage:
+    python transcode_recordings.py [--format mulaw|flac|pcm] [--dir recordings] [--keep-source]
+"""
+import argparse
+import os
+import time
+
+from call_catalog import CallCatalog
+from database.wav_bytes import RECORDING_FORMATS, transcode_recording
+from storage import find_call_files
+
+
+def transcode_directory(directory, fmt, remove_source=True, catalog=None):
+    """
+    Transcode every call recording in directory to fmt, pointing the call
+    catalog (if given) at the new files.
+
+    Returns:
+        tuple: (files converted, bytes before, bytes after)
+    """
+    converted = 0
+    bytes_before = 0
+    bytes_after = 0
+    paths = sorted(find_call_files(directory, "call_*.wav") + find_call_files(directory, "call_*.flac"))
+    for path in paths:
+        size_before = os.path.getsize(path)
+        try:
+            new_path = transcode_recording(path, fmt, remove_source=remove_source)
+        except Exception as e:
+            print(f"⚠️ Skipping {path}: {e}")
+            continue
+        if new_path is None:
+            continue  # Already in the requested format
+        converted += 1
+        if catalog:
+            catalog.set_recording_path(path, new_path)
+        bytes_before += size_before
+        bytes_after += os.path.getsize(new_path)
+        print(f"✅ {path} -> {new_path} ({size_before} -> {os.path.getsize(new_path)} bytes)")
+    return converted, bytes_before, bytes_after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode call recordings to a compressed format")
+    parser.add_argument("--format", choices=RECORDING_FORMATS, default="mulaw")
+    parser.add_argument("--dir", default="recordings")
+    parser.add_argument("--keep-source", action="store_true", help="Keep the original files")
+    args = parser.parse_args()
+
+    start = time.time()
+    catalog = CallCatalog()
+    converted, before, after = transcode_directory(args.dir, args.format, remove_source=not args.keep_source, catalog=catalog)
+    catalog.close()
+    ratio = before / after if after else 0
+    print(f"Transcoded {converted} recording(s) in {time.time() - start:.1f}s: "
+          f"{before} -> {after} bytes ({ratio:.2f}x smaller)")
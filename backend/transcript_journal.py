@@ -0,0 +1,282 @@
+"""
+Append-only call transcripts.
+
+While a call is live each turn is appended as one JSON line to
+transcripts/YYYY/MM/DD/<CallSid>/transcript_<CallSid>_<start>.jsonl (see
+storage.py for the layout) - a "call" header record, then
+one "turn" record per caller or bot entry. Nothing already written is
+rewritten, so a turn costs the same at the end of a long call as at the
+start. When the call ends finalize() writes the consolidated
+transcript_<CallSid>_<start>.json in the same format as before and closes the
+journal with an "end" record.
+
+All file work (serializing, appending, the atomic JSON replace) happens on a
+writer thread behind a queue; the event loop only enqueues dicts. The
+human-readable TXT version is no longer stored - render_txt() builds it from
+the transcript on request.
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+from datetime import datetime
+
+from storage import atomic_write_json, call_file
+
+TRANSCRIPTS_DIR = "transcripts"
+JOURNAL_FLUSH_BATCH = 64    # queued records written per flush of the open journals
+TRANSCRIPTION_UNAVAILABLE = "[Transcription not available]"
+
+
+def transcript_path(call_sid: str, call_start_time: datetime, ext: str = ".json", directory: str = TRANSCRIPTS_DIR) -> str:
+    return call_file(directory, "transcript_", call_sid, call_start_time, ext)
+
+
+def transcript_entry(entry: dict) -> dict:
+    """A conversation_log entry in the transcript format."""
+    if entry['speaker'] == 'Caller':
+        return {
+            "speaker": "Caller",
+            "duration_ms": entry.get('duration_ms', 0),
+            "audio_size_bytes": entry.get('audio_size', 0),
+            "text": entry.get('text') or TRANSCRIPTION_UNAVAILABLE,
+            "emojis": entry.get('emojis', []),
+            "detected_emotion": entry.get('detected_emotion', '')
+        }
+    return {
+        "speaker": "AI Receptionist",
+        "text": entry.get('text', ''),
+        "timestamp": entry.get('timestamp', ''),
+        "emotion_used": entry.get('emotion_used', '')
+    }
+
+
+def build_transcript(call_sid: str, from_number: str, conversation: list, call_start_time: datetime,
+                     call_end_time: datetime, final_action: str = None, call_in_progress: bool = False) -> dict:
+    """Transcript dict from transcript-format entries."""
+    return {
+        "call_sid": call_sid,
+        "from_number": from_number,
+        "start_time": call_start_time.isoformat(),
+        "end_time": call_end_time.isoformat(),
+        "duration_seconds": round((call_end_time - call_start_time).total_seconds(), 2),
+        "call_in_progress": call_in_progress,  # True if call is still active
+        "final_action": final_action,  # "FORWARD", "END", "VOICEMAIL" or None
+        "conversation": conversation
+    }
+
+
+def awaiting_transcription(transcript: dict) -> bool:
+    """Whether this is a voicemail whose deferred transcription hasn't filled in the caller's text yet."""
+    return transcript.get("final_action") == "VOICEMAIL" and any(
+        entry.get("speaker") == "Caller" and entry.get("text") == TRANSCRIPTION_UNAVAILABLE
+        for entry in transcript.get("conversation", []))
+
+
+def transcript_caller_name(conversation: list) -> str:
+    """Caller's name from the first caller entry that states it ("this is ...", "... calling"), else "Unknown Caller"."""
+    patterns = [
+        r"(?:this is|it's|i'm|my name is)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)",
+        r"([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+(?:calling|here)",
+    ]
+    for entry in conversation:
+        if entry.get('speaker') == 'Caller' and entry.get('text'):
+            for pattern in patterns:
+                match = re.search(pattern, entry['text'], re.IGNORECASE)
+                if match:
+                    name = match.group(1).strip()
+                    if len(name) > 2:
+                        return name
+    return "Unknown Caller"
+
+
+def transcript_hash(conversation: list) -> str:
+    """Content hash of a transcript's conversation (what a stored summary was made from)."""
+    return hashlib.sha1(json.dumps(conversation, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def read_journal(path: str) -> dict:
+    """Rebuild a transcript from a journal (a live call, or one that never got finalized)."""
+    header, conversation, end = {}, [], None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+            kind = record.pop("type", None)
+            if kind == "call":
+                header = record
+            elif kind == "turn":
+                conversation.append(record)
+            elif kind == "end":
+                end = record
+    start_time = datetime.fromisoformat(header["start_time"]) if header.get("start_time") else datetime.fromtimestamp(os.path.getctime(path))
+    end_time = datetime.fromisoformat(end["end_time"]) if end else datetime.fromtimestamp(os.path.getmtime(path))
+    return build_transcript(header.get("call_sid"), header.get("from_number"), conversation, start_time, end_time,
+                            end.get("final_action") if end else None, call_in_progress=end is None)
+
+
+def load_transcript(path: str) -> dict:
+    if path.endswith(".json") and not os.path.exists(path) and os.path.exists(path + "l"):
+        path += "l"   # the writer thread hasn't written the final JSON yet
+    if path.endswith(".jsonl"):
+        return read_journal(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def render_txt(transcript: dict) -> str:
+    """Human-readable version of a transcript."""
+    start_time = datetime.fromisoformat(transcript['start_time'])
+    end_time = datetime.fromisoformat(transcript['end_time'])
+    lines = [
+        "CALL TRANSCRIPT",
+        "=" * 60,
+        f"Call ID: {transcript['call_sid']}",
+        f"From: {transcript['from_number']}",
+        f"Start: {start_time.strftime('%Y-%m-%d %H:%M:%S')}",
+        f"End: {end_time.strftime('%Y-%m-%d %H:%M:%S')}",
+        f"Duration: {transcript['duration_seconds']:.1f} seconds",
+    ]
+    if transcript.get('call_in_progress'):
+        lines.append("Status: CALL IN PROGRESS (transcript updating in real-time)")
+    final_action = transcript.get('final_action')
+    if final_action:
+        action_text = {"FORWARD": "Forwarded to BosonAI", "VOICEMAIL": "Voicemail (taken while at capacity)"}.get(final_action, "Ended (Spam Detected)")
+        lines.append(f"Result: {action_text}")
+    lines += ["=" * 60, ""]
+
+    for i, entry in enumerate(transcript.get('conversation', []), 1):
+        if entry['speaker'] == 'Caller':
+            caller_text = entry.get('text')
+            if caller_text and caller_text != TRANSCRIPTION_UNAVAILABLE:
+                emojis = entry.get('emojis', [])
+                detected_emotion = entry.get('detected_emotion', '')
+                emoji_str = f" {' '.join(emojis)}" if emojis else ""
+                emotion_str = f" [Emotion: {detected_emotion}]" if detected_emotion else ""
+                lines.append(f"[{i}] CALLER{emoji_str}: {caller_text}{emotion_str}\n")
+            else:
+                lines.append(f"[{i}] CALLER: [Spoke for {entry.get('duration_ms', 0)}ms - transcription unavailable]\n")
+        else:
+            emotion_used = entry.get('emotion_used', '')
+            emotion_str = f" [Responded with: {emotion_used}]" if emotion_used else ""
+            lines.append(f"[{i}] AI RECEPTIONIST{emotion_str}: {entry.get('text', '')}\n")
+    return "\n".join(lines) + "\n"
+
+
+class TranscriptJournal:
+    """Per-call JSONL journals and final JSON transcripts, written by one background thread."""
+
+    def __init__(self, directory: str = TRANSCRIPTS_DIR, log=print):
+        self.directory = directory
+        self.log = log
+        self._queue = queue.Queue()
+        self._journals = {}          # call_sid -> journal path (calls opened and not yet finalized)
+        self._thread = None
+        self.records_written = 0
+        self.transcripts_written = 0
+        self.write_errors = 0
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+            self._thread.start()
+
+    def open(self, call_sid: str, from_number: str, call_start_time: datetime):
+        """Start the call's journal with a header record."""
+        path = transcript_path(call_sid, call_start_time, ".jsonl", self.directory)
+        self._journals[call_sid] = path
+        self._put(("append", path, {"type": "call", "call_sid": call_sid, "from_number": from_number,
+                                    "start_time": call_start_time.isoformat()}))
+
+    def append(self, call_sid: str, entry: dict):
+        """Journal one conversation_log entry."""
+        path = self._journals.get(call_sid)
+        if path:
+            self._put(("append", path, {"type": "turn", **transcript_entry(entry)}))
+
+    def finalize(self, call_sid: str, from_number: str, conversation_log: list, call_start_time: datetime,
+                 call_end_time: datetime, final_action: str = None) -> dict:
+        """
+        Write the consolidated JSON transcript and close the journal. May be
+        called again to update it (deferred voicemail text).
+
+        Returns:
+            dict: the transcript being written
+        """
+        transcript = build_transcript(call_sid, from_number, [transcript_entry(entry) for entry in conversation_log],
+                                      call_start_time, call_end_time, final_action)
+        path = self._journals.pop(call_sid, None)
+        if path:
+            self._put(("append", path, {"type": "end", "end_time": call_end_time.isoformat(), "final_action": final_action}))
+            self._put(("close", path, None))
+        self._put(("json", transcript_path(call_sid, call_start_time, ".json", self.directory), transcript))
+        return transcript
+
+    def close(self, timeout: float = 5.0):
+        """Flush everything queued and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _put(self, job):
+        self.start()
+        self._queue.put(job)
+
+    def _run(self):
+        files = {}
+        running = True
+        while running:
+            jobs = [self._queue.get()]
+            while len(jobs) < JOURNAL_FLUSH_BATCH:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            dirty = set()
+            for job in jobs:
+                if job is None:
+                    running = False
+                    continue
+                op, path, data = job
+                try:
+                    if op == "append":
+                        if path not in files:
+                            os.makedirs(os.path.dirname(path), exist_ok=True)
+                            files[path] = open(path, 'a', encoding='utf-8')
+                        files[path].write(json.dumps(data, ensure_ascii=False) + "\n")
+                        dirty.add(path)
+                        self.records_written += 1
+                    elif op == "close":
+                        f = files.pop(path, None)
+                        if f:
+                            f.close()
+                        dirty.discard(path)
+                    elif op == "json":
+                        atomic_write_json(path, data)
+                        self.transcripts_written += 1
+                        self.log(f"💾 Transcript saved: {path}")
+                except Exception as e:
+                    self.write_errors += 1
+                    self.log(f"Error writing transcript {path}: {e}")
+            for path in dirty:
+                files[path].flush()
+        for f in files.values():
+            f.close()
+
+    def stats(self) -> dict:
+        return {
+            "open_journals": len(self._journals),
+            "queued": self._queue.qsize(),
+            "records_written": self.records_written,
+            "transcripts_written": self.transcripts_written,
+            "write_errors": self.write_errors,
+        }
+
+
+journal = TranscriptJournal()
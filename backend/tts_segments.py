@@ -0,0 +1,113 @@
+"""
+Parallel multi-segment TTS.
+
+Long replies are split at sentence boundaries, each segment is synthesized
+concurrently (capped by a semaphore) with the same emotion and voice, and the
+PCM is joined back in order with a short crossfade at each seam. Synthesis
+time then follows the longest segment instead of the whole reply. A failed
+segment is retried on its own; if it still fails, no audio is returned and the
+caller falls back to one request for the whole reply (partial audio would drop
+a sentence the transcript still records).
+"""
+import asyncio
+import os
+import re
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from dsp import dsp_pool
+
+TTS_PARALLEL = os.getenv("TTS_PARALLEL", "1") == "1"             # split replies and synthesize segments concurrently
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "3"))         # segments in flight at once (per reply)
+TTS_MIN_SEGMENT_CHARS = 40   # shorter sentences are merged with the next (tiny segments sound clipped)
+TTS_MAX_SEGMENTS = 6         # longer replies merge sentences to stay under this
+TTS_CROSSFADE_MS = 15        # overlap at each seam
+TTS_SEGMENT_RETRIES = 1      # extra attempts for a failed segment
+TTS_SAMPLE_RATE = 24000      # PCM16 rate returned by the TTS model
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class SegmentedSpeech:
+    content: bytes                      # joined PCM16 (same shape as generate_speech_with_emotion's .content)
+    segments: int
+    wall_s: float                       # wall-clock synthesis time
+    segment_s: list = field(default_factory=list)   # per-segment synthesis time (their sum ~ sequential cost)
+
+
+def split_sentences(text: str, min_chars: int = TTS_MIN_SEGMENT_CHARS, max_segments: int = TTS_MAX_SEGMENTS) -> list:
+    """Split text at sentence ends, merging short pieces so no segment is tiny."""
+    pieces = [piece.strip() for piece in _SENTENCE_END.split(text.strip()) if piece.strip()]
+    segments = []
+    for piece in pieces:
+        if segments and len(segments[-1]) < min_chars:
+            segments[-1] = f"{segments[-1]} {piece}"
+        else:
+            segments.append(piece)
+    if len(segments) > 1 and len(segments[-1]) < min_chars:
+        tail = segments.pop()
+        segments[-1] = f"{segments[-1]} {tail}"
+    while len(segments) > max_segments:
+        # Merge the shortest adjacent pair
+        i = min(range(len(segments) - 1), key=lambda k: len(segments[k]) + len(segments[k + 1]))
+        segments[i:i + 2] = [f"{segments[i]} {segments[i + 1]}"]
+    return segments
+
+
+def crossfade_join(chunks: list, sample_rate: int = TTS_SAMPLE_RATE, fade_ms: int = TTS_CROSSFADE_MS) -> bytes:
+    """Concatenate PCM16 mono chunks with a linear crossfade of fade_ms at each seam."""
+    arrays = [np.frombuffer(chunk, dtype="<i2").astype(np.float32) for chunk in chunks if chunk]
+    if not arrays:
+        return b""
+    fade = sample_rate * fade_ms // 1000
+    out = arrays[0]
+    for nxt in arrays[1:]:
+        n = min(fade, len(out), len(nxt))
+        if n:
+            ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)
+            seam = out[-n:] * (1 - ramp) + nxt[:n] * ramp
+            out = np.concatenate([out[:-n], seam, nxt[n:]])
+        else:
+            out = np.concatenate([out, nxt])
+    return np.clip(out, -32768, 32767).astype("<i2").tobytes()
+
+
+async def synthesize_segmented(text: str, emotion: str, synthesize, concurrency: int = TTS_CONCURRENCY):
+    """
+    Synthesize text segment by segment, concurrently. synthesize(text=, emotion=)
+    is the single-request TTS coroutine (returns an object with .content, or None).
+
+    Returns:
+        SegmentedSpeech, or None if any segment failed after its retries
+    """
+    segments = split_sentences(text)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    segment_s = [0.0] * len(segments)
+
+    async def run(i: int, segment: str):
+        async with semaphore:
+            start = time.time()
+            try:
+                for _ in range(1 + TTS_SEGMENT_RETRIES):
+                    response = await synthesize(text=segment, emotion=emotion)
+                    if response and response.content:
+                        return response.content
+                return None
+            finally:
+                segment_s[i] = time.time() - start
+
+    start = time.time()
+    pcm_chunks = await asyncio.gather(*(run(i, segment) for i, segment in enumerate(segments)))
+    wall_s = time.time() - start
+
+    if not all(pcm_chunks):
+        return None
+    return SegmentedSpeech(
+        content=await dsp_pool.run("crossfade_join", crossfade_join, pcm_chunks),
+        segments=len(segments),
+        wall_s=wall_s,
+        segment_s=segment_s,
+    )
@@ -0,0 +1,154 @@
+"""
+Voice-clone TTS request template.
+
+A cloned-voice request always carries the same system prompt skeleton,
+reference transcript and reference audio (hundreds of KB of base64); only the
+emotion and the text to speak change. CloneRequestTemplate serializes the
+static JSON once and splices the two per-request strings into it, so a
+request body is a few small json.dumps calls plus one bytes join.
+
+The reference WAV is also slimmed down once at load time: mono, leading and
+trailing silence trimmed, downsampled and capped in length.
+"""
+import audioop
+import io
+import json
+import os
+import wave
+
+import httpx
+
+VOICE_CLONE_SAMPLE_RATE = int(os.getenv("VOICE_CLONE_SAMPLE_RATE", "16000"))  # 0 keeps the file's rate
+VOICE_CLONE_MAX_SECONDS = float(os.getenv("VOICE_CLONE_MAX_SECONDS", "15"))
+TRIM_FRAME_MS = 10
+TRIM_THRESHOLD = 0.02        # frames below this fraction of the peak level count as silence
+TRIM_PAD_MS = 100            # silence kept at each end
+# Everything optimize_reference_wav's output depends on besides the source file (cache key of the built reference)
+REFERENCE_BUILD_PARAMS = (f"rate={VOICE_CLONE_SAMPLE_RATE}|max_s={VOICE_CLONE_MAX_SECONDS}|frame={TRIM_FRAME_MS}"
+                          f"|threshold={TRIM_THRESHOLD}|pad={TRIM_PAD_MS}")
+
+
+def optimize_reference_wav(wav_bytes: bytes) -> tuple[bytes, dict]:
+    """
+    Mono, trimmed, downsampled, length-capped PCM16 WAV for the voice-clone reference.
+
+    Returns:
+        tuple: (wav bytes, info dict with before/after sizes and durations)
+    """
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+        nchannels, sampwidth, rate = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    original_seconds = len(frames) / (nchannels * sampwidth * rate)
+
+    if sampwidth != 2:
+        if sampwidth == 1:
+            frames = audioop.bias(frames, 1, -128)  # 8-bit WAV is unsigned
+        frames = audioop.lin2lin(frames, sampwidth, 2)
+    if nchannels == 2:
+        frames = audioop.tomono(frames, 2, 0.5, 0.5)
+    elif nchannels > 2:
+        raise ValueError(f"Unsupported reference WAV with {nchannels} channels")
+
+    # Trim leading/trailing silence relative to the loudest frame
+    frame_bytes = rate * TRIM_FRAME_MS // 1000 * 2
+    levels = [audioop.rms(frames[i:i + frame_bytes], 2) for i in range(0, len(frames), frame_bytes)]
+    if levels and max(levels):
+        threshold = max(levels) * TRIM_THRESHOLD
+        voiced = [i for i, level in enumerate(levels) if level > threshold]
+        pad = TRIM_PAD_MS // TRIM_FRAME_MS
+        first = max(voiced[0] - pad, 0)
+        last = min(voiced[-1] + pad + 1, len(levels))
+        frames = frames[first * frame_bytes:last * frame_bytes]
+
+    if VOICE_CLONE_SAMPLE_RATE and VOICE_CLONE_SAMPLE_RATE < rate:
+        frames, _ = audioop.ratecv(frames, 2, 1, rate, VOICE_CLONE_SAMPLE_RATE, None)
+        rate = VOICE_CLONE_SAMPLE_RATE
+
+    max_bytes = int(VOICE_CLONE_MAX_SECONDS * rate) * 2
+    capped = len(frames) > max_bytes
+    frames = frames[:max_bytes]
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(frames)
+    optimized = out.getvalue()
+    return optimized, {
+        "original_bytes": len(wav_bytes),
+        "optimized_bytes": len(optimized),
+        "original_seconds": round(original_seconds, 2),
+        "optimized_seconds": round(len(frames) / (2 * rate), 2),
+        "sample_rate": rate,
+        "capped": capped,
+    }
+
+
+class CloneRequestTemplate:
+    """
+    Pre-serialized chat.completions body for cloned-voice TTS.
+
+    The system prompt is system_head + emotion + system_tail; the final user
+    message is speaker_tag + " " + text. Everything else is serialized once.
+    """
+
+    def __init__(self, model: str, system_head: str, system_tail: str, transcript: str,
+                 audio_b64: str, speaker_tag: str, params: dict):
+        self.system_head = system_head
+        self.system_tail = system_tail
+        self.speaker_tag = speaker_tag
+        marker_system, marker_text = "\x00SYSTEM\x00", "\x00TEXT\x00"
+        body = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": marker_system},
+                # Reference transcript for the cloned voice
+                {"role": "user", "content": transcript},
+                # Reference audio as assistant content
+                {"role": "assistant", "content": [{
+                    "type": "input_audio",
+                    "input_audio": {"data": audio_b64, "format": "wav"},
+                }]},
+                # Actual text we want spoken, in the same speaker's voice
+                {"role": "user", "content": marker_text},
+            ],
+            **params,
+        }
+        serialized = json.dumps(body)
+        system_json, text_json = json.dumps(marker_system), json.dumps(marker_text)
+        head, rest = serialized.split(system_json)
+        middle, tail = rest.split(text_json)
+        self._head, self._middle, self._tail = head.encode(), middle.encode(), tail.encode()
+        self.static_bytes = len(self._head) + len(self._middle) + len(self._tail)
+
+    def body(self, text: str, emotion: str) -> bytes:
+        """Request body with the emotion and text spliced in."""
+        system = json.dumps(f"{self.system_head}{emotion}{self.system_tail}").encode()
+        spoken = json.dumps(f"{self.speaker_tag} {text}").encode()
+        return b"".join((self._head, system, self._middle, spoken, self._tail))
+
+
+_http_client = None
+
+
+async def post_chat_completion(body: bytes, api_key: str, base_url: str, timeout: float) -> dict:
+    """POST a pre-serialized chat.completions body on a shared keep-alive client. Returns the JSON response."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=timeout)
+    response = await _http_client.post(
+        f"{base_url}/chat/completions",
+        content=body,
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def close_http_client():
+    """Close the shared client (it is reopened on the next request)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,214 @@
+"""
+Multi-worker support: several uvicorn worker processes serving calls on one box.
+
+uvicorn forks WEB_CONCURRENCY worker processes that share the listening
+socket, so a call's media stream and the Twilio webhooks about it can land on
+different workers. WorkerRegistry is the cross-process view, kept in a local
+SQLite file (WAL mode, so readers don't block the writer):
+
+    workers  pid, heartbeat                  - live worker processes
+    calls    call_sid -> owning worker pid, state, timings
+    events   webhook payloads waiting for the owning worker
+
+A worker that receives a webhook for a call it doesn't own queues it in
+`events`; the owner picks it up on its next sync tick (EVENT_POLL_SECONDS).
+The sync tick also publishes local call states and the worker heartbeat, so
+the event loop touches SQLite once per tick, from a thread.
+
+Read-only assets that are expensive to build (the trimmed voice-clone
+reference) go through load_shared_asset: the first process builds the file,
+the others read it.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))                       # uvicorn worker processes
+WORKER_DB_PATH = os.getenv("WORKER_DB_PATH", "run/workers.sqlite")
+SHARED_ASSETS_DIR = os.getenv("SHARED_ASSETS_DIR", "prompt-cache/assets")
+EVENT_POLL_SECONDS = 0.25    # sync tick: heartbeat, call states, queued webhook events
+WORKER_STALE_SECONDS = 10    # workers silent this long are considered dead (their calls are dropped)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS calls (
+    call_sid TEXT PRIMARY KEY,
+    worker_pid INTEGER NOT NULL,
+    stream_sid TEXT,
+    from_number TEXT,
+    state TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    snapshot TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    call_sid TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_call_sid ON events (call_sid);
+"""
+
+
+class WorkerRegistry:
+    """This process's handle on the shared SQLite registry. Methods block - call them off the event loop."""
+
+    def __init__(self, path: str = WORKER_DB_PATH):
+        self.path = path
+        self.pid = os.getpid()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # registry is rebuilt by live workers; durability isn't needed
+        self._conn.executescript(SCHEMA)
+        self.events_routed = 0
+        self.events_received = 0
+
+    def _write(self, *statements):
+        """Run (sql, params) statements in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def register_worker(self):
+        now = time.time()
+        self._write(("INSERT OR REPLACE INTO workers (pid, started_at, heartbeat) VALUES (?, ?, ?)", (self.pid, now, now)))
+
+    def unregister_worker(self):
+        self._write(
+            ("DELETE FROM calls WHERE worker_pid = ?", (self.pid,)),
+            ("DELETE FROM workers WHERE pid = ?", (self.pid,)),
+        )
+
+    def claim_call(self, call_sid: str, stream_sid: str, from_number: str, state: str):
+        now = time.time()
+        self._write(("INSERT OR REPLACE INTO calls (call_sid, worker_pid, stream_sid, from_number, state, started_at, updated_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", (call_sid, self.pid, stream_sid, from_number, state, now, now)))
+
+    def release_call(self, call_sid: str):
+        self._write(
+            ("DELETE FROM calls WHERE call_sid = ? AND worker_pid = ?", (call_sid, self.pid)),
+            ("DELETE FROM events WHERE call_sid = ?", (call_sid,)),
+        )
+
+    def owner(self, call_sid: str):
+        """pid of the worker streaming call_sid, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT worker_pid FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+        return row[0] if row else None
+
+    def live_calls(self) -> set:
+        """call_sids claimed by workers that are still heartbeating."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT call_sid FROM calls WHERE worker_pid IN (SELECT pid FROM workers WHERE heartbeat >= ?)",
+                (time.time() - WORKER_STALE_SECONDS,)).fetchall()
+        return {row[0] for row in rows}
+
+    def live_pids(self) -> set:
+        """pids of the workers that are still heartbeating."""
+        with self._lock:
+            rows = self._conn.execute("SELECT pid FROM workers WHERE heartbeat >= ?",
+                                      (time.time() - WORKER_STALE_SECONDS,)).fetchall()
+        return {row[0] for row in rows}
+
+    def post_event(self, call_sid: str, kind: str, payload: dict):
+        """Queue a webhook payload for whichever worker owns (or will own) call_sid."""
+        self._write(("INSERT INTO events (call_sid, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                     (call_sid, kind, json.dumps(payload), time.time())))
+        self.events_routed += 1
+
+    def sync(self, snapshots: list) -> list:
+        """
+        One sync tick: heartbeat, publish this worker's call snapshots, drop dead
+        workers, and take the events queued for calls owned here.
+
+        Returns:
+            list: (call_sid, kind, payload dict) in arrival order
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("UPDATE workers SET heartbeat = ? WHERE pid = ?", (now, self.pid))
+                conn.executemany(
+                    "UPDATE calls SET state = ?, updated_at = ?, snapshot = ? WHERE call_sid = ? AND worker_pid = ?",
+                    [(snap["state"], now, json.dumps(snap), snap["call_sid"], self.pid) for snap in snapshots],
+                )
+                stale = now - WORKER_STALE_SECONDS
+                conn.execute("DELETE FROM calls WHERE worker_pid IN (SELECT pid FROM workers WHERE heartbeat < ?)", (stale,))
+                conn.execute("DELETE FROM workers WHERE heartbeat < ?", (stale,))
+                conn.execute("DELETE FROM events WHERE created_at < ? AND call_sid NOT IN (SELECT call_sid FROM calls)", (stale,))
+                rows = conn.execute(
+                    "SELECT id, call_sid, kind, payload FROM events "
+                    "WHERE call_sid IN (SELECT call_sid FROM calls WHERE worker_pid = ?) ORDER BY id", (self.pid,)
+                ).fetchall()
+                if rows:
+                    conn.execute(f"DELETE FROM events WHERE id IN ({','.join('?' * len(rows))})", [row[0] for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self.events_received += len(rows)
+        return [(call_sid, kind, json.loads(payload)) for _, call_sid, kind, payload in rows]
+
+    def snapshot(self) -> dict:
+        """Calls and workers across all processes (admin endpoint)."""
+        with self._lock:
+            workers = self._conn.execute("SELECT pid, started_at, heartbeat FROM workers ORDER BY pid").fetchall()
+            calls = self._conn.execute("SELECT call_sid, worker_pid, state, snapshot FROM calls ORDER BY started_at").fetchall()
+            queued = self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        now = time.time()
+        return {
+            "workers": [{"pid": pid, "uptime_s": round(now - started, 1), "heartbeat_age_s": round(now - beat, 2),
+                         "calls": sum(1 for call in calls if call[1] == pid)} for pid, started, beat in workers],
+            "calls": [dict(json.loads(snap) if snap else {"call_sid": sid, "state": state}, worker_pid=pid)
+                      for sid, pid, state, snap in calls],
+            "queued_events": queued,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def load_shared_asset(name: str, source_path: str, build, params: str = "") -> bytes:
+    """
+    Return build(source bytes), computed once per source file version and shared
+    through SHARED_ASSETS_DIR. The cached file is keyed by the source's size and
+    mtime plus params (the settings build depends on) and written atomically, so
+    concurrent workers never read a partial file.
+    """
+    st = os.stat(source_path)
+    stamp = hashlib.sha1(f"{os.path.abspath(source_path)}|{st.st_size}|{st.st_mtime_ns}|{params}".encode()).hexdigest()[:12]
+    path = os.path.join(SHARED_ASSETS_DIR, f"{name}-{stamp}")
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    with open(source_path, "rb") as f:
+        data = build(f.read())
+    os.makedirs(SHARED_ASSETS_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return data